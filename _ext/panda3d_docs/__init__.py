@@ -0,0 +1,29 @@
+"""Sphinx extension with the hooks of the Panda3D manual.  conf.py loads it from
+the _ext directory, after the other extensions."""
+
+from . import autosummary, docstrings, inheritance, pages, profiling, redirects
+from . import references, search, symbols
+
+__version__ = '1.0'
+
+
+def setup(app):
+    profiling.setup(app)
+    docstrings.setup(app)
+    references.setup(app)
+    inheritance.setup(app)
+    search.setup(app)
+
+    # The redirect stubs are pages too, so these need to be written out before
+    # the page map is.
+    redirects.setup(app)
+    pages.setup(app)
+
+    autosummary.setup(app)
+    symbols.setup(app)
+
+    return {
+        'version': __version__,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
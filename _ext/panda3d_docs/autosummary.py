@@ -0,0 +1,261 @@
+"""Caches the stubs that autosummary generates for the API reference between
+builds, and renders the missing ones in parallel."""
+
+import functools
+import hashlib
+import os
+import pickle
+import sys
+
+from sphinx.util import logging
+
+from . import options
+from .profiling import connect_hook
+from .util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# Maps the name and template of each autosummary stub to its rendered content.
+# It is persisted between builds, and is only valid for the installed Panda3D
+# build, the templates and the version of this extension it was rendered with,
+# see get_autosummary_stub_stamp.
+# Sphinx already leaves stubs whose content hasn't changed alone, so that they
+# aren't read again, but rendering them involves importing and inspecting every
+# member of the API, which takes up to a few minutes.
+autosummary_stub_cache = {}
+autosummary_stub_cache_used = {}
+autosummary_stub_cache_dirty = False
+autosummary_stub_stamp = None
+
+generate_autosummary_content_uncached = None
+generate_autosummary_docs_serial = None
+
+# The leading parameters of generate_autosummary_content, which the cache and
+# the workers pass on, as of Sphinx 7.4, which this was written against.
+autosummary_content_params = ('name', 'obj', 'parent', 'template', 'template_name',
+                              'imported_members', 'app', 'recursive', 'context',
+                              'modname', 'qualname')
+
+
+def has_autosummary_internals(generate):
+    """Returns whether the given sphinx.ext.autosummary.generate module has
+    the internals that the stub cache and the parallel rendering rely on."""
+
+    import inspect
+
+    for name in ('AutosummaryRenderer', 'find_autosummary_in_files', 'import_by_name',
+                 'generate_autosummary_content', 'generate_autosummary_docs'):
+        if not hasattr(generate, name):
+            return False
+
+    try:
+        content_params = tuple(inspect.signature(generate.generate_autosummary_content).parameters)
+        docs_params = inspect.signature(generate.generate_autosummary_docs).parameters
+    except (TypeError, ValueError):
+        return False
+
+    return content_params[:len(autosummary_content_params)] == autosummary_content_params \
+        and 'app' in docs_params and 'base_path' in docs_params
+
+
+def get_autosummary_stub_stamp(app):
+    """Returns a value identifying everything that goes into the stubs: the
+    installed Panda3D modules, the templates, the autosummary settings and the
+    source of this extension, which decides which members are documented."""
+
+    import importlib.machinery
+    import importlib.util
+    import sphinx
+
+    stamp = hashlib.sha1(sphinx.__display_version__.encode())
+    stamp.update(sys.prefix.encode())
+    stamp.update(repr((app.config.autosummary_context,
+                       app.config.autosummary_imported_members,
+                       app.config.autosummary_mock_imports)).encode())
+
+    suffixes = tuple(importlib.machinery.all_suffixes())
+    for pkgname in ('panda3d', 'direct'):
+        spec = importlib.util.find_spec(pkgname)
+        for root in (spec and spec.submodule_search_locations) or ():
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    if fn.endswith(suffixes):
+                        path = os.path.join(dirpath, fn)
+                        st = os.stat(path)
+                        stamp.update('{0}:{1}:{2};'.format(os.path.relpath(path, root), st.st_size, st.st_mtime_ns).encode())
+
+    for dir in app.config.templates_path:
+        dir = os.path.join(app.confdir, dir, 'autosummary')
+        if not os.path.isdir(dir):
+            continue
+        for fn in sorted(os.listdir(dir)):
+            with open(os.path.join(dir, fn), 'rb') as fh:
+                stamp.update(fn.encode() + b':' + hashlib.sha1(fh.read()).digest())
+
+    dir = os.path.dirname(os.path.abspath(__file__))
+    for fn in sorted(os.listdir(dir)):
+        if fn.endswith('.py'):
+            with open(os.path.join(dir, fn), 'rb') as fh:
+                stamp.update(fn.encode() + b':' + hashlib.sha1(fh.read()).digest())
+
+    return stamp.hexdigest()
+
+
+def generate_autosummary_content_cached(name, obj, parent, template, template_name,
+                                        imported_members, app, recursive, context,
+                                        *args, **kwargs):
+    """Like generate_autosummary_content, but consults the stub cache."""
+
+    global autosummary_stub_cache_dirty
+
+    key = (name, template_name, bool(imported_members), bool(recursive))
+    content = autosummary_stub_cache.get(key)
+    if content is None:
+        content = generate_autosummary_content_uncached(
+            name, obj, parent, template, template_name, imported_members, app,
+            recursive, context, *args, **kwargs)
+        autosummary_stub_cache_dirty = True
+    autosummary_stub_cache_used[key] = content
+
+    return content
+
+
+def render_autosummary_stubs(app, entries, imported_members):
+    """Renders the given autosummary entries in a forked worker, and returns
+    the cache key and content of each one that could be imported."""
+
+    from sphinx.ext.autosummary import generate
+
+    template = generate.AutosummaryRenderer(app)
+    results = []
+    for entry in entries:
+        try:
+            name, obj, parent, modname = generate.import_by_name(entry.name)
+        except ImportError:
+            # Left to the serial pass, which warns about it.
+            continue
+
+        qualname = name.replace(modname + '.', '')
+        content = generate_autosummary_content_uncached(
+            name, obj, parent, template, entry.template, imported_members, app,
+            entry.recursive, dict(app.config.autosummary_context), modname, qualname)
+        results.append(((name, entry.template, imported_members, bool(entry.recursive)), content))
+
+    return results
+
+
+def generate_autosummary_docs_parallel(sources, *args, **kwargs):
+    """Like generate_autosummary_docs, but when building with -j, renders the
+    stubs that aren't in the stub cache in forked workers first, so that the
+    serial pass only has to write them."""
+
+    from sphinx.util.parallel import ParallelTasks, make_chunks, parallel_available
+
+    global autosummary_stub_cache_dirty
+
+    app = kwargs.get('app')
+    if not app or app.parallel <= 1 or not parallel_available:
+        return generate_autosummary_docs_serial(sources, *args, **kwargs)
+
+    from sphinx.ext.autosummary import generate
+
+    paths = sources
+    if kwargs.get('base_path') is not None:
+        paths = [os.path.join(kwargs['base_path'], fn) for fn in sources]
+    imported_members = bool(kwargs.get('imported_members'))
+
+    # Sorted by module, so that the members of a module end up in the same
+    # workers, which then need to import fewer modules.
+    entries = []
+    for entry in sorted(set(generate.find_autosummary_in_files(paths)), key=str):
+        key = (entry.name, entry.template, imported_members, bool(entry.recursive))
+        if entry.path is not None and key not in autosummary_stub_cache:
+            entries.append(entry)
+    entries.sort(key=lambda entry: (entry.name.rpartition('.')[0], str(entry)))
+
+    if len(entries) > 1:
+        rendered = {}
+        render = functools.partial(render_autosummary_stubs, app, imported_members=imported_members)
+        tasks = ParallelTasks(app.parallel)
+        for chunk in make_chunks(entries, app.parallel):
+            tasks.add_task(render, chunk, lambda chunk, results: rendered.update(results))
+        tasks.join()
+
+        # Merged in a fixed order, whichever worker finished first.
+        for key in sorted(rendered, key=repr):
+            autosummary_stub_cache[key] = rendered[key]
+            autosummary_stub_cache_dirty = True
+
+    return generate_autosummary_docs_serial(sources, *args, **kwargs)
+
+
+def on_builder_inited_autosummary_stubs(app):
+    # This has to run before autosummary generates the stubs.
+    global autosummary_stub_cache, autosummary_stub_cache_dirty, autosummary_stub_stamp
+
+    autosummary_stub_cache = {}
+    autosummary_stub_cache_used.clear()
+    autosummary_stub_cache_dirty = False
+
+    if not app.config.autosummary_generate:
+        return
+
+    autosummary_stub_stamp = get_autosummary_stub_stamp(app)
+
+    path = os.path.join(app.doctreedir, 'autosummary-stubs.pickle')
+    try:
+        with open(path, 'rb') as fh:
+            stamp, cache = pickle.load(fh)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return
+
+    if stamp == autosummary_stub_stamp:
+        autosummary_stub_cache = cache
+
+
+def on_build_finished_autosummary_stubs(app, exception):
+    global autosummary_stub_cache_dirty
+
+    # Only keep the stubs that are still generated, so that removed ones don't
+    # pile up in the cache.
+    if exception or not autosummary_stub_cache_used:
+        return
+    if not autosummary_stub_cache_dirty and len(autosummary_stub_cache_used) == len(autosummary_stub_cache):
+        return
+
+    path = os.path.join(app.doctreedir, 'autosummary-stubs.pickle')
+    cache = dict(autosummary_stub_cache_used)
+    write_file_atomic(path, pickle.dumps((autosummary_stub_stamp, cache), pickle.HIGHEST_PROTOCOL))
+    autosummary_stub_cache_dirty = False
+
+
+def setup(app):
+    global generate_autosummary_content_uncached, generate_autosummary_docs_serial
+
+    if options.build_api_reference:
+        # This relies on the internals of autosummary, so if they don't look
+        # as expected, the stubs are generated the regular way instead.
+        from sphinx.ext.autosummary import generate
+        if has_autosummary_internals(generate):
+            generate_autosummary_content_uncached = generate.generate_autosummary_content
+            generate_autosummary_docs_serial = generate.generate_autosummary_docs
+            generate.generate_autosummary_content = generate_autosummary_content_cached
+            generate.generate_autosummary_docs = generate_autosummary_docs_parallel
+
+            connect_hook(app, 'builder-inited', on_builder_inited_autosummary_stubs, priority=400)
+            connect_hook(app, 'build-finished', on_build_finished_autosummary_stubs)
+        else:
+            logger.warning('the autosummary stub cache does not support this '
+                           'version of Sphinx, generating the stubs without it.')
+
+    if options.fast_build:
+        # Don't import all of the API just to list it on the reference index.
+        from sphinx_autopackagesummary import Autopackagesummary
+
+        class OmittedAutopackagesummary(Autopackagesummary):
+            def run(self):
+                return []
+
+        app.add_directive('autopackagesummary', OmittedAutopackagesummary, override=True)
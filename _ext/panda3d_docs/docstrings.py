@@ -0,0 +1,335 @@
+"""Autodoc hooks for the API reference, which convert the docstrings from the
+Doxygen format.  The converted docstrings are cached between builds, and may
+also be looked up in a store written ahead of time by extract_docstrings.py."""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import types
+import urllib.request
+
+from sphinx.ext import autodoc
+from sphinx.util import logging
+
+from . import options
+from .doxygen import doxygen_converter_version, convert_doxygen_docstring_warnings
+from .profiling import connect_hook
+from .symbols import get_symbol_index_stamp
+
+logger = logging.getLogger(__name__)
+
+
+# Maps a hash of the raw docstring, object name and domain to a tuple of the
+# converted lines and the warnings printed while converting them, which are
+# printed again when the entry is used.  It is persisted between builds; see
+# on_builder_inited_docstring_cache.  New entries are also collected in
+# docstring_cache_added, which is attached to the environment so that parallel
+# readers can send them back to the main process (see
+# on_env_merge_info_docstring_cache).  It is emptied before reading, so that
+# each reader only sends back the entries it added itself.
+#
+# The environment also keeps the keys used by each document, in its
+# docstring_cache_keys attribute, so that the entries which no document uses
+# any more can be dropped at the end of the build.
+docstring_cache = {}
+docstring_cache_added = {}
+docstring_cache_dirty = False
+
+
+def get_docstring_cache_stamp(app):
+    """Returns a value identifying the converter version and the symbol index
+    the references are resolved through, which includes the settings that the
+    names are mangled by.  If it changes, the cached docstrings are considered
+    stale."""
+
+    stamp = hashlib.sha1(str(doxygen_converter_version).encode())
+    stamp.update(get_symbol_index_stamp(app).encode())
+    return stamp.hexdigest()
+
+
+def convert_doxygen_docstring_cached(lines, name, domain='py', used_keys=None):
+    """Like convert_doxygen_docstring, but consults the docstring cache.  The
+    key of the entry is added to used_keys, if given."""
+
+    global docstring_cache_dirty
+
+    key = hashlib.sha1('\0'.join([name, domain] + lines).encode('utf-8', 'surrogatepass')).digest()
+    entry = docstring_cache.get(key)
+    if entry is None:
+        entry = lookup_docstring_store(lines, name, domain)
+        if entry is None:
+            entry = convert_doxygen_docstring_warnings(lines, name, domain)
+            docstring_cache_added[key] = entry
+            docstring_cache_dirty = True
+        else:
+            for message in entry[1]:
+                print(message)
+        docstring_cache[key] = entry
+    else:
+        for message in entry[1]:
+            print(message)
+
+    if used_keys is not None:
+        used_keys.add(key)
+
+    return entry[0][:]
+
+
+def on_builder_inited_docstring_cache(app):
+    # The cache is stored alongside the pickled environment.
+    global docstring_cache, docstring_cache_dirty
+
+    docstring_cache = {}
+    docstring_cache_added.clear()
+    docstring_cache_dirty = False
+
+    path = os.path.join(app.doctreedir, 'docstrings.pickle')
+    try:
+        with open(path, 'rb') as fh:
+            stamp, cache = pickle.load(fh)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return
+
+    if stamp == get_docstring_cache_stamp(app):
+        docstring_cache = cache
+
+
+def on_env_before_read_docs_docstring_cache(app, env, docnames):
+    # Forked readers inherit this reference to their copy of the dict, and
+    # return it to us as part of their pickled environment.  The entries in it
+    # are already in docstring_cache, so they need not be sent back again.
+    docstring_cache_added.clear()
+    env.docstring_cache_added = docstring_cache_added
+    if not hasattr(env, 'docstring_cache_keys'):
+        env.docstring_cache_keys = {}
+
+
+def on_env_purge_doc_docstring_cache(app, env, docname):
+    keys = getattr(env, 'docstring_cache_keys', None)
+    if keys:
+        keys.pop(docname, None)
+
+
+def on_env_merge_info_docstring_cache(app, env, docnames, other):
+    global docstring_cache_dirty
+
+    added = getattr(other, 'docstring_cache_added', None)
+    if added:
+        docstring_cache.update(added)
+        docstring_cache_dirty = True
+
+    keys = getattr(other, 'docstring_cache_keys', None)
+    if keys:
+        for docname in docnames:
+            if docname in keys:
+                env.docstring_cache_keys[docname] = keys[docname]
+
+
+def on_env_updated_docstring_cache(app, env):
+    # Don't pickle this along with the environment.
+    env.__dict__.pop('docstring_cache_added', None)
+
+
+def on_build_finished_docstring_cache(app, exception):
+    global docstring_cache_dirty
+
+    # Drop the entries that none of the documents use any more.  Fast builds
+    # leave out the documents that use them, so those keep them all.
+    keys = getattr(app.env, 'docstring_cache_keys', None)
+    if not exception and keys is not None and options.build_api_reference:
+        used_keys = set()
+        for doc_keys in keys.values():
+            used_keys.update(doc_keys)
+
+        for key in list(docstring_cache):
+            if key not in used_keys:
+                del docstring_cache[key]
+                docstring_cache_dirty = True
+
+    if not docstring_cache_dirty:
+        return
+
+    path = os.path.join(app.doctreedir, 'docstrings.pickle')
+    os.makedirs(app.doctreedir, exist_ok=True)
+    with open(path + '.tmp', 'wb') as fh:
+        pickle.dump((get_docstring_cache_stamp(app), docstring_cache), fh, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    docstring_cache_added.clear()
+    docstring_cache_dirty = False
+
+
+# The docstring store is an SQLite database with the converted docstrings of a
+# Panda3D release, written ahead of time by extract_docstrings.py.  If its path
+# is given as the docstring_store config value, convert_doxygen_docstring_cached
+# looks up the docstrings that aren't in the docstring cache in there first.
+# The store is only used if it was written by the same converter version from
+# the same interrogate databases, with the same settings that the names are
+# mangled by, see get_docstring_store_stamp.
+docstring_store_path = None
+docstring_store = None
+docstring_store_pid = None
+
+
+def get_docstring_store_stamp(search_path, mangle_type_names=False, mangle_function_names=False):
+    """Like get_docstring_cache_stamp, but hashes the contents of the
+    interrogate databases, so that it is the same on every machine.  The name
+    mangling settings change the names the references are resolved to, so
+    they are included as well."""
+
+    stamp = hashlib.sha1(str(doxygen_converter_version).encode())
+    stamp.update(repr((bool(mangle_type_names), bool(mangle_function_names))).encode())
+    for dir in search_path or ():
+        if not os.path.isdir(dir):
+            continue
+        for fn in sorted(os.listdir(dir)):
+            if fn.endswith('.in'):
+                with open(os.path.join(dir, fn), 'rb') as fh:
+                    stamp.update('{0}:{1};'.format(fn, hashlib.sha1(fh.read()).hexdigest()).encode())
+
+    return stamp.hexdigest()
+
+
+def get_docstring_store_hash(lines):
+    return hashlib.sha1('\n'.join(lines).encode('utf-8', 'surrogatepass')).digest()
+
+
+def open_docstring_store(path):
+    uri = 'file:' + urllib.request.pathname2url(path) + '?mode=ro'
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def lookup_docstring_store(lines, name, domain):
+    """Returns the converted lines of the given docstring from the docstring
+    store, along with the warnings printed while converting it, or None if
+    it's not in there."""
+
+    global docstring_store, docstring_store_pid
+
+    if docstring_store_path is None:
+        return None
+
+    # SQLite connections can't be shared with forked processes.
+    if docstring_store_pid != os.getpid():
+        docstring_store = open_docstring_store(docstring_store_path)
+        docstring_store_pid = os.getpid()
+
+    row = docstring_store.execute(
+        'SELECT lines, warnings FROM docstrings WHERE name = ? AND domain = ? AND hash = ?',
+        (name, domain, get_docstring_store_hash(lines))).fetchone()
+    if row is not None:
+        return json.loads(row[0]), json.loads(row[1])
+
+
+def on_builder_inited_docstring_store(app):
+    global docstring_store_path, docstring_store, docstring_store_pid
+
+    docstring_store_path = None
+    docstring_store = None
+    docstring_store_pid = None
+
+    if not app.config.docstring_store:
+        return
+
+    path = os.path.join(app.confdir, app.config.docstring_store)
+    try:
+        db = open_docstring_store(path)
+        try:
+            row = db.execute("SELECT value FROM info WHERE key = 'stamp'").fetchone()
+        finally:
+            db.close()
+    except sqlite3.Error as ex:
+        logger.warning('docstring store %s couldn\'t be opened: %s', path, ex)
+        return
+
+    stamp = get_docstring_store_stamp(app.config.interrogatedb_search_path,
+                                      app.config.autodoc_interrogatedb_mangle_type_names,
+                                      app.config.autodoc_interrogatedb_mangle_function_names)
+    if row is None or row[0] != stamp:
+        logger.warning('docstring store %s was written from other interrogate '
+                       'databases, with other name mangling settings or by '
+                       'another version of the converter, ignoring it.', path)
+        return
+
+    docstring_store_path = path
+
+
+def on_autodoc_skip_member(app, what, name, obj, skip, options):
+    # Always document constructors.
+    if name == '__init__':
+        return False
+
+    # Don't document method aliases.  This also has the side-effect of
+    # excluding private members, which is OK.
+    if isinstance(obj, types.FunctionType) and obj.__name__ != name:
+        return True
+
+
+def on_autodoc_process_docstring(app, what, name, obj, options, lines):
+    # This is a temporary hack for a particularly nasty docstring in
+    # direct.fsm.FourState and direct.fsm.FourStateAI that was badly
+    # formatted.  It can be removed once a new version of Panda3D is
+    # released with the offending docstring fixed.
+
+    if name in ('direct.fsm.FourState.FourState.__init__',
+                'direct.fsm.FourStateAI.FourStateAI.__init__') \
+       and 'are used:' in lines:
+        lines[lines.index('are used:')] = 'are used::'
+
+    if lines:
+        line0 = lines[0].lstrip()
+        if line0.startswith('/**') or line0.startswith('// '):
+            domain = app.env.temp_data.get('default_domain')
+            domain = domain.name if domain else 'py'
+            keys = getattr(app.env, 'docstring_cache_keys', None)
+            used_keys = keys.setdefault(app.env.docname, set()) if keys is not None else None
+            lines[:] = convert_doxygen_docstring_cached(lines, name, domain, used_keys)
+
+
+class ExcludeDocumenter(autodoc.Documenter):
+    """Special documenter that excludes certain types from autosummary.
+
+    It works by matching our desired excluded types, but because it has a
+    special objtype not recognized by autosummary, it won't be included."""
+
+    objtype = "exclude"
+
+    priority = 99
+
+    @classmethod
+    def can_document_member(cls, member, membername, isattr, parent):
+        # We only want to trigger autosummary, which always passes the empty
+        # string as membername.
+        if membername:
+            return False
+
+        if isinstance(member, type):
+            if member.__name__.startswith("PointerToBase_ReferenceCountedVector_"):
+                return True
+
+        return False
+
+    def generate(self, *args, **kwargs):
+        # This should never even be invoked by autodoc.
+        return
+
+
+def setup(app):
+    # Set this to the file written by extract_docstrings.py to look up the
+    # converted docstrings in.
+    app.add_config_value('docstring_store', None, '')
+
+    connect_hook(app, 'autodoc-skip-member', on_autodoc_skip_member)
+    connect_hook(app, 'autodoc-process-docstring', on_autodoc_process_docstring)
+    connect_hook(app, 'builder-inited', on_builder_inited_docstring_cache)
+    connect_hook(app, 'env-before-read-docs', on_env_before_read_docs_docstring_cache)
+    connect_hook(app, 'env-purge-doc', on_env_purge_doc_docstring_cache)
+    connect_hook(app, 'env-merge-info', on_env_merge_info_docstring_cache)
+    connect_hook(app, 'env-updated', on_env_updated_docstring_cache)
+    connect_hook(app, 'build-finished', on_build_finished_docstring_cache)
+
+    if options.build_api_reference:
+        connect_hook(app, 'builder-inited', on_builder_inited_docstring_store)
+
+    app.add_autodocumenter(ExcludeDocumenter)
@@ -0,0 +1,364 @@
+"""Conversion of the Doxygen comments in the interrogate databases to
+reStructuredText."""
+
+import re
+from collections import deque
+
+from .symbols import resolve_reference
+
+
+# Bump this whenever a change is made that affects the output of
+# convert_doxygen_docstring, or the way the docstring cache and store keep it,
+# so that those are discarded.
+doxygen_converter_version = 2
+
+# Regex patterns.
+method_class_ref_pattern = re.compile(r'([a-zA-Z_][a-zA-Z0-9_.:]*)\(\)|([a-zA-Z_][a-zA-Z0-9_]*::[a-zA-Z_][a-zA-Z0-9_.:]*)(\(\))?|([a-zA-Z_]+[A-Z0-9_][a-zA-Z0-9_.:]*)(\(\))?')
+
+# Matches all the inline markup handled by convert_doxygen_format in one go:
+# <b> tags, runs of backticks, and @c/@p followed by a word.
+doxygen_markup_pattern = re.compile(r'</?b>|`+|@[cp]\s+([^\s]+)')
+
+# Scans a line converted by doxygen_markup_pattern for the words that look like
+# a method or class reference, as method_class_ref_pattern would match them,
+# and for the double backticks that open and close code spans.  The words may
+# be surrounded by backticks and followed by a closing parenthesis and a
+# punctuation mark, which go into the suffix group.  The name is matched
+# lazily, so that a trailing full stop goes into the suffix.
+doxygen_scan_pattern = re.compile(
+    r'(?<![^ ])(?P<word>`*(?P<ref>'
+    r'[a-zA-Z_][a-zA-Z0-9_.:]*?\(\)|'
+    r'[a-zA-Z_][a-zA-Z0-9_]*::[a-zA-Z_][a-zA-Z0-9_.:]*?(?:\(\))?|'
+    r'[a-zA-Z_]+[A-Z0-9_][a-zA-Z0-9_.:]*?(?:\(\))?'
+    r')`*)(?P<suffix>\)?[.,;]?)(?![^ ])|``')
+
+
+def _convert_doxygen_markup(match):
+    # Callback for doxygen_markup_pattern, see convert_doxygen_format.
+    arg = match.group(1)
+    if arg is not None:
+        # @c and @p result in double backticks for the subsequent word
+        return '``' + doxygen_markup_pattern.sub(_convert_doxygen_markup, arg) + '``'
+
+    text = match.group(0)
+    if text[0] == '`':
+        # Single backticks in doxygen map to doubles in Sphinx, but double
+        # backticks are literal backticks.
+        count = len(text)
+        return '\\`' * (count // 2) + '``' * (count % 2)
+
+    # <b> and </b>
+    return '**'
+
+
+def convert_doxygen_format(line, name, domain='py'):
+    """Converts a single line of Doxygen formatting to Sphinx.
+    The name argument is the fully qualified name of the current module, class
+    or function, and is used to resolve references."""
+
+    line = doxygen_markup_pattern.sub(_convert_doxygen_markup, line)
+
+    parent = name.rsplit('.', 1)[-1]
+
+    # Search for method and class references.  We pick them up either when they
+    # have a scoping operator, or when they end with (), or when they clearly
+    # look like a class/method, or we would match all the words in the text!
+    parts = []
+    pos = 0
+    in_backticks = False
+    for m in doxygen_scan_pattern.finditer(line):
+        word = m.group('word')
+        if word is None:
+            # This opens/closes a backtick block spanning multiple words.
+            in_backticks = not in_backticks
+            continue
+
+        if word.count('``') % 2 == 1:
+            in_backticks = not in_backticks
+            continue
+
+        if in_backticks:
+            continue
+
+        # Don't replace the class name on the page of the class itself, unless
+        # it's already in backticks.
+        if word.rstrip('()') == parent:
+            continue
+
+        word = m.group('ref')
+
+        # Detect use of plural in references to classes.
+        plural = word.endswith('s') and '::' not in word and word[:-1] != parent
+        result = resolve_reference(word.rstrip('()'), name, domain=domain, plural=plural)
+        if not result:
+            continue
+
+        typ, target = result
+        suffix = m.group('suffix')
+
+        if word == target:
+            text = ':{0}:{1}:`{2}`{3}'.format(domain, typ, target, suffix)
+        else:
+            if domain == 'py' and typ in ('meth', 'func'):
+                # Replace last part with mangled name if appropriate.
+                word = word.replace('::', '.')
+                oldpart = word.rsplit('.', 1)[-1]
+                newpart = target.rsplit('.', 1)[-1]
+                if oldpart.endswith('()'):
+                    newpart += '()'
+
+                if oldpart != newpart:
+                    if word == oldpart:
+                        word = newpart
+                    else:
+                        word = word.rsplit('.', 1)[0] + '.' + newpart
+
+            if '.' not in word and '::' not in word and target.endswith('.' + word):
+                text = ':{0}:{1}:`~{2}`{3}'.format(domain, typ, target, suffix)
+            else:
+                text = ':{0}:{1}:`{2} <{3}>`{4}'.format(domain, typ, word, target, suffix)
+
+        parts.append(line[pos:m.start()])
+        parts.append(text)
+        pos = m.end()
+
+    if not parts:
+        return line
+
+    parts.append(line[pos:])
+    return ''.join(parts)
+
+
+# Maps a Doxygen tag (without the @) to the function handling it; see
+# doxygen_tag and convert_doxygen_docstring.
+doxygen_tag_handlers = {}
+
+# The list that report_doxygen_warning adds the warnings to, if any.
+doxygen_warnings = None
+
+
+def doxygen_tag(*tags):
+    """Decorator that registers a handler for the given Doxygen tags.
+
+    The handler is called as handler(tag, strline, line, lines, newlines,
+    name, domain), where strline is the line stripped of comment markers, line
+    the original line, lines a deque of the remaining input lines (which it
+    may consume) and newlines the list of output lines.  It should return None
+    if it has handled the line, or else the text to be output in its place."""
+
+    def register(func):
+        for tag in tags:
+            doxygen_tag_handlers[tag] = func
+        return func
+
+    return register
+
+
+def report_doxygen_warning(message):
+    # Also collected by convert_doxygen_docstring_warnings, if it is running.
+    print(message)
+    if doxygen_warnings is not None:
+        doxygen_warnings.append(message)
+
+
+def _read_doxygen_block(lines, newlines, offset, end_tags):
+    """Moves lines to the output, indented, up to a line containing any of the
+    given end tags.  The first offset characters are cut off each line."""
+
+    while lines:
+        line = lines.popleft()
+        for end_tag in end_tags:
+            if end_tag in line:
+                return
+        newlines.append('   ' + line[offset:])
+
+
+@doxygen_tag('par')
+def _convert_doxygen_par(tag, strline, line, lines, newlines, name, domain):
+    if not strline.endswith(':') or not lines or '@code' not in lines[0]:
+        report_doxygen_warning("Unhandled documentation tag: @" + tag)
+        return strline
+
+    newlines.append(strline[5:] + ':')
+    newlines.append('')
+    offset = lines.popleft().index('@code')
+    _read_doxygen_block(lines, newlines, offset, ('@endverbatim', '@endcode'))
+    newlines.append('')
+
+
+@doxygen_tag('verbatim', 'code')
+def _convert_doxygen_code(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    newlines.append('.. code-block:: guess')
+    newlines.append('')
+    offset = line.index('@' + tag)
+    _read_doxygen_block(lines, newlines, offset, ('@endverbatim', '@endcode'))
+    newlines.append('')
+
+
+@doxygen_tag('f[')
+def _convert_doxygen_math(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    newlines.append('.. math::')
+    newlines.append('')
+    offset = line.index('@' + tag)
+    _read_doxygen_block(lines, newlines, offset, ('@f]', ))
+    newlines.append('')
+
+
+@doxygen_tag('param', 'brief', 'return', 'returns')
+def _convert_doxygen_ignored(tag, strline, line, lines, newlines, name, domain):
+    #TODO
+    #if extra is not None:
+    #    _, value = strline.split(' ', 1)
+    #    extra[tag] = value
+    pass
+
+
+@doxygen_tag('deprecated')
+def _convert_doxygen_deprecated(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    if ' ' in strline:
+        _, value = strline.split(' ', 1)
+
+        # I'd love to use the proper Sphinx deprecated tag, but it
+        # requires a version number, whereas Doxygen doesn't.
+        newlines.append('**Deprecated**: ' + convert_doxygen_format(value, name, domain))
+    else:
+        newlines.append('**Deprecated**')
+
+    newlines.append('')
+
+
+@doxygen_tag('details')
+def _convert_doxygen_details(tag, strline, line, lines, newlines, name, domain):
+    return strline[9:]
+
+
+@doxygen_tag('sa', 'see')
+def _convert_doxygen_see(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    _, value = strline.split(' ', 1)
+    values = value.split(',')
+
+    for i, value in enumerate(values):
+        result = resolve_reference(value.partition('(')[0], name, domain=domain)
+        if result:
+            values[i] = ':{0}:{1}:`{2}`'.format(domain, *result)
+        else:
+            values[i] = ':{0}:obj:`{1}`'.format(domain, value)
+
+    if tag == 'see':
+        newlines.append('See {}.'.format(', '.join(values)))
+    else:
+        newlines.append('See also {}.'.format(', '.join(values)))
+    newlines.append('')
+
+
+@doxygen_tag('note', 'warning')
+def _convert_doxygen_admonition(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    newlines.append('.. %s:: ' % (tag))
+    newlines.append('')
+    newlines.append('   ' + convert_doxygen_format(strline[2 + len(tag):], name, domain))
+    while lines and lines[0].strip(' *\t/'):
+        line = lines.popleft().lstrip(' *\t')
+        newlines.append('   ' + convert_doxygen_format(line, name, domain))
+
+    newlines.append('')
+
+
+@doxygen_tag('since')
+def _convert_doxygen_since(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    newlines.append('.. versionadded:: ' + strline[7:])
+    newlines.append('')
+
+
+@doxygen_tag('li')
+def _convert_doxygen_list_item(tag, strline, line, lines, newlines, name, domain):
+    if newlines and newlines[-1]:
+        newlines.append('')
+
+    newlines.append('* ' + convert_doxygen_format(strline[4:], name, domain))
+    newlines.append('')
+
+
+def convert_doxygen_docstring(lines, name, domain='py'):
+    """Converts a doxygen-style C++ block comment to a Sphinx-style one.
+    The name argument is the fully qualified name of the current module, class
+    or function, and is used to resolve references.
+
+    The lines are consumed from a deque, so this runs in linear time; tags are
+    dispatched to the handlers registered with the doxygen_tag decorator."""
+
+    lines = deque(lines)
+    newlines = []
+
+    while lines:
+        line = lines.popleft()
+        if line.startswith("////"):
+            continue
+
+        line = line.rstrip()
+        if line.startswith('///<'):
+            strline = line[4:]
+        else:
+            strline = line
+
+        strline = strline.lstrip('/ \t')
+
+        if strline == "**" or strline == "*/":
+            continue
+
+        if strline.startswith("** "):
+            strline = strline[3:]
+        elif strline.startswith("* "):
+            strline = strline[2:]
+        elif strline == "*":
+            strline = ""
+
+        strline = strline.lstrip(' \t')
+
+        if strline.startswith('@'):
+            special = strline.split(' ', 1)[0][1:]
+            handler = doxygen_tag_handlers.get(special)
+            if handler:
+                strline = handler(special, strline, line, lines, newlines, name, domain)
+                if strline is None:
+                    continue
+            else:
+                report_doxygen_warning("Unhandled documentation tag: @" + special)
+
+        if strline or len(newlines) > 0:
+            newlines.append(convert_doxygen_format(strline, name, domain))
+
+    return newlines
+
+
+def convert_doxygen_docstring_warnings(lines, name, domain='py'):
+    """Like convert_doxygen_docstring, but returns a tuple of the converted
+    lines and a list of the warnings that were printed while converting."""
+
+    global doxygen_warnings
+
+    warnings = []
+    doxygen_warnings = warnings
+    try:
+        newlines = convert_doxygen_docstring(lines, name, domain)
+    finally:
+        doxygen_warnings = None
+
+    return newlines, warnings
@@ -0,0 +1,555 @@
+"""Speeds up the inheritance diagrams: the class hierarchy is indexed once for
+all diagrams, and the diagrams are rendered in batches, several per dot
+process, and cached between builds."""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import types
+
+from sphinx.util import logging
+from sphinx.util.parallel import ParallelTasks
+
+from . import options
+from .profiling import connect_hook, profiled
+from .util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# Index of the class hierarchy for the inheritance diagrams, see class_info.
+# Both are keyed by the diagram options that affect them.  The first maps each
+# class to a tuple of itself and its ancestors, in the order in which Sphinx
+# would visit them, the second maps each class to its class_info entry.
+class_ancestry = {}
+class_info_rows = {}
+
+# DOT statements for a node and its edges, which are the same in every diagram
+# that contains the class, apart from the URL.  See generate_dot.
+inheritance_dot_cache = {}
+
+
+def class_info(self, classes, show_builtins, private_bases, parts, aliases, top_classes):
+    # Replacement for InheritanceGraph._class_info, which walks up the bases
+    # of every class for every diagram anew, looking up the docstrings and
+    # names of all the ancestors.  Deep hierarchies (eg. PandaNode) thus get
+    # visited hundreds of times.  Instead, we fill in an index with the
+    # ancestors of each class just once, and return a slice of it, sorted
+    # the way generate_dot needs it.
+    from sphinx.ext.inheritance_diagram import py_builtins
+
+    aliases_key = tuple(sorted(aliases.items())) if aliases else None
+    key = (show_builtins, private_bases, aliases_key, tuple(top_classes))
+    ancestry = class_ancestry.setdefault(key, {})
+    rows = class_info_rows.setdefault(key + (parts, ), {})
+
+    def included(cls):
+        if not show_builtins and cls in py_builtins:
+            return False
+        return private_bases or not cls.__name__.startswith('_')
+
+    def get_ancestry(cls):
+        result = ancestry.get(cls)
+        if result is None:
+            # A depth-first walk, with the classes visited through earlier
+            # bases left out, matches the order of the original.
+            result = {cls: None}
+            if self.class_name(cls, 0, aliases) not in top_classes:
+                for base in cls.__bases__:
+                    if included(base):
+                        for ancestor in get_ancestry(base):
+                            result.setdefault(ancestor)
+            result = tuple(result)
+            ancestry[cls] = result
+        return result
+
+    def get_row(cls):
+        row = rows.get(cls)
+        if row is None:
+            fullname = self.class_name(cls, 0, aliases)
+
+            # Use first line of docstring as tooltip, if available
+            tooltip = None
+            try:
+                if cls.__doc__:
+                    doc = cls.__doc__.strip().split("\n")[0]
+                    if doc:
+                        tooltip = '"%s"' % doc.replace('"', '\\"')
+            except Exception:  # might raise AttributeError for strange classes
+                pass
+
+            baselist = []
+            if fullname not in top_classes:
+                baselist = [self.class_name(base, parts, aliases)
+                            for base in cls.__bases__ if included(base)]
+
+            row = (self.class_name(cls, parts, aliases), fullname, baselist, tooltip)
+            rows[cls] = row
+        return row
+
+    all_classes = {}
+    for cls in classes:
+        if included(cls):
+            for ancestor in get_ancestry(cls):
+                all_classes.setdefault(ancestor)
+
+    return sorted(get_row(cls) for cls in all_classes)
+
+
+# This is an awful hack to get the inheritance graphs to incorporate the
+# current variation into the links properly, and, at the same time, not
+# generate the arrow connections inverted. :-/
+def generate_dot(self, name, urls={}, env=None,
+                 graph_attrs={}, node_attrs={}, edge_attrs={}):
+    g_attrs = self.default_graph_attrs.copy()
+    n_attrs = self.default_node_attrs.copy()
+    e_attrs = self.default_edge_attrs.copy()
+    g_attrs.update(graph_attrs)
+    n_attrs.update(node_attrs)
+    e_attrs.update(edge_attrs)
+    if env:
+        g_attrs.update(env.config.inheritance_graph_attrs)
+        n_attrs.update(env.config.inheritance_node_attrs)
+        e_attrs.update(env.config.inheritance_edge_attrs)
+
+    # Fix the URL references to contain the current variation.
+    url_prefix = None
+    if env and env.config.graphviz_output_format.lower() == 'svg' and \
+       getattr(env.app.builder, 'current_variation', None):
+        url_prefix = '../' + env.app.builder.current_variation[0] + '/reference/'
+
+    n_attrs_key = self._format_node_attrs(n_attrs)
+    e_attrs_key = self._format_node_attrs(e_attrs)
+
+    res = []  # type: List[str]
+    res.append('strict digraph %s {\n' % name)
+    res.append(self._format_graph_attrs(g_attrs))
+
+    # class_info already returns this sorted, in which case this is cheap,
+    # but the graphs in doctrees pickled by an older version may not be.
+    for name, fullname, bases, tooltip in sorted(self.class_info):
+        if name == 'DTOOL_SUPER_BASE':
+            continue
+
+        url = urls.get(fullname)
+        if url is not None and url_prefix:
+            # Also strip off the # reference at the end, since our classes
+            # are defined near the top of each file anyway.
+            url = url_prefix + os.path.basename(url).split('#', 1)[0]
+
+        key = (name, fullname, tuple(bases), tooltip, url, n_attrs_key, e_attrs_key)
+        text = inheritance_dot_cache.get(key)
+        if text is None:
+            # Write the node
+            this_node_attrs = n_attrs.copy()
+            if url is not None:
+                this_node_attrs['URL'] = '"%s"' % url
+                this_node_attrs['target'] = '"_top"'
+            if tooltip:
+                this_node_attrs['tooltip'] = tooltip
+            text = '  "%s" [%s];\n' % (name, self._format_node_attrs(this_node_attrs))
+
+            # Write the edges
+            for base_name in bases:
+                if base_name == 'DTOOL_SUPER_BASE':
+                    continue
+                text += '  "%s" -> "%s" [%s];\n' % (name, base_name, e_attrs_key)
+
+            inheritance_dot_cache[key] = text
+
+        res.append(text)
+
+    res.append('}\n')
+    return ''.join(res)
+
+
+# The layout of an inheritance diagram does not depend on its graph name or on
+# the URLs of its nodes, which differ between the python and cpp variations.
+# So, we replace those with placeholders before running dot and substitute the
+# real values back into the resulting SVG, and cache the latter by a hash of
+# the DOT code with placeholders.  The cache lives in the doctrees directory,
+# so that it is reused across builds.  Bump this to invalidate it.
+inheritance_cache_version = 1
+inheritance_cache_stats = {'hits': 0, 'misses': 0}
+
+inheritance_name_pattern = re.compile(r'^(strict digraph )(\w+)( \{)')
+inheritance_url_pattern = re.compile(r'(URL=")([^"\\]*)(")')
+
+# Diagrams missing from the cache are not rendered right away, but queued up
+# until the end of the build, where they are rendered in batches, several
+# graphs per dot process, with a bounded number of dot processes running at
+# a time.  Maps the DOT code with placeholders to a tuple of the dot command
+# line, the cache file name, and a list of (output file, substitutions, fixup)
+# tuples, see get_svg_fixup.
+inheritance_queue = {}
+inheritance_batch_size = 32
+
+# The cache files used by each document written in this build, and the
+# documents written.  An index of the former is kept in the cache directory,
+# so that the files which no document uses any more can be deleted at the end
+# of the build, even if only some of the pages have been written.
+inheritance_cache_used = {}
+inheritance_written_docs = set()
+
+# The main process flushes its queue at the end of the build.  Forked parallel
+# writers flush theirs when they are done with their chunk of pages, and send
+# back how many they rendered and which cache files they used, see
+# InheritanceWriterTasks.  They run dot in the source directory, which is set
+# by on_builder_inited_inheritance.
+inheritance_srcdir = None
+
+# The original of sphinx.ext.graphviz.render_dot, set by setup().
+render_dot_uncached = None
+
+
+def escape_svg_attr(value):
+    # Escapes a string the way dot does for an attribute value in SVG output.
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+        .replace('"', '&quot;').replace("'", '&#39;')
+
+
+def split_inheritance_dot(code):
+    """Replaces the graph name and URLs in the given DOT code, as produced by
+    generate_dot, with placeholders.  Returns the modified code and a list of
+    (placeholder, value) pairs to substitute in the rendered SVG."""
+
+    substitutions = []
+    placeholders = {}
+
+    def replace_name(match):
+        substitutions.append(('INHERITANCE_GRAPH_NAME', match.group(2)))
+        return match.group(1) + 'INHERITANCE_GRAPH_NAME' + match.group(3)
+
+    def replace_url(match):
+        url = match.group(2)
+        placeholder = placeholders.get(url)
+        if placeholder is None:
+            placeholder = 'INHERITANCE_URL_%d_' % len(placeholders)
+            placeholders[url] = placeholder
+            substitutions.append((placeholder, url))
+        return match.group(1) + placeholder + match.group(3)
+
+    code = inheritance_name_pattern.sub(replace_name, code, count=1)
+    code = inheritance_url_pattern.sub(replace_url, code)
+    return code, substitutions
+
+
+def write_inheritance_svg(svg, outfn, substitutions, fixup=None):
+    for placeholder, value in substitutions:
+        svg = svg.replace(placeholder.encode('utf-8'), escape_svg_attr(value).encode('utf-8'))
+    write_file_atomic(outfn, svg)
+    if fixup is not None:
+        fixup(outfn)
+
+
+def get_svg_fixup(translator):
+    """Returns a function that makes the links in an SVG file written for the
+    page being translated relative to the image directory, as is done by
+    sphinx.ext.graphviz.render_dot on Sphinx 7.2 and up, or None if there is
+    nothing to fix up."""
+
+    from sphinx.ext import graphviz
+    fix_svg_relative_paths = getattr(graphviz, 'fix_svg_relative_paths', None)
+    if fix_svg_relative_paths is None:
+        return None
+
+    # generate_dot already made the links relative to the image directory.
+    builder = translator.builder
+    if getattr(builder, 'current_variation', None):
+        return None
+
+    # The file may only be written when the queue is flushed, by which time
+    # the builder has moved on to another page.
+    page = types.SimpleNamespace(
+        builder=types.SimpleNamespace(env=builder.env, app=builder.app,
+                                      imgpath=builder.imgpath),
+        document={'source': translator.document['source']})
+    return functools.partial(fix_svg_relative_paths, page)
+
+
+def run_dot(dot_args, cwd, codes):
+    """Renders the given list of DOT graphs to SVG in a single dot process,
+    returning a list with the SVG of each as bytes."""
+
+    import subprocess
+    ret = subprocess.run(dot_args, input=''.join(codes).encode('utf-8'),
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         cwd=cwd, check=True)
+    if len(codes) == 1:
+        return [ret.stdout]
+
+    # dot writes out the graphs one after the other, each as a full document.
+    marker = b'<?xml '
+    svgs = [marker + svg for svg in ret.stdout.split(marker)[1:]]
+    if len(svgs) != len(codes):
+        raise ValueError('dot produced %d graphs instead of %d' % (len(svgs), len(codes)))
+    return svgs
+
+
+def run_dot_batch(dot_args, cwd, codes):
+    """Like run_dot, but if the batch fails, renders the graphs one by one to
+    find out which one is at fault.  Returns a list with the SVG or exception
+    for each graph."""
+
+    try:
+        return run_dot(dot_args, cwd, codes)
+    except Exception:
+        if len(codes) == 1:
+            raise
+
+    results = []
+    for code in codes:
+        try:
+            results.append(run_dot(dot_args, cwd, [code])[0])
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
+def render_dot(self, code, options, format, prefix='graphviz', filename=None):
+    # Replacement for sphinx.ext.graphviz.render_dot that caches inheritance
+    # diagrams in SVG format and queues them up for rendering, see above.
+    # The output file has the same name as the original would give it.
+    if prefix != 'inheritance' or format != 'svg' or options:
+        return render_dot_uncached(self, code, options, format, prefix, filename)
+
+    import posixpath
+    import shutil
+    from subprocess import CalledProcessError
+    from sphinx.ext.graphviz import GraphvizError
+
+    builder = self.builder
+    graphviz_dot = builder.config.graphviz_dot
+    hashkey = ''.join((code, str(options), str(graphviz_dot),
+                       str(builder.config.graphviz_dot_args))).encode()
+
+    fname = '%s-%s.%s' % (prefix, hashlib.sha1(hashkey).hexdigest(), format)
+    relfn = posixpath.join(builder.imgpath, fname)
+    outfn = os.path.join(builder.outdir, builder.imagedir, fname)
+
+    dot_args = [graphviz_dot] + list(builder.config.graphviz_dot_args) + ['-Tsvg']
+    template, substitutions = split_inheritance_dot(code)
+    key = repr((inheritance_cache_version, template, dot_args)).encode('utf-8')
+    cache_name = hashlib.sha1(key).hexdigest() + '.svg'
+    cache_fn = os.path.join(builder.doctreedir, 'inheritance', cache_name)
+    inheritance_cache_used.setdefault(builder.current_docname, set()).add(cache_name)
+
+    if os.path.isfile(outfn):
+        return relfn, outfn
+
+    if getattr(builder, '_graphviz_warned_dot', {}).get(graphviz_dot):
+        return None, None
+
+    try:
+        with open(cache_fn, 'rb') as fh:
+            svg = fh.read()
+    except OSError:
+        svg = None
+
+    fixup = get_svg_fixup(self)
+    if svg is not None:
+        inheritance_cache_stats['hits'] += 1
+        write_inheritance_svg(svg, outfn, substitutions, fixup)
+        return relfn, outfn
+
+    queued = inheritance_queue.get(template)
+    if queued:
+        queued[2].append((outfn, substitutions, fixup))
+        return relfn, outfn
+
+    if shutil.which(graphviz_dot):
+        inheritance_queue[template] = (dot_args, cache_fn, [(outfn, substitutions, fixup)])
+        return relfn, outfn
+
+    try:
+        svg = run_dot(dot_args, builder.srcdir, [template])[0]
+    except OSError:
+        # Let the original produce the warning about dot not being found.
+        return render_dot_uncached(self, code, options, format, prefix, filename)
+    except CalledProcessError as exc:
+        raise GraphvizError('dot exited with error:\n[stderr]\n%r\n'
+                            '[stdout]\n%r' % (exc.stderr, exc.stdout)) from exc
+
+    inheritance_cache_stats['misses'] += 1
+    write_file_atomic(cache_fn, svg)
+    write_inheritance_svg(svg, outfn, substitutions, fixup)
+    return relfn, outfn
+
+
+def on_builder_inited_inheritance(app):
+    global inheritance_srcdir
+    inheritance_srcdir = app.srcdir
+    inheritance_queue.clear()
+    inheritance_cache_used.clear()
+    inheritance_written_docs.clear()
+
+    # Forked parallel writers render the diagrams they queued up at the end of
+    # their chunk of pages.
+    write_parallel_orig = getattr(app.builder, '_write_parallel', None)
+    if write_parallel_orig is not None:
+        app.builder._write_parallel = functools.partial(write_parallel, write_parallel_orig)
+
+
+def flush_inheritance_queue(srcdir, max_workers):
+    """Renders the queued inheritance diagrams, with up to the given number of
+    dot processes running at a time."""
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    items = list(inheritance_queue.items())
+    inheritance_queue.clear()
+    if not items:
+        return
+
+    batches = [items[i:i + inheritance_batch_size]
+               for i in range(0, len(items), inheritance_batch_size)]
+
+    # The heavy lifting happens in the dot processes, so threads suffice to
+    # keep a number of them busy.
+    def render_batch(batch):
+        dot_args = batch[0][1][0]
+        return run_dot_batch(dot_args, srcdir, [template for template, entry in batch])
+
+    with ThreadPoolExecutor(max_workers=min(len(batches), max_workers)) as pool:
+        for batch, svgs in zip(batches, pool.map(render_batch, batches)):
+            for (template, (dot_args, cache_fn, outputs)), svg in zip(batch, svgs):
+                if isinstance(svg, Exception):
+                    logger.warning('dot code %r: %s', template, svg)
+                    continue
+
+                inheritance_cache_stats['misses'] += 1
+                write_file_atomic(cache_fn, svg)
+                for outfn, substitutions, fixup in outputs:
+                    write_inheritance_svg(svg, outfn, substitutions, fixup)
+
+
+class InheritanceWriterTasks(ParallelTasks):
+    """The ParallelTasks that the builder writes the pages with when building
+    with -j, see write_parallel.  When a forked writer is done with its pages,
+    it renders the diagrams it queued up for them, and sends back the counts
+    along with the result of the task."""
+
+    def add_task(self, task_func, arg=None, result_func=None):
+        def task(*args):
+            before = dict(inheritance_cache_stats)
+            used_before = {docname: set(names) for docname, names in inheritance_cache_used.items()}
+            try:
+                ret = task_func(*args)
+            finally:
+                # The pages referring to the diagrams have been written, even
+                # if the task failed halfway.
+                flush_inheritance_queue(inheritance_srcdir, 1)
+            counts = {key: inheritance_cache_stats[key] - before[key] for key in before}
+            used = {docname: names - used_before.get(docname, set())
+                    for docname, names in inheritance_cache_used.items()}
+            return ret, counts, used
+
+        def on_result(arg, result):
+            ret, counts, used = result
+            for key, count in counts.items():
+                inheritance_cache_stats[key] += count
+            for docname, names in used.items():
+                if names:
+                    inheritance_cache_used.setdefault(docname, set()).update(names)
+            if result_func:
+                result_func(arg, ret)
+
+        return super().add_task(task, arg, on_result)
+
+
+def write_parallel(write_parallel_orig, docnames, nproc):
+    # Replacement for the _write_parallel method of the builder, which has the
+    # pages written by an InheritanceWriterTasks instead.  It creates its
+    # tasks from this module global, which is only swapped out while writing,
+    # so that the other parallel tasks are left alone.
+    from sphinx import builders
+
+    tasks_class = builders.ParallelTasks
+    builders.ParallelTasks = InheritanceWriterTasks
+    try:
+        return write_parallel_orig(docnames, nproc)
+    finally:
+        builders.ParallelTasks = tasks_class
+
+
+def on_doctree_resolved_inheritance(app, doctree, docname):
+    # This is called in the main process for every page that is written.
+    inheritance_written_docs.add(docname)
+
+
+def on_build_finished_inheritance(app, exception):
+    # Render the queued inheritance diagrams.  This is done even if the build
+    # failed, since the pages referring to them may have been written already.
+    flush_inheritance_queue(app.srcdir, os.cpu_count() or 1)
+
+    stats = inheritance_cache_stats
+    if stats['hits'] or stats['misses']:
+        logger.info('inheritance diagrams: %d rendered, %d taken from cache',
+                    stats['misses'], stats['hits'])
+
+    if exception or not inheritance_written_docs:
+        return
+
+    # Update the index of the cache files used by each document with the pages
+    # written in this build, and delete the files that none of them use.
+    cache_dir = os.path.join(app.doctreedir, 'inheritance')
+    index_fn = os.path.join(cache_dir, 'index.json')
+    try:
+        with open(index_fn, 'r') as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        index = {}
+
+    for docname in inheritance_written_docs:
+        names = inheritance_cache_used.get(docname)
+        if names:
+            index[docname] = sorted(names)
+        else:
+            index.pop(docname, None)
+
+    # Fast builds leave out the documents with the diagrams, so those keep
+    # their entries.
+    if options.build_api_reference:
+        for docname in list(index):
+            if docname not in app.env.all_docs:
+                del index[docname]
+
+    used_names = set()
+    for names in index.values():
+        used_names.update(names)
+
+    try:
+        cached_names = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    for name in cached_names:
+        if name.endswith('.svg') and name not in used_names:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    write_file_atomic(index_fn, json.dumps(index, sort_keys=True).encode('utf-8'))
+
+
+def setup(app):
+    # This is patched on the class rather than using a subclass, since the
+    # graphs are pickled along with the doctrees.  Forked parallel workers
+    # inherit the patch.
+    from sphinx.ext.inheritance_diagram import InheritanceGraph
+    InheritanceGraph._class_info = profiled('class_info', class_info)
+    InheritanceGraph.generate_dot = profiled('generate_dot', generate_dot)
+
+    # Same goes for the rendering, which is looked up in this module by the
+    # HTML visitor of the inheritance diagrams.
+    global render_dot_uncached
+    from sphinx.ext import graphviz
+    render_dot_uncached = graphviz.render_dot
+    graphviz.render_dot = render_dot
+
+    connect_hook(app, 'builder-inited', on_builder_inited_inheritance)
+    connect_hook(app, 'doctree-resolved', on_doctree_resolved_inheritance)
+    connect_hook(app, 'build-finished', on_build_finished_inheritance)
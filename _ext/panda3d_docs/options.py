@@ -0,0 +1,21 @@
+"""Which parts of the manual are built.  conf.py imports these to set up the
+build accordingly, and the hooks check them to do their part."""
+
+import os
+
+# Set the PANDA3D_DOCS_FAST environment variable to 1 to leave out the API
+# reference, which takes up most of the build time.  The references to it are
+# resolved through the inventory written by the last full build instead.
+fast_build = os.environ.get('PANDA3D_DOCS_FAST', '') not in ('', '0', 'false')
+
+build_api_reference = not fast_build
+
+if build_api_reference:
+    try:
+        import panda3d.interrogatedb  # noqa: F401
+        import sphinx_interrogatedb  # noqa: F401
+    except ImportError as ex:
+        print("Could not import Panda3D modules:")
+        print(ex)
+        print("Skipping building building the API reference.")
+        build_api_reference = False
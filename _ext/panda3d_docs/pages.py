@@ -0,0 +1,117 @@
+"""Absolute URLs for the pages of the website, and the map of the pages that
+the version switcher looks up the current page in."""
+
+import json
+import os
+
+from .profiling import connect_hook
+from .util import write_file_atomic
+
+
+def on_builder_inited(app):
+    root = app.config.html_absolute_url_root + app.config.version + '/'
+    app.builder.get_relative_uri = \
+        lambda from_, to, typ=None: root + app.builder.get_target_uri(to, typ)
+
+
+def on_html_page_context(app, pagename, templatename, context, doctree):
+    def pathto(otheruri, resource=False, baseuri=None):
+        if resource and '://' in otheruri:
+            # allow non-local resources given by scheme
+            return otheruri
+
+        if not resource:
+            otheruri = app.builder.get_target_uri(otheruri)
+
+        if baseuri is None:
+            baseuri = app.config.html_absolute_url_root + app.config.version + '/'
+
+        if not baseuri.startswith('/'):
+            raise ValueError('"baseuri" must be absolute')
+
+        if not otheruri.startswith('/'):
+            otheruri = '/' + otheruri
+
+        if otheruri:
+            if baseuri.endswith('/'):
+                baseuri = baseuri[:-1]
+            otheruri = baseuri + otheruri
+
+        uri = otheruri or '#'
+        return uri
+
+    context['pathto'] = pathto
+
+
+def on_config_inited(app, config):
+    if config.html_absolute_url_root:
+        connect_hook(app, 'builder-inited', on_builder_inited)
+        connect_hook(app, 'html-page-context', on_html_page_context)
+
+        # This normally runs before our hook, so it still picks up the old
+        # pathto, hence we need to register it again
+        from sphinx.builders.html import setup_js_tag_helper
+        connect_hook(app, 'html-page-context', setup_js_tag_helper)
+
+    # Used in searchbox.html.
+    if config.html_link_suffix is not None:
+        config.html_context['link_suffix'] = config.html_link_suffix
+    elif config.html_file_suffix is not None:
+        config.html_context['link_suffix'] = config.html_file_suffix
+    else:
+        config.html_context['link_suffix'] = '.html'
+
+
+# versions.js switches to the same page in another version, or to the index
+# of the nearest section that it exists in there.  To know which pages exist
+# without trying them, it loads _pages.json from the root of that version,
+# which holds the sorted get_page_hash values of the paths of all the pages
+# as they appear in links (ie. with the link suffix, which is empty on the
+# website), each stored as the difference from the previous one, along with
+# that suffix.
+page_map_skip_dirs = ('_static', '_images', '_sources', '_downloads', '_search')
+
+
+def get_page_hash(path):
+    # 32-bit FNV-1a of the UTF-16 code units, the same as getPageHash in
+    # versions.js.
+    data = path.encode('utf-16-be')
+    hash = 0x811c9dc5
+    for i in range(0, len(data), 2):
+        hash = ((hash ^ (data[i] << 8 | data[i + 1])) * 16777619) & 0xffffffff
+    return hash
+
+
+def on_build_finished_page_map(app, exception):
+    if exception or app.builder.format != 'html':
+        return
+
+    out_suffix = app.builder.out_suffix
+    link_suffix = app.builder.link_suffix
+
+    hashes = set()
+    for dirpath, dirnames, filenames in os.walk(app.outdir):
+        if dirpath == app.outdir:
+            dirnames[:] = [dir for dir in dirnames if not dir.startswith('.') and dir not in page_map_skip_dirs]
+
+        reldir = os.path.relpath(dirpath, app.outdir).replace(os.path.sep, '/')
+        for filename in filenames:
+            if filename.endswith(out_suffix):
+                page = filename[:-len(out_suffix)] + link_suffix
+                hashes.add(get_page_hash(page if reldir == '.' else reldir + '/' + page))
+
+    deltas = []
+    last = 0
+    for hash in sorted(hashes):
+        deltas.append(hash - last)
+        last = hash
+
+    data = json.dumps({'suffix': link_suffix, 'hashes': deltas}, separators=(',', ':'))
+    write_file_atomic(os.path.join(app.outdir, '_pages.json'), data.encode('utf-8'))
+
+
+def setup(app):
+    app.add_config_value('html_absolute_url_root', None, 'html')
+    app.connect('config-inited', on_config_inited)
+
+    connect_hook(app, 'build-finished', on_build_finished_page_map)
@@ -0,0 +1,154 @@
+"""Profiling of the build, which times the hooks of this extension as well as
+some of the expensive parts of Sphinx itself."""
+
+import functools
+import json
+import os
+import time
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Set by on_config_inited_profile if the build_profile config value (or the
+# PANDA3D_DOCS_PROFILE environment variable) is set.  Maps the name of each
+# timed hook to a dict with its call count, total time and time per label.
+profile_stats = None
+profile_start_time = None
+
+# Functions that extract a label (a docname or object name) from the arguments
+# of a hook, for finding out which pages or objects are the most expensive.
+profile_labels = {
+    'autodoc-process-docstring': lambda app, what, name, *args: name,
+    'autodoc-skip-member': lambda app, what, name, *args: name,
+    'missing-reference': lambda app, env, node, contnode: node.get('refdoc', env.docname),
+    'html-page-context': lambda app, pagename, *args: pagename,
+    'env-merge-info': lambda app, env, docnames, other: None,
+    'class_info': lambda self, *args, **kwargs: ' '.join(self.class_names),
+    'generate_dot': lambda self, name, *args, **kwargs: name,
+    'autosummary': lambda name, *args, **kwargs: name,
+    'index_page': lambda self, pagename, *args: pagename,
+    'graphviz': lambda self, *args, **kwargs: getattr(self.builder, 'current_docname', None),
+    'pygments': lambda self, source, lang, *args, **kwargs: getattr(kwargs.get('location'), 'source', None) or lang,
+}
+
+
+def profile_record(key, label, elapsed):
+    stats = profile_stats.get(key)
+    if stats is None:
+        stats = {'calls': 0, 'time': 0.0, 'labels': {}}
+        profile_stats[key] = stats
+
+    stats['calls'] += 1
+    stats['time'] += elapsed
+    if label is not None:
+        stats['labels'][label] = stats['labels'].get(label, 0.0) + elapsed
+
+
+def profiled(key, func, label_key=None):
+    """Returns a wrapper around func that records the time spent in it under
+    the given key when profiling is enabled, and otherwise just calls it."""
+
+    get_label = profile_labels.get(label_key or key)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if profile_stats is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if get_label:
+                label = get_label(*args, **kwargs)
+            else:
+                # Fall back to the document being read, if any.
+                env = getattr(args[0], 'env', None)
+                label = env.temp_data.get('docname') if env else None
+            profile_record(key, label, elapsed)
+
+    return wrapper
+
+
+def connect_hook(app, event, callback, priority=500):
+    """Like app.connect, but times the callback if profiling is enabled."""
+
+    key = '{0}: {1}'.format(event, callback.__name__)
+    return app.connect(event, profiled(key, callback, event), priority=priority)
+
+
+def on_config_inited_profile(app, config):
+    global profile_stats, profile_start_time
+
+    if not config.build_profile or config.build_profile in ('0', 'false'):
+        return
+
+    profile_stats = {}
+    profile_start_time = time.perf_counter()
+
+    if app.parallel > 1:
+        logger.warning('profiling only covers the main process; build without '
+                       '-j for complete numbers')
+
+    # Also time some of the expensive parts of Sphinx itself.  These are
+    # looked up as module globals at call time, so patching them suffices.
+    from sphinx.ext.autosummary import generate
+    generate.generate_autosummary_content = profiled(
+        'autosummary: generate_autosummary_content',
+        generate.generate_autosummary_content, 'autosummary')
+
+    from sphinx.ext import graphviz
+    graphviz.render_dot = profiled('graphviz: render_dot', graphviz.render_dot, 'graphviz')
+
+    from sphinx.highlighting import PygmentsBridge
+    PygmentsBridge.highlight_block = profiled(
+        'pygments: highlight_block', PygmentsBridge.highlight_block, 'pygments')
+
+
+def on_build_finished_profile(app, exception):
+    if profile_stats is None:
+        return
+
+    hooks = []
+    for key, stats in profile_stats.items():
+        worst = sorted(stats['labels'].items(), key=lambda item: item[1], reverse=True)
+        hooks.append({
+            'name': key,
+            'calls': stats['calls'],
+            'time': stats['time'],
+            'worst': [{'label': label, 'time': elapsed} for label, elapsed in worst[:20]],
+        })
+    hooks.sort(key=lambda hook: hook['time'], reverse=True)
+
+    report = {
+        'builder': app.builder.name,
+        'total_time': time.perf_counter() - profile_start_time,
+        'hooks': hooks,
+    }
+
+    path = app.config.build_profile
+    if path in (True, '1', 'true'):
+        path = os.path.join(app.doctreedir, 'profile.json')
+    else:
+        path = os.path.join(app.confdir, path)
+
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2)
+
+    logger.info('')
+    logger.info('build profile (%.1f s total), written to %s:', report['total_time'], path)
+    for hook in hooks[:15]:
+        line = '%9.3f s %8d calls  %s' % (hook['time'], hook['calls'], hook['name'])
+        if hook['worst']:
+            line += ' (worst: %s)' % (hook['worst'][0]['label'])
+        logger.info(line)
+
+
+def setup(app):
+    # Set this to 1 (or a file name) to write a profile of the build.
+    app.add_config_value('build_profile', os.environ.get('PANDA3D_DOCS_PROFILE'), '')
+    app.connect('config-inited', on_config_inited_profile, priority=100)
+    app.connect('build-finished', on_build_finished_profile, priority=999)
@@ -0,0 +1,203 @@
+"""Checks the redirects of the pages that were moved or removed, and writes
+them out for the 404 page, as well as redirecting pages if requested."""
+
+import html
+import json
+import os
+import posixpath
+
+from sphinx.util import logging
+
+from .profiling import connect_hook
+from .util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# _static/redirects.json maps the names of pages that were moved or removed
+# to the pages replacing them, optionally with an anchor.  An entry whose name
+# ends in a slash moves a whole directory: every page under it redirects to
+# the same path under the target directory, unless it has an entry of its own.
+#
+# When the pages are built, on_build_finished_redirects checks the entries
+# against the pages that exist, follows the entries that lead to other entries
+# and replaces the copy of redirects.json in the output with the result.  A
+# directory entry only adds an entry for its index page there, since the other
+# pages under the target directory need not have existed under the old one;
+# those are left to the 404 page.  It also writes the entries as a trie of their
+# path components to _static/redirect-trie.json, which redirects.js looks up
+# the path of the 404 page in.  Each node holds the nodes of the next
+# components, the target of the page by that path under '=', and the target
+# of the directory by that path under '*'.
+#
+# Setting html_redirect_stubs also writes a page for every expanded entry that
+# redirects to its target, so that those don't have to go by the 404 page.
+redirect_stubs_manifest = 'redirect-stubs.json'
+
+redirect_stub_template = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<title>Redirecting...</title>
+<link rel="canonical" href="{url}" />
+<meta http-equiv="refresh" content="0; url={href}" />
+<script type="text/javascript">location.replace({script});</script>
+</head>
+<body>
+<p>This page has moved <a href="{href}">here</a>.</p>
+</body>
+</html>
+'''
+
+
+def lookup_redirect(redirects, path):
+    """Returns the target of the entry for the given path, or else that of the
+    entry for the innermost directory containing it, or None."""
+
+    target = redirects.get(path)
+    if target is not None:
+        return target
+
+    parts = path.split('/')
+    for i in range(len(parts) - 1, 0, -1):
+        target = redirects.get('/'.join(parts[:i]) + '/')
+        if target is not None:
+            return target + '/'.join(parts[i:])
+
+
+def resolve_redirect(redirects, docnames, dirnames, path):
+    """Follows the entries from the given path to an existing page or directory
+    and returns it, along with the anchor given by the last entry that has one.
+    Raises ValueError if it doesn't get there."""
+
+    anchor = ''
+    # Entries may redirect into their own directory, so it can't just stop at
+    # the first path it has seen before.
+    for i in range(len(redirects)):
+        target = lookup_redirect(redirects, path)
+        if target is None:
+            raise ValueError('%s does not exist' % (path))
+
+        path, sep, next_anchor = target.partition('#')
+        anchor = next_anchor or anchor
+        if path in docnames or path in dirnames:
+            return path + '#' + anchor if anchor else path
+
+    raise ValueError('the redirects go around in circles')
+
+
+def write_redirect_stubs(app, redirects):
+    variations = [variation[0] + '/' for variation in getattr(app.config, 'variations', ())] or ['']
+    canonical_url = app.config.html_context.get('theme_canonical_url')
+    out_suffix = app.builder.out_suffix
+    link_suffix = app.builder.link_suffix
+
+    stubs = set()
+    if app.config.html_redirect_stubs:
+        for source, target in redirects.items():
+            docname, sep, anchor = target.partition('#')
+            href = posixpath.relpath(docname, posixpath.dirname(source) or '.') + link_suffix + sep + anchor
+            script = json.dumps(href) + ('' if anchor else ' + location.hash')
+
+            for variation in variations:
+                url = (canonical_url + variation + docname + link_suffix + sep + anchor) if canonical_url else href
+                stub = redirect_stub_template.format(url=html.escape(url), href=html.escape(href),
+                                                     script=script.replace('</', '<\\/'))
+                filename = variation + source + out_suffix
+                write_file_atomic(os.path.join(app.outdir, filename), stub.encode('utf-8'))
+                stubs.add(filename)
+
+    # Remove the ones of the entries that are gone since the last build.
+    manifest_path = os.path.join(app.doctreedir, redirect_stubs_manifest)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as fh:
+            old_stubs = json.load(fh)
+    except (OSError, ValueError):
+        old_stubs = []
+
+    for filename in old_stubs:
+        if filename not in stubs:
+            try:
+                os.remove(os.path.join(app.outdir, filename))
+            except OSError:
+                pass
+
+    if stubs or old_stubs:
+        data = json.dumps(sorted(stubs), indent=0)
+        write_file_atomic(manifest_path, data.encode('utf-8'))
+
+
+def on_build_finished_redirects(app, exception):
+    if exception or app.builder.format != 'html':
+        return
+
+    try:
+        with open(os.path.join(app.confdir, '_static', 'redirects.json'), 'r', encoding='utf-8') as fh:
+            entries = json.load(fh)
+    except OSError:
+        return
+
+    docnames = app.env.found_docs
+    dirnames = set()
+    for docname in docnames:
+        parts = docname.split('/')
+        for i in range(1, len(parts)):
+            dirnames.add('/'.join(parts[:i]) + '/')
+
+    redirects = {}
+    for source, target in entries.items():
+        if source.endswith('/') != target.endswith('/') or (source.endswith('/') and '#' in target):
+            logger.warning('redirect from %s to %s: a directory must redirect to a directory', source, target)
+        elif source in docnames:
+            logger.warning('redirect from %s to %s: %s still exists', source, target, source)
+        else:
+            redirects[source] = target
+
+    resolved = {}
+    for source in redirects:
+        try:
+            resolved[source] = resolve_redirect(redirects, docnames, dirnames, source)
+        except ValueError as ex:
+            logger.warning('redirect from %s to %s: %s', source, redirects[source], ex)
+
+    trie = {}
+    for source, target in resolved.items():
+        node = trie
+        for part in source.rstrip('/').split('/'):
+            node = node.setdefault(part, {})
+        node['*' if source.endswith('/') else '='] = target
+
+    data = json.dumps({
+        'variations': [variation[0] for variation in getattr(app.config, 'variations', ())],
+        'trie': trie,
+    }, separators=(',', ':'), sort_keys=True)
+    write_file_atomic(os.path.join(app.outdir, '_static', 'redirect-trie.json'), data.encode('utf-8'))
+
+    # Add the index pages of the directories, the innermost ones first, since
+    # those are the ones that lookup_redirect finds first.
+    flat = {source: target for source, target in resolved.items() if not source.endswith('/')}
+    for source in sorted(resolved, key=len, reverse=True):
+        target = resolved[source]
+        if source.endswith('/') and target + 'index' in docnames and source + 'index' not in docnames:
+            flat.setdefault(source + 'index', target + 'index')
+
+    data = json.dumps(flat, indent=4)
+    write_file_atomic(os.path.join(app.outdir, '_static', 'redirects.json'), data.encode('utf-8'))
+
+    write_redirect_stubs(app, flat)
+
+
+def on_html_page_context_redirects(app, pagename, templatename, context, doctree):
+    # Only the 404 page needs this.  The list is shared by all the pages, so it
+    # is replaced rather than appended to, and old-style entries by path are
+    # understood by js_tag in all versions of Sphinx.
+    if pagename == '404':
+        context['script_files'] = context['script_files'] + ['_static/redirects.js']
+
+
+def setup(app):
+    # Set this to write a page redirecting to the target of every redirect.
+    app.add_config_value('html_redirect_stubs', False, '')
+
+    connect_hook(app, 'html-page-context', on_html_page_context_redirects)
+    connect_hook(app, 'build-finished', on_build_finished_redirects)
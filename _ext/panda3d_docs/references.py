@@ -0,0 +1,327 @@
+"""Resolves the references to the API reference that the domains can't, such
+as those by the snake_case or camelCase name of a method, linking to either the
+Python or the C++ reference depending on the variation.  Fast builds resolve
+them through an inventory written by the last full build."""
+
+import os
+import pickle
+import time
+
+from docutils import nodes
+from sphinx.util import logging
+from sphinx.util.nodes import make_refnode
+
+from . import options
+from .profiling import connect_hook
+from .symbols import idb, resolve_reference
+from .util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# Built-in variables automatically resolved in references.
+builtins_types = {
+    'base': 'direct.showbase.ShowBase.ShowBase',
+    'render': 'panda3d.core.NodePath',
+    'render2d': 'panda3d.core.NodePath',
+    'aspect2d': 'panda3d.core.NodePath',
+    'pixel2d': 'panda3d.core.NodePath',
+    'hidden': 'panda3d.core.NodePath',
+    'loader': 'direct.showbase.Loader.Loader',
+    'taskMgr': 'direct.task.Task.TaskManager',
+    'jobMgr': 'direct.showbase.JobManager.JobManager',
+    'eventMgr': 'direct.showbase.EventManager.EventManager',
+    'messenger': 'direct.showbase.Messenger.Messenger',
+    'bboard': 'direct.showbase.BulletinBoard.BulletinBoard',
+    'ostream': 'panda3d.core.Ostream',
+    'globalClock': 'panda3d.core.ClockObject',
+    'vfs': 'panda3d.core.VirtualFileSystem',
+    'cpMgr': 'panda3d.core.ConfigPageManager',
+    'cvMgr': 'panda3d.core.ConfigVariableManager',
+    'pandaSystem': 'panda3d.core.PandaSystem',
+}
+
+
+# Shared by all pages and variations, since the same unresolvable targets tend
+# to come up over and over again.  Maps (target, reftype, domain) to the result
+# of lookup_missing_reference, including None for failed lookups.
+missing_reference_cache = {}
+missing_reference_stats = {'hits': 0, 'misses': 0, 'unresolved': 0, 'time': 0.0}
+
+
+def lookup_missing_reference(target, typ, domain):
+    """Does the part of on_missing_reference that depends only on the target,
+    the reference type and the domain name.  Returns None if the reference
+    can't be resolved, (None, target) if it is a built-in that should be
+    looked up as-is, or else (resolved, target), where resolved is the result
+    of resolve_reference and target is the name relative to the module."""
+
+    # Figure out which part is the module and which part is the class.
+    module = 'panda3d.core'
+    if target.startswith('panda3d.'):
+        parts = target.split('.', 2)
+        if len(parts) == 2:
+            # It's trying to resolve a reference to a module; we can't help
+            # with that.
+            return None
+
+        module = '.'.join(parts[:2])
+        target = '.'.join(parts[2:])
+    else:
+        # Something like .core.NodePath, perhaps?
+        modpart = target.split('.', 1)[0]
+        if '.' in target and modpart in builtins_types and domain == 'py':
+            # It's actually the name of a built-in.
+            target = builtins_types[modpart] + '.' + target.split('.', 1)[1]
+            if target.startswith('panda3d.'):
+                parts = target.split('.', 2)
+                module = '.'.join(parts[:2])
+                target = '.'.join(parts[2:])
+            else:
+                return (None, target)
+        elif options.build_api_reference and idb.has_module('panda3d.' + modpart):
+            module = 'panda3d.' + modpart
+            target = target.split('.', 1)[1]
+
+    resolved = target and resolve_reference(target, module, domain=domain)
+
+    if resolved and (resolved[0] == typ or typ == 'obj'):
+        return (resolved, target)
+
+    return None
+
+
+def on_missing_reference(app, env, node, contnode):
+    # Resolver for interrogate classes that supports either snake case or camel
+    # case naming.  Depending on the variation that is active, it will link to
+    # either the Python or C++ reference as appropriate.
+
+    target = node['reftarget']
+
+    variation = getattr(env.app.builder, 'current_variation', None)
+    if variation and variation[0] == 'cpp':
+        domain = env.domains['cpp']
+    else:
+        domain = env.domains['py']
+
+    typ = node['reftype']
+    if domain.name == 'cpp' and typ == 'meth':
+        # C++ domain doesn't have "meth", everything is "func" there.
+        typ = 'func'
+
+    key = (target, typ, domain.name)
+    try:
+        result = missing_reference_cache[key]
+        missing_reference_stats['hits'] += 1
+    except KeyError:
+        start = time.perf_counter()
+        if options.build_api_reference:
+            result = lookup_missing_reference(target, typ, domain.name)
+        else:
+            result = lookup_inventory_reference(target, typ, domain)
+        missing_reference_stats['time'] += time.perf_counter() - start
+        missing_reference_stats['misses'] += 1
+        if result is None:
+            missing_reference_stats['unresolved'] += 1
+        missing_reference_cache[key] = result
+
+    if result is None:
+        return
+
+    resolved, target = result
+    refdoc = node.get('refdoc', env.docname)
+
+    if resolved is None:
+        return domain.resolve_xref(env, refdoc, app.builder, typ, target, node, contnode)
+
+    # Try to match the original, but with the canonical mangling
+    # (depending on Python versus C++)
+    if len(contnode.children) and not node.get('refexplicit'):
+        oldtext = contnode.children[0].astext()
+
+        text = resolved[1]
+        if domain.name == 'cpp':
+            text = '::'.join(text.split('::')[-oldtext.replace('.', '::').count('.') - 1:])
+        else:
+            text = '.'.join(text.split('.')[-oldtext.count('.') - 1:])
+
+        if oldtext.endswith("()"):
+            text += "()"
+
+        contnode.children[0] = nodes.Text(text)
+
+    elif domain.name == 'cpp':
+        # Work around a bug in the C++ resolver, which expects this
+        # text node to be the child of an Element.  I picked a
+        # decoration element since it happens not to translate to
+        # anything (not sure what its purpose is).
+        if isinstance(contnode, nodes.Text):
+            contnode = nodes.decoration('', contnode)
+
+    elif domain.name == 'py' and len(contnode.children) and node.get('refexplicit'):
+        # Custom text was used.  Replace snake_case with camelCase in it.
+        # This allows doing something like:
+        # :meth:`model.set_color() <.NodePath.set_color>`
+        # ..and still have it translate to the correct casing.
+        oldpart = target.rsplit('.', 1)[-1]
+        newpart = resolved[1].rsplit('.', 1)[-1]
+        if oldpart != newpart:
+            text = contnode.children[0].astext()
+            text = text.replace('::', '.')
+            text = text.replace('.' + oldpart + '(', '.' + newpart + '(')
+            if text.startswith(oldpart + '('):
+                text = newpart + text[len(oldpart):]
+            contnode.children[0] = nodes.Text(text)
+
+    # C++ references don't have a module prefix and use :: for scoping
+    if domain.name == 'cpp':
+        target = resolved[1]
+        if typ == 'obj':
+            # Another bug workaround
+            typ = resolved[0]
+        if typ in ('enum', 'class', 'struct', 'union') and resolved[0] == 'type':
+            # Squelch warning
+            typ = resolved[0]
+    else:
+        target = resolved[1]
+
+    if not options.build_api_reference:
+        # The page is not part of this build, so the domain can't find it.
+        objtype, docname, anchor = api_inventory[domain.name][target]
+        return make_refnode(app.builder, refdoc, docname, anchor, contnode, target)
+
+    return domain.resolve_xref(env, refdoc, app.builder, typ, target, node, contnode)
+
+
+def on_build_finished_missing_reference(app, exception):
+    stats = missing_reference_stats
+    if stats['hits'] or stats['misses']:
+        logger.info('missing references: %d lookups, %d cached, %d distinct '
+                    'targets (%d unresolvable), %.2f s spent resolving',
+                    stats['hits'] + stats['misses'], stats['hits'],
+                    stats['misses'], stats['unresolved'], stats['time'])
+
+
+# Written by full builds, for fast builds to resolve the references to the API
+# reference with.  Like objects.inv, this maps the name of each object in the
+# py and cpp domains to its type, page and anchor, by domain.  The index maps
+# the normalized names, see get_api_inventory_key, and every part of them
+# after a dot, to the names, so that the targets can be looked up the way
+# resolve_reference would find them.
+api_inventory = {}
+api_inventory_index = {}
+
+
+def get_api_inventory_path(app):
+    return os.path.join(app.doctreedir, 'api-inventory.pickle')
+
+
+def get_api_inventory_key(name):
+    # Methods are referenced by both their snake_case and camelCase names.
+    return name.replace('::', '.').replace('_', '').lower()
+
+
+def get_api_inventory_index(domain):
+    index = api_inventory_index.get(domain)
+    if index is None:
+        # Put the shortest names first, so that eg. panda3d.core is preferred.
+        index = {}
+        for name in sorted(api_inventory.get(domain, ()), key=lambda name: (name.replace('::', '.').count('.'), name)):
+            parts = get_api_inventory_key(name).split('.')
+            for i in range(len(parts)):
+                index.setdefault('.'.join(parts[i:]), []).append(name)
+        api_inventory_index[domain] = index
+    return index
+
+
+def lookup_inventory_reference(target, typ, domain):
+    """Stands in for lookup_missing_reference when building without the API
+    reference.  Returns None if the target is not in the inventory, or else
+    ((type, name), name) with the name of the object in it."""
+
+    objects = api_inventory.get(domain.name)
+    if not objects:
+        return None
+
+    modpart = target.split('.', 1)[0]
+    if '.' in target and modpart in builtins_types and domain.name == 'py':
+        target = builtins_types[modpart] + '.' + target.split('.', 1)[1]
+
+    objtypes = domain.objtypes_for_role(typ)
+    for name in get_api_inventory_index(domain.name).get(get_api_inventory_key(target), ()):
+        objtype = objects[name][0]
+        if not objtypes or objtype in objtypes:
+            return ((objtype, name), name)
+
+    return None
+
+
+def on_missing_reference_api_inventory(app, env, node, contnode):
+    # Resolves the Python references the way the domain would have, if the API
+    # reference were part of the build, before on_missing_reference has a go.
+    objects = api_inventory.get('py')
+    if node.get('refdomain') != 'py' or not objects:
+        return
+
+    target = node['reftarget']
+    modname = node.get('py:module')
+    clsname = node.get('py:class')
+    names = [target]
+    if modname:
+        names.insert(0, modname + '.' + target)
+        if clsname:
+            names.insert(0, modname + '.' + clsname + '.' + target)
+
+    name = next((name for name in names if name in objects), None)
+    if name is None and node.get('refspecific'):
+        objtypes = env.get_domain('py').objtypes_for_role(node['reftype'])
+        for candidate in get_api_inventory_index('py').get(get_api_inventory_key(target), ()):
+            if candidate.endswith('.' + target) and objects[candidate][0] in objtypes:
+                name = candidate
+                break
+
+    if name is not None:
+        objtype, docname, anchor = objects[name]
+        return make_refnode(app.builder, node.get('refdoc', env.docname), docname, anchor, contnode, name)
+
+
+def on_builder_inited_api_inventory(app):
+    global api_inventory
+
+    api_inventory = {}
+    api_inventory_index.clear()
+
+    path = get_api_inventory_path(app)
+    try:
+        with open(path, 'rb') as fh:
+            api_inventory = pickle.load(fh)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        if options.fast_build:
+            logger.warning('API inventory %s couldn\'t be loaded, so the references '
+                           'to the API reference will not be resolved; do a full '
+                           'build first to write it.', path)
+
+
+def on_build_finished_api_inventory(app, exception):
+    if exception:
+        return
+
+    inventory = {}
+    for name in ('py', 'cpp'):
+        # Overloaded C++ functions resolve to the first one.
+        objects = inventory[name] = {}
+        for fullname, dispname, objtype, docname, anchor, priority in app.env.get_domain(name).get_objects():
+            objects.setdefault(fullname, (objtype, docname, anchor))
+
+    write_file_atomic(get_api_inventory_path(app), pickle.dumps(inventory, pickle.HIGHEST_PROTOCOL))
+
+
+def setup(app):
+    connect_hook(app, 'missing-reference', on_missing_reference, priority=901)
+    connect_hook(app, 'build-finished', on_build_finished_missing_reference)
+
+    if options.build_api_reference:
+        connect_hook(app, 'build-finished', on_build_finished_api_inventory)
+    else:
+        connect_hook(app, 'builder-inited', on_builder_inited_api_inventory)
+        connect_hook(app, 'missing-reference', on_missing_reference_api_inventory, priority=900)
@@ -0,0 +1,609 @@
+"""Splits up the search index into shards that the search page loads as
+needed, with an index of its own for each variation, and writes the excerpts
+of the pages that the search results are summarized with."""
+
+import json
+import os
+import pickle
+import types
+from collections import Counter
+
+from docutils import nodes
+from sphinx.util import logging
+
+from .profiling import connect_hook, profiled
+from .util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# The search page does not load the searchindex.js written by Sphinx, which
+# holds the whole index (Sphinx also reads it back on incremental builds).
+# Instead, on_build_finished_search_index splits it up into these files under
+# _search/index/, of which searchtools.js only loads the ones a query needs
+# (when building with variations, each has its own, see below):
+#
+#   manifest.js     everything but the terms and objects, and the number of
+#                   shards of each of the following kinds
+#   terms-N.js      the terms and titleterms, by their first two characters
+#   partial-N.js    suffix arrays for finding the terms that contain a word,
+#                   by the first two characters of the suffix
+#   objects-N.js    the objects, by namespace
+#   trigrams-N.js   which objects shards have full names containing each
+#                   sequence of three characters
+#
+# Keys are assigned to shards by get_search_shard, and the number of shards
+# is chosen to make them about search_shard_size bytes each.
+search_shard_size = 48 * 1024
+
+# With the search_index_format config value set to 'binary', the docnames,
+# titles, filenames and doclengths move from the manifest into a docs-0
+# shard, and every shard is also written in a compact binary form to a .bin
+# file next to the .js one.  searchtools.js then loads and decodes those
+# instead, falling back to the scripts when it can't (eg. for local files).
+# See encode_search_shard for the format, and benchmarks/searchindex.html to
+# compare the two.
+search_binary_magic = b'P3SI\x01'
+
+
+def utf16_key(string):
+    # Sort key that orders strings the way JavaScript compares them.
+    return string.encode('utf-16-be')
+
+
+def get_search_shard(key, num_shards):
+    # Must give the same result as Search.getShard in searchtools.js, which
+    # hashes UTF-16 code units.
+    data = key.encode('utf-16-be')
+    hash = 0
+    for i in range(0, len(data), 2):
+        hash = (hash * 31 + (data[i] << 8 | data[i + 1])) % 4294967296
+    return hash % num_shards
+
+
+def get_search_shard_count(size):
+    return max(1, -(-size // search_shard_size))
+
+
+def dump_search_json(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def write_search_shards(app, name, shards, kind=None):
+    """Writes the given list of dicts to _search/<name>-<n>.js, as scripts
+    calling Search.addShard, so that they can also be loaded from local files
+    (the same way as searchindex.js).  If the kind of shard is given, they are
+    also written to .bin files with encode_search_shard.  Shards left over
+    from an earlier build with more of them are removed."""
+
+    for i, shard in enumerate(shards):
+        shard_name = '%s-%d' % (name, i)
+        data = 'Search.addShard(%s,%s)' % (json.dumps(shard_name), dump_search_json(shard))
+        write_file_atomic(os.path.join(app.outdir, '_search', shard_name + '.js'), data.encode('utf-8'))
+
+        path = os.path.join(app.outdir, '_search', shard_name + '.bin')
+        if kind:
+            write_file_atomic(path, encode_search_shard(kind, shard))
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    i = len(shards)
+    while os.path.isfile(os.path.join(app.outdir, '_search', '%s-%d.js' % (name, i))):
+        for ext in ('.js', '.bin'):
+            path = os.path.join(app.outdir, '_search', '%s-%d%s' % (name, i, ext))
+            if os.path.isfile(path):
+                os.remove(path)
+        i += 1
+
+
+def encode_varint(value, out):
+    # Unsigned LEB128, as read by Search.decodeShard.
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_search_shard(kind, shard):
+    """Returns the given shard of the search index in the binary format that
+    Search.decodeShard in searchtools.js reads.  It starts with
+    search_binary_magic and a table of the strings that the rest refers to by
+    index: its length in bytes, then the strings in UTF-8, separated by null
+    characters.  All numbers are unsigned LEB128 varints, and lists of them
+    are preceded by their length, with sorted lists delta-encoded.  The rest
+    depends on the kind of shard:
+
+      docs      the number of documents, then the docname and title of each,
+                and its filename: 0 if it is the docname plus the first
+                string, or else the string plus one; then the list of
+                doclengths, which is empty if there are none
+      terms     for the terms and then the titleterms, their number, then
+                each term and its sorted list of documents
+      partial   the number of terms in the termlist, which takes up the
+                start of the string table, then the list of termsuffixes
+      objects   the number of prefixes, then each prefix and the number of
+                its objects, then the document, objtype, priority, anchor
+                and name of each
+      trigrams  the number of trigrams, then each trigram and its sorted list
+                of objects shards
+    """
+
+    strings = {}
+    body = bytearray()
+
+    def string(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    def number(value):
+        encode_varint(value, body)
+
+    def sorted_numbers(values):
+        number(len(values))
+        last = 0
+        for value in values:
+            number(value - last)
+            last = value
+
+    if kind == 'docs':
+        suffixes = Counter(filename[len(docname):]
+                           for docname, filename in zip(shard['docnames'], shard['filenames'])
+                           if filename.startswith(docname))
+        suffix = suffixes.most_common(1)[0][0] if suffixes else ''
+        string(suffix)
+
+        number(len(shard['docnames']))
+        for docname, title, filename in zip(shard['docnames'], shard['titles'], shard['filenames']):
+            number(string(docname))
+            number(string(title))
+            number(0 if filename == docname + suffix else string(filename) + 1)
+
+        lengths = shard.get('doclengths', ())
+        number(len(lengths))
+        for length in lengths:
+            number(length)
+
+    elif kind == 'terms':
+        for key in ('terms', 'titleterms'):
+            number(len(shard[key]))
+            for term, docs in shard[key].items():
+                number(string(term))
+                sorted_numbers([docs] if isinstance(docs, int) else docs)
+
+    elif kind == 'partial':
+        for term in shard['termlist']:
+            string(term)
+        number(len(shard['termlist']))
+        number(len(shard['termsuffixes']))
+        for entry in shard['termsuffixes']:
+            number(entry)
+
+    elif kind == 'objects':
+        number(len(shard))
+        for prefix, objects in shard.items():
+            number(string(prefix))
+            number(len(objects))
+            for docidx, objtype, prio, anchor, name in objects:
+                number(docidx)
+                number(objtype)
+                number(prio)
+                number(string(anchor))
+                number(string(name))
+
+    elif kind == 'trigrams':
+        number(len(shard))
+        for trigram, shards in shard.items():
+            number(string(trigram))
+            sorted_numbers(shards)
+
+    else:
+        raise ValueError('unknown kind of search shard: %r' % (kind))
+
+    table = '\0'.join(strings).encode('utf-8')
+    header = bytearray(search_binary_magic)
+    encode_varint(len(table), header)
+    return bytes(header + table + body)
+
+
+def build_term_suffixes(terms, include=None):
+    """Returns a sorted list of the given terms, and a suffix array over them
+    for finding the terms that contain a given string.  Each entry of the
+    latter encodes a term index and an offset into that term as
+    offset * len(termlist) + index, and the entries are sorted by the suffix
+    of the term starting at that offset.  Suffixes shorter than three
+    characters are left out, since searchtools.js only looks up partial
+    matches for longer words, as are those for which include returns False."""
+
+    termlist = sorted(set(terms), key=utf16_key)
+    count = len(termlist)
+
+    suffixes = []
+    for i, term in enumerate(termlist):
+        for offset in range(len(term) - 2):
+            suffix = term[offset:]
+            if include is None or include(suffix):
+                suffixes.append((utf16_key(suffix), offset * count + i))
+    suffixes.sort()
+
+    return termlist, [entry for suffix, entry in suffixes]
+
+
+def split_search_index(frozen):
+    """Splits the frozen search index into the manifest and a dict mapping
+    the name of each kind of shard to a list of them."""
+
+    shards = {}
+
+    size = len(dump_search_json(frozen['terms']))
+    size += len(dump_search_json(frozen['titleterms']))
+    count = get_search_shard_count(size)
+    shards['terms'] = [{'terms': {}, 'titleterms': {}} for i in range(count)]
+    for key in ('terms', 'titleterms'):
+        for term, value in frozen[key].items():
+            shards['terms'][get_search_shard(term[:2], count)][key][term] = value
+
+    # Each term goes into the partial shard of every suffix it has.  Reckon
+    # with about eight bytes per suffix array entry.
+    terms = set(frozen['terms']).union(frozen['titleterms'])
+    count = get_search_shard_count(8 * sum(max(len(term) - 2, 0) for term in terms))
+    groups = [set() for i in range(count)]
+    for term in terms:
+        for offset in range(len(term) - 2):
+            groups[get_search_shard(term[offset:offset + 2], count)].add(term)
+
+    shards['partial'] = []
+    for i, group in enumerate(groups):
+        termlist, suffixes = build_term_suffixes(
+            group, lambda suffix: get_search_shard(suffix[:2], count) == i)
+        shards['partial'].append({'termlist': termlist, 'termsuffixes': suffixes})
+
+    # The namespace of a Python object is its prefix, ie. its module or class.
+    # C++ names are qualified with :: instead, so they all share a prefix.
+    count = get_search_shard_count(len(dump_search_json(frozen['objects'])))
+    shards['objects'] = [{} for i in range(count)]
+    trigrams = {}
+    for prefix, objects in frozen['objects'].items():
+        for obj in objects:
+            name = obj[4]
+            shard = get_search_shard(prefix or name.rpartition('::')[0], count)
+            shards['objects'][shard].setdefault(prefix, []).append(obj)
+
+            fullname = (prefix + '.' + name if prefix else name).lower()
+            for offset in range(len(fullname) - 2):
+                trigrams.setdefault(fullname[offset:offset + 3], set()).add(shard)
+
+    count = get_search_shard_count(sum(len(trigram) + 4 * len(objects) + 6
+                                       for trigram, objects in trigrams.items()))
+    shards['trigrams'] = [{} for i in range(count)]
+    for trigram, objects in trigrams.items():
+        shards['trigrams'][get_search_shard(trigram, count)][trigram] = sorted(objects)
+
+    manifest = {key: value for key, value in frozen.items()
+                if key not in ('terms', 'titleterms', 'objects')}
+    manifest['shards'] = {name: len(kind) for name, kind in shards.items()}
+    return manifest, shards
+
+
+# A reader only ever searches one variation, so each gets an index of its own
+# under _search/<variation>/index/, with only the content that is shown in it
+# and only the objects of its domain in search_variation_domains (and those
+# of domains that no variation is about).  The pages are fed to the indexer of
+# the variation being written, and the builder is given that of the first
+# variation, so searchindex.js holds its index.  The indexers are kept in the
+# doctrees directory, the way Sphinx keeps its own in searchindex.js.
+search_variation_domains = {'python': 'py', 'cpp': 'cpp'}
+search_indexers = {}
+
+# The number of words in each page, by variation and docname, which go into
+# the index as doclengths (in the order of the docnames) and avgdoclength for
+# the BM25 ranking in searchtools.js.  The document frequency of a term, the
+# other statistic it needs, is the length of its list of documents.
+search_doc_lengths = {}
+
+# The variation whose indexer is being fed, and the WordCollector doing so,
+# see dispatch_word_collector_visit.
+search_index_variation = None
+search_word_collector = None
+
+html_load_indexer = None
+html_index_page = None
+word_collector_dispatch_visit = None
+
+
+def get_search_indexer_path(app, variation):
+    return os.path.join(app.doctreedir, 'search-%s.pickle' % (variation))
+
+
+def load_indexer(self, docnames):
+    from sphinx.search import IndexBuilder
+
+    search_indexers.clear()
+    search_doc_lengths.clear()
+    if not getattr(self, 'current_variation', None):
+        html_load_indexer(self, docnames)
+        return
+
+    # Drop the pages that are about to be written again, as Sphinx does.
+    keep = set(self.env.all_docs) - set(docnames)
+    for variation, title in self.config.variations:
+        indexer = IndexBuilder(self.env, self.indexer.lang.lang,
+                               self.config.html_search_options,
+                               self.config.html_search_scorer)
+        lengths = search_doc_lengths[variation] = {}
+        try:
+            with open(get_search_indexer_path(self.app, variation), 'rb') as fh:
+                frozen = pickle.load(fh)
+
+            # It is already unpickled, along with the doclengths, which
+            # IndexBuilder.load does not know about.
+            indexer.load(None, types.SimpleNamespace(load=lambda stream: frozen))
+            lengths.update(zip(frozen['docnames'], frozen.get('doclengths', ())))
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            if keep:
+                logger.warning('search index for variation %s couldn\'t be loaded, '
+                               'but not all documents will be built: the index will '
+                               'be incomplete.', variation)
+        indexer.prune(keep)
+        search_indexers[variation] = indexer
+
+    self.indexer = search_indexers[self.config.variations[0][0]]
+
+
+def index_page(self, pagename, doctree, title):
+    global search_index_variation, search_word_collector
+
+    variation = getattr(self, 'current_variation', None)
+    indexer = search_indexers.get(variation[0]) if variation else None
+    if indexer is None or self.indexer is None:
+        html_index_page(self, pagename, doctree, title)
+        return
+
+    builder_indexer = self.indexer
+    self.indexer = indexer
+    search_index_variation = variation[0]
+    search_word_collector = None
+    try:
+        html_index_page(self, pagename, doctree, title)
+        if search_word_collector is not None:
+            search_doc_lengths[variation[0]][pagename] = len(search_word_collector.found_words)
+    finally:
+        self.indexer = builder_indexer
+        search_index_variation = None
+        search_word_collector = None
+
+
+def dispatch_word_collector_visit(self, node):
+    global search_word_collector
+
+    if search_index_variation is not None:
+        search_word_collector = self
+
+        # Leave out the words that are only meant for the other variations.
+        if is_other_variation(node, search_index_variation):
+            raise nodes.SkipNode
+
+    word_collector_dispatch_visit(self, node)
+
+
+def filter_search_objects(frozen, variation):
+    """Leaves only the objects in the frozen search index that belong to the
+    given variation."""
+
+    domain = search_variation_domains.get(variation)
+    if not domain:
+        return
+
+    other_domains = set(search_variation_domains.values())
+    other_domains.discard(domain)
+
+    objects = {}
+    for prefix, objs in frozen['objects'].items():
+        objs = [obj for obj in objs if frozen['objnames'][obj[1]][0] not in other_domains]
+        if objs:
+            objects[prefix] = objs
+    frozen['objects'] = objects
+
+
+def write_search_index(app, name, frozen):
+    manifest, shards = split_search_index(frozen)
+    manifest['excerptshards'] = get_search_excerpt_shard_count(app)
+
+    binary = app.config.search_index_format == 'binary'
+    if binary:
+        manifest['format'] = 'binary'
+        shards['docs'] = [{key: manifest.pop(key) for key in ('docnames', 'titles', 'filenames', 'doclengths')
+                           if key in manifest}]
+        manifest['shards']['docs'] = 1
+    elif os.path.isfile(os.path.join(app.outdir, '_search', name, 'docs-0.js')):
+        write_search_shards(app, name + '/docs', [])
+
+    data = 'Search.setIndex(%s)' % (dump_search_json(manifest))
+    write_file_atomic(os.path.join(app.outdir, '_search', name, 'manifest.js'), data.encode('utf-8'))
+
+    for kind, kind_shards in shards.items():
+        write_search_shards(app, name + '/' + kind, kind_shards, kind if binary else None)
+
+
+def on_build_finished_search_index(app, exception):
+    indexer = getattr(app.builder, 'indexer', None)
+    if exception or indexer is None:
+        return
+
+    if not search_indexers:
+        write_search_index(app, 'index', indexer.freeze())
+        return
+
+    os.makedirs(app.doctreedir, exist_ok=True)
+    for variation, indexer in search_indexers.items():
+        indexer.prune(app.env.all_docs)
+        frozen = indexer.freeze()
+
+        lengths = search_doc_lengths[variation]
+        frozen['doclengths'] = [lengths.get(docname, 0) for docname in frozen['docnames']]
+        frozen['avgdoclength'] = max(sum(frozen['doclengths']) / max(len(frozen['docnames']), 1), 1)
+
+        path = get_search_indexer_path(app, variation)
+        with open(path + '.tmp', 'wb') as fh:
+            pickle.dump(frozen, fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+        filter_search_objects(frozen, variation)
+        write_search_index(app, variation + '/index', frozen)
+
+
+# -- Search excerpts ------------------------------------------------------
+
+# Maps each variation to a dict mapping docnames to a list of [anchor, title,
+# text] for each section of the page, with the text cut off after
+# search_excerpt_length characters.  searchtools.js makes the summaries of
+# the search results from these, rather than downloading every page found.
+# Collected in the main process as the pages are written, and kept in the
+# doctrees directory for the pages that are not written again.
+search_excerpts = None
+search_excerpt_length = 360
+search_excerpt_docs_per_shard = 64
+
+# Nodes whose text does not show up in the page, or is not part of the prose.
+search_excerpt_skip_nodes = (nodes.Invisible, nodes.raw, nodes.system_message,
+                             nodes.section, nodes.title)
+
+
+def get_search_excerpt_shard_count(app):
+    return -(-len(app.env.all_docs) // search_excerpt_docs_per_shard)
+
+
+def is_other_variation(node, variation):
+    # The variations extension turns the `only` nodes for the variations into
+    # this class, which the HTML writer skips when it is for another one.
+    return node.__class__.__name__ == 'VariationNode' and node['expr'] != variation
+
+
+def collect_excerpt_text(node, variation, parts, length):
+    # Gathers the text of the node, leaving out subsections and content that
+    # is only meant for the other variations.  Returns the remaining length.
+    for child in node.children:
+        if length <= 0:
+            break
+
+        if isinstance(child, nodes.Text):
+            text = child.astext()
+            parts.append(text)
+            length -= len(text)
+        elif isinstance(child, search_excerpt_skip_nodes) or is_other_variation(child, variation) or \
+                child.tagname in ('toctree', 'inheritance_diagram', 'graphviz', 'desc_signature'):
+            continue
+        else:
+            length = collect_excerpt_text(child, variation, parts, length)
+            if not isinstance(child, nodes.Inline):
+                parts.append(' ')
+
+    return length
+
+
+def get_section_excerpts(doctree, variation):
+    """Returns a list of [anchor, title, text] for each section of the given
+    doctree, in document order."""
+
+    excerpts = []
+    for section in doctree.traverse(nodes.section):
+        if not section['ids'] or not isinstance(section[0], nodes.title):
+            continue
+
+        parent = section.parent
+        while parent is not None and not is_other_variation(parent, variation):
+            parent = parent.parent
+        if parent is not None:
+            continue
+
+        parts = []
+        collect_excerpt_text(section, variation, parts, search_excerpt_length)
+        text = ' '.join(''.join(parts).split())
+        if len(text) > search_excerpt_length:
+            text = text[:search_excerpt_length].rsplit(' ', 1)[0] + '...'
+
+        # The first section is the page title, which needs no anchor.
+        anchor = '#' + section['ids'][0] if excerpts else ''
+        excerpts.append([anchor, section[0].astext(), text])
+
+    return excerpts
+
+
+def on_builder_inited_search_excerpts(app):
+    global search_excerpts
+
+    search_excerpts = None
+    if app.builder.format != 'html' or not app.builder.search:
+        return
+
+    search_excerpts = {}
+    path = os.path.join(app.doctreedir, 'search-excerpts.pickle')
+    try:
+        with open(path, 'rb') as fh:
+            length, excerpts = pickle.load(fh)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return
+
+    if length == search_excerpt_length:
+        search_excerpts = excerpts
+
+
+def on_doctree_resolved_search_excerpts(app, doctree, docname):
+    # Called once per variation, since the variations builder resolves the
+    # doctrees again for each of them.
+    if search_excerpts is None or getattr(app.builder, 'indexer', None) is None:
+        return
+
+    variation = getattr(app.builder, 'current_variation', None)
+    variation = variation[0] if variation else ''
+    search_excerpts.setdefault(variation, {})[docname] = \
+        get_section_excerpts(doctree, variation)
+
+
+def on_build_finished_search_excerpts(app, exception):
+    if exception or not search_excerpts:
+        return
+
+    variations = [variation[0] for variation in getattr(app.config, 'variations', ())] or ['']
+    for variation in list(search_excerpts):
+        if variation not in variations:
+            del search_excerpts[variation]
+
+    count = get_search_excerpt_shard_count(app)
+    for variation, excerpts in search_excerpts.items():
+        for docname in list(excerpts):
+            if docname not in app.env.all_docs:
+                del excerpts[docname]
+
+        shards = [{} for i in range(count)]
+        for docname, sections in excerpts.items():
+            shards[get_search_shard(docname, count)][docname] = sections
+        write_search_shards(app, variation + '/excerpts' if variation else 'excerpts', shards)
+
+    path = os.path.join(app.doctreedir, 'search-excerpts.pickle')
+    os.makedirs(app.doctreedir, exist_ok=True)
+    with open(path + '.tmp', 'wb') as fh:
+        pickle.dump((search_excerpt_length, search_excerpts), fh, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def setup(app):
+    # The search indexes of the variations are fed by the builder.
+    global html_load_indexer, html_index_page, word_collector_dispatch_visit
+    from sphinx.builders.html import StandaloneHTMLBuilder
+    from sphinx.search import WordCollector
+    html_load_indexer = StandaloneHTMLBuilder.load_indexer
+    html_index_page = StandaloneHTMLBuilder.index_page
+    word_collector_dispatch_visit = WordCollector.dispatch_visit
+    StandaloneHTMLBuilder.load_indexer = load_indexer
+    StandaloneHTMLBuilder.index_page = profiled('index_page', index_page)
+    WordCollector.dispatch_visit = dispatch_word_collector_visit
+
+    # Set this to 'binary' to have the search page load a binary index.
+    app.add_config_value('search_index_format', 'json', 'html', [str])
+
+    connect_hook(app, 'build-finished', on_build_finished_search_index)
+    connect_hook(app, 'builder-inited', on_builder_inited_search_excerpts)
+    connect_hook(app, 'doctree-resolved', on_doctree_resolved_search_excerpts)
+    connect_hook(app, 'build-finished', on_build_finished_search_excerpts)
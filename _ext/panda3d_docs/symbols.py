@@ -0,0 +1,483 @@
+"""Index of the names in the interrogate databases, which the references in the
+docstrings and in the manual are resolved against."""
+
+import hashlib
+import os
+
+from sphinx.util import logging
+
+from . import options
+from .profiling import connect_hook
+from .util import write_file_atomic
+
+try:
+    from panda3d.interrogatedb import *
+    from sphinx_interrogatedb import idb
+except ImportError:
+    # The API reference is left out, see options.
+    idb = None
+
+logger = logging.getLogger(__name__)
+
+
+# Flat index of every scoped interrogate name.  It maps a module name to a
+# dict mapping a dotted path within that module to a (py, cpp, py_ctor) tuple
+# of resolved (type, fqname) pairs; see build_symbol_index().  During the
+# build, the dicts are replaced by ones mapped from a file, see below.
+symbol_index = None
+symbol_index_counts = None
+
+
+def _resolve_function(ifunc):
+    """Returns the (py, cpp, py_ctor) tuple for an interrogate function.  The
+    last entry is only set for constructors, which resolve to the class when
+    they are referenced by their bare name."""
+
+    cpp = ('func', interrogate_function_scoped_name(ifunc))
+    func_name = idb.get_function_name(ifunc, scoped=False, mangle=True)
+    ctor = None
+    if interrogate_function_is_method(ifunc):
+        outer = interrogate_function_class(ifunc)
+        prefix = interrogate_type_module_name(outer)
+        if prefix:
+            prefix += '.'
+        type_name = idb.get_type_name(outer, mangle=False, scoped=True)
+        if interrogate_function_name(ifunc).lstrip('~') == interrogate_type_name(outer):
+            ctor = ('class', prefix + type_name)
+        py = ('meth', prefix + type_name + '.' + func_name)
+    else:
+        prefix = interrogate_function_module_name(ifunc)
+        if prefix:
+            prefix += '.'
+        py = ('func', prefix + func_name)
+
+    return (py, cpp, ctor)
+
+
+def _resolve_type(itype):
+    """Returns the (py, cpp, None) tuple for an interrogate type.  The C++
+    entry is None if the type is not of a kind we can link to."""
+
+    type_name = interrogate_type_scoped_name(itype)
+    if interrogate_type_is_typedef(itype):
+        cpp = ('type', type_name)
+    elif interrogate_type_is_enum(itype):
+        cpp = ('enum', type_name)
+    elif interrogate_type_is_struct(itype):
+        cpp = ('struct', type_name)
+    elif interrogate_type_is_class(itype):
+        cpp = ('class', type_name)
+    elif interrogate_type_is_union(itype):
+        cpp = ('union', type_name)
+    else:
+        cpp = None
+
+    type_name = idb.get_type_name(itype, mangle=False, scoped=True)
+    prefix = interrogate_type_module_name(itype)
+    if prefix:
+        prefix += '.'
+    return (('class', prefix + type_name), cpp, None)
+
+
+def build_symbol_index():
+    """Walks the interrogate database once, and stores every name that
+    idb.lookup_function and idb.lookup_type would find (including inherited
+    methods) in symbol_index, so that resolve_reference is only a single dict
+    lookup per candidate.  The other panda3d modules also get the names of
+    panda3d.core, which they would otherwise have to fall back to."""
+
+    global symbol_index, symbol_index_counts
+
+    num_types = interrogate_number_of_global_types()
+    num_funcs = interrogate_number_of_functions()
+
+    # Gather the types and functions by the scope they are defined in, which
+    # is either a module name or an enclosing type.  Later definitions
+    # override earlier ones, just like in idb's own cache.
+    nested_types = {}
+    members = {}
+
+    def store_type(parent, itype):
+        if not interrogate_type_name(itype):
+            # Ignore anonymous types
+            return
+
+        scope = nested_types.setdefault(parent, {})
+        scope[idb.get_type_name(itype, mangle=False)] = itype
+        scope[idb.get_type_name(itype, mangle=True)] = itype
+
+        for i in range(interrogate_type_number_of_nested_types(itype)):
+            store_type(itype, interrogate_type_get_nested_type(itype, i))
+
+    # Only the module scopes get a table, the nested ones are part of those.
+    modules = set()
+    for i in range(num_types):
+        itype = interrogate_get_global_type(i)
+        if not interrogate_type_outer_class(itype) and interrogate_type_name(itype):
+            modname = interrogate_type_module_name(itype)
+            modules.add(modname)
+            store_type(modname, itype)
+
+    for i in range(num_funcs):
+        ifunc = interrogate_get_function(i)
+        parent = interrogate_function_class(ifunc)
+        if not parent:
+            parent = interrogate_function_module_name(ifunc)
+            modules.add(parent)
+
+        scope = members.setdefault(parent, {})
+        scope[idb.get_function_name(ifunc, mangle=False)] = ifunc
+        if not interrogate_function_name(ifunc).startswith('~'):
+            scope[idb.get_function_name(ifunc, mangle=True)] = ifunc
+
+    inherited_members = {}
+
+    def get_members(itype):
+        # Own methods take precedence over inherited ones, which are found in
+        # the same depth-first order as idb._get_ancestor_types.
+        scope = inherited_members.get(itype)
+        if scope is None:
+            scope = {}
+            for i in range(interrogate_type_number_of_derivations(itype) - 1, -1, -1):
+                scope.update(get_members(interrogate_type_get_derivation(itype, i)))
+            scope.update(members.get(itype, ()))
+            inherited_members[itype] = scope
+        return scope
+
+    func_results = {}
+    type_results = {}
+
+    def get_func_result(ifunc):
+        result = func_results.get(ifunc)
+        if result is None:
+            result = _resolve_function(ifunc)
+            func_results[ifunc] = result
+        return result
+
+    def add_scope(table, funcs, prefix, parent):
+        for name, itype in nested_types.get(parent, {}).items():
+            path = prefix + name
+            result = type_results.get(itype)
+            if result is None:
+                result = _resolve_type(itype)
+                type_results[itype] = result
+            table[path] = result
+
+            for name, ifunc in get_members(itype).items():
+                funcs[path + '.' + name] = ifunc
+
+            if interrogate_type_number_of_constructors(itype) > 0:
+                funcs[path + '.__init__'] = interrogate_type_get_constructor(itype, 0)
+
+            add_scope(table, funcs, path + '.', itype)
+
+    index = {}
+    for modname in modules:
+        table = {}
+        funcs = dict(members.get(modname, ()))
+        add_scope(table, funcs, '', modname)
+
+        # A function takes precedence over a type with the same name.
+        for path, ifunc in funcs.items():
+            table[path] = get_func_result(ifunc)
+
+        index[modname] = table
+
+    # Names that aren't found in another panda3d module are looked up in
+    # panda3d.core, which the other modules build upon.  The entries of the
+    # module itself take precedence.
+    core_table = index.get('panda3d.core')
+    if core_table:
+        for modname, table in index.items():
+            if modname.startswith('panda3d.') and modname != 'panda3d.core':
+                for path, result in core_table.items():
+                    table.setdefault(path, result)
+
+    symbol_index = index
+    symbol_index_counts = (num_types, num_funcs)
+
+
+def get_symbol_index():
+    """Returns the symbol index, (re)building it if new interrogate databases
+    have been loaded since it was last built."""
+
+    global symbol_index_path
+
+    counts = (interrogate_number_of_global_types(), interrogate_number_of_functions())
+    if symbol_index is None or counts != symbol_index_counts:
+        if symbol_index_path:
+            # Eg. autodoc imported a module that wasn't documented with
+            # autosummary.  The new index is private to this process.
+            logger.warning('interrogate databases were loaded after the symbol index '
+                           'was mapped from %s, so it is rebuilt in process %d',
+                           symbol_index_path, os.getpid())
+            symbol_index_path = None
+        build_symbol_index()
+    return symbol_index
+
+
+# The symbol index is also written to a file, which the main process and the
+# forked parallel workers map into memory, rather than each keeping a copy of
+# the dicts (which reference counting soon makes them do).  It consists of:
+#  - the magic, then the type and function counts, the number of strings and
+#    the number of modules, and the stamp (see get_symbol_index_stamp)
+#  - the modules, as (name, first entry, number of entries)
+#  - the offsets of the strings, plus the end of the last one
+#  - the entries of all modules, each sorted by path, as (path, py name,
+#    cpp name, ctor name, type codes), with the type codes in the low bytes
+#  - the UTF-8 encoded strings, with the names referring to them by index
+# The numbers are native unsigned ints, since the file is only a cache.  Bump
+# the version in the magic when changing the format or what goes into it.
+symbol_index_magic = b'P3SY\x02\x00\x00\x00'
+symbol_index_types = (None, 'class', 'meth', 'func', 'type', 'enum', 'struct', 'union')
+
+# The file the symbol index is mapped from, if it is.
+symbol_index_path = None
+
+
+class MappedSymbolTable:
+    """Stands in for the dict of a module in the symbol index, looking up the
+    paths in the mapped file by binary search."""
+
+    def __init__(self, data, base, offsets, entries, first, count):
+        self.data = data
+        self.base = base
+        self.offsets = offsets
+        self.entries = entries
+        self.first = first
+        self.end = first + count
+
+    def get_string(self, sid):
+        # Slicing the mmap gives bytes, which, unlike a memoryview, can be
+        # compared by order.
+        return self.data[self.base + self.offsets[sid]:self.base + self.offsets[sid + 1]]
+
+    def get(self, path, default=None):
+        key = path.encode('utf-8')
+        entries = self.entries
+        low = self.first
+        high = self.end
+        while low < high:
+            mid = (low + high) >> 1
+            if self.get_string(entries[mid * 5]) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        if low == self.end or self.get_string(entries[low * 5]) != key:
+            return default
+
+        codes = entries[low * 5 + 4]
+        result = []
+        for i in range(3):
+            type = symbol_index_types[(codes >> (i * 8)) & 0xff]
+            if type:
+                result.append((type, self.get_string(entries[low * 5 + 1 + i]).decode('utf-8')))
+            else:
+                result.append(None)
+        return tuple(result)
+
+
+def encode_symbol_index(index, counts, stamp):
+    """Returns the given symbol index in the file format described above."""
+
+    from array import array
+
+    strings = {}
+
+    def get_sid(string):
+        return strings.setdefault(string, len(strings))
+
+    modules = array('I')
+    entries = array('I')
+    for modname in sorted(index, key=lambda name: name.encode('utf-8')):
+        table = index[modname]
+        modules.extend((get_sid(modname), len(entries) // 5, len(table)))
+        for path in sorted(table, key=lambda path: path.encode('utf-8')):
+            row = [get_sid(path)]
+            codes = 0
+            for i, result in enumerate(table[path]):
+                if result:
+                    row.append(get_sid(result[1]))
+                    codes |= symbol_index_types.index(result[0]) << (i * 8)
+                else:
+                    row.append(0)
+            row.append(codes)
+            entries.extend(row)
+
+    data = [string.encode('utf-8') for string in strings]
+    offsets = array('I', [0])
+    for string in data:
+        offsets.append(offsets[-1] + len(string))
+
+    header = array('I', counts + (len(strings), len(modules) // 3))
+    return b''.join([symbol_index_magic, header.tobytes(), stamp.encode('ascii'),
+                     modules.tobytes(), offsets.tobytes(), entries.tobytes()] + data)
+
+
+def get_symbol_index_stamp(app):
+    """Returns a value identifying the format of the symbol index file and
+    what goes into the index: the interrogate databases and the settings that
+    the names are mangled by."""
+
+    stamp = hashlib.sha1(symbol_index_magic)
+    stamp.update(repr((getattr(app.config, 'autodoc_interrogatedb_mangle_type_names', None),
+                       getattr(app.config, 'autodoc_interrogatedb_mangle_function_names', None))).encode())
+    update_interrogatedb_stamp(stamp, app)
+    return stamp.hexdigest()
+
+
+def map_symbol_index(path, stamp):
+    """Maps the symbol index file at the given path, and returns the counts it
+    was built with and the index, or None if it is missing or out of date."""
+
+    import mmap
+
+    try:
+        with open(path, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    pos = len(symbol_index_magic)
+    if mm[:pos] != symbol_index_magic or mm[pos + 16:pos + 56] != stamp.encode('ascii'):
+        mm.close()
+        return None
+
+    view = memoryview(mm)
+    num_types, num_funcs, num_strings, num_modules = view[pos:pos + 16].cast('I')
+    pos += 56
+
+    modules = view[pos:pos + num_modules * 12].cast('I')
+    pos += num_modules * 12
+    offsets = view[pos:pos + (num_strings + 1) * 4].cast('I')
+    pos += (num_strings + 1) * 4
+    num_entries = sum(modules[i * 3 + 2] for i in range(num_modules))
+    entries = view[pos:pos + num_entries * 20].cast('I')
+    pos += num_entries * 20
+
+    index = {}
+    for i in range(num_modules):
+        table = MappedSymbolTable(mm, pos, offsets, entries, modules[i * 3 + 1], modules[i * 3 + 2])
+        index[table.get_string(modules[i * 3]).decode('utf-8')] = table
+
+    return (num_types, num_funcs), index
+
+
+def resolve_reference(ref, rel, domain='py', plural=False):
+    """Looks up an interrogate symbol to its canonical name.  The second
+    argument is the fully qualified name it should be seen relative to, which
+    may be a module name, or a module name followed by an object name.
+
+    If plural is true and ref is not found, it is looked up without its last
+    character instead, which is done in the same walk over the scopes.
+
+    If found, returns a 2-tuple (type, fqname), else None."""
+
+    if not options.build_api_reference:
+        return None
+
+    if domain == 'py':
+        slot = 0
+    elif domain == 'cpp':
+        slot = 1
+    else:
+        return None
+
+    index = get_symbol_index()
+
+    # Find out which module we should be looking in.
+    table = None
+    rel_parts = rel.replace('::', '.').split('.')
+    for i in range(len(rel_parts), 0, -1):
+        table = index.get('.'.join(rel_parts[:i]))
+        if table is not None:
+            relpath = rel_parts[i:]
+            break
+
+    if table is None:
+        return None
+
+    refpath = ref.replace('::', '.').split('.')
+    refname = '.'.join(refpath)
+
+    if plural and refname.endswith('s'):
+        singular = refname[:-1]
+        singular_path = singular.split('.')
+    else:
+        singular = None
+    singular_result = None
+
+    # Say `rel` is "panda3d.core.NodePath.node",
+    # and `ref` is "PandaNode.final", then we will try these in this order:
+    # - panda3d.core::NodePath.node.PandaNode.final
+    # - panda3d.core::NodePath.PandaNode.final
+    # - panda3d.core::PandaNode.final
+    # The singular is only used if the name itself is not found in any of them.
+
+    for i in range(len(relpath), -1, -1):
+        scope = relpath[:i]
+
+        # If we are looking for a name equal to the parent scope, we are
+        # probably referencing a class name from within that very class.
+        # We don't want to find the constructor, so skip this.
+        if len(refpath) != 1 or i == 0 or refpath[0] != relpath[i - 1]:
+            entry = table.get('.'.join(scope + [refname]))
+            if entry:
+                if slot == 0 and entry[2] and len(refpath) == 1:
+                    # This matches a constructor, but we want the class.
+                    return entry[2]
+                if entry[slot]:
+                    return entry[slot]
+
+        if singular is not None and singular_result is None and \
+           (len(singular_path) != 1 or i == 0 or singular != relpath[i - 1]):
+            entry = table.get('.'.join(scope + [singular]))
+            if entry:
+                if slot == 0 and entry[2] and len(singular_path) == 1:
+                    singular_result = entry[2]
+                else:
+                    singular_result = entry[slot]
+
+    return singular_result
+
+
+def update_interrogatedb_stamp(stamp, app):
+    # Adds the size and modification time of each interrogate database.
+    for dir in getattr(app.config, 'interrogatedb_search_path', None) or ():
+        if not os.path.isdir(dir):
+            continue
+        for fn in sorted(os.listdir(dir)):
+            if fn.endswith('.in'):
+                st = os.stat(os.path.join(dir, fn))
+                stamp.update('{0}:{1}:{2};'.format(fn, st.st_size, st.st_mtime_ns).encode())
+
+
+def on_builder_inited_symbol_index(app):
+    # By now, autosummary has imported the modules we are documenting, so
+    # their interrogate databases have been loaded.
+    global symbol_index, symbol_index_counts, symbol_index_path
+
+    path = os.path.join(app.doctreedir, 'symbol-index.bin')
+    stamp = get_symbol_index_stamp(app)
+    counts = (interrogate_number_of_global_types(), interrogate_number_of_functions())
+
+    mapped = map_symbol_index(path, stamp)
+    if mapped is None or mapped[0] != counts:
+        build_symbol_index()
+        try:
+            write_file_atomic(path, encode_symbol_index(symbol_index, symbol_index_counts, stamp))
+        except OSError as ex:
+            # Then every process keeps its own copy, as before.
+            logger.warning('symbol index %s couldn\'t be written: %s', path, ex)
+            return
+        mapped = map_symbol_index(path, stamp)
+
+    if mapped is not None:
+        symbol_index_counts, symbol_index = mapped
+        symbol_index_path = path
+
+
+def setup(app):
+    if options.build_api_reference:
+        connect_hook(app, 'builder-inited', on_builder_inited_symbol_index, priority=900)
@@ -0,0 +1,12 @@
+"""Helpers shared by the modules of this extension."""
+
+import os
+
+
+def write_file_atomic(path, data):
+    # Parallel writers may produce the same file at the same time.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,58 @@
+// Added to the 404 page by _ext/panda3d_docs/redirects.py.  Looks up the
+// requested page in the trie written by on_build_finished_redirects, and goes
+// to where it has moved to.
+(function() {
+    var opts = window.DOCUMENTATION_OPTIONS;
+
+    // The 404 page is only served in place of other pages if it is built with
+    // absolute links.
+    var root = opts.URL_ROOT;
+    var pathname = window.location.pathname;
+    if (root[0] !== '/' || pathname.indexOf(root) !== 0) {
+        return;
+    }
+
+    $.getJSON(root + '_static/redirect-trie.json', function(data) {
+        var parts = pathname.slice(root.length).split('/');
+
+        var variation = window.VARIATION ? window.VARIATION + '/' : '';
+        if (data.variations.indexOf(parts[0]) >= 0) {
+            variation = parts.shift() + '/';
+        }
+
+        // Old links may still have the .html suffix.
+        var last = parts.pop();
+        if (!last) {
+            last = 'index';
+        } else if (last.slice(-5) === '.html') {
+            last = last.slice(0, -5);
+        } else if (opts.LINK_SUFFIX && last.slice(-opts.LINK_SUFFIX.length) === opts.LINK_SUFFIX) {
+            last = last.slice(0, -opts.LINK_SUFFIX.length);
+        }
+        parts.push(last);
+
+        // Take the page, or else the innermost directory that has moved.
+        var node = data.trie;
+        var target = null;
+        for (var i = 0; i < parts.length && node; ++i) {
+            node = node.hasOwnProperty(parts[i]) ? node[parts[i]] : null;
+            if (node && node['*'] !== undefined && i < parts.length - 1) {
+                target = node['*'] + parts.slice(i + 1).join('/');
+            }
+        }
+        if (node && node['='] !== undefined) {
+            target = node['='];
+        }
+        if (target === null) {
+            return;
+        }
+
+        var hash = target.indexOf('#');
+        if (hash >= 0) {
+            target = target.slice(0, hash) + opts.LINK_SUFFIX + target.slice(hash);
+        } else {
+            target += opts.LINK_SUFFIX + window.location.hash;
+        }
+        window.location.replace(root + variation + target);
+    });
+})();
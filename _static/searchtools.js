@@ -39,7 +39,12 @@ if (!Scorer) {
     partialTitle: 7,
     // query found in terms
     term: 5,
-    partialTerm: 2
+    partialTerm: 2,
+
+    // When the index has the lengths of the documents, the above scores of
+    // the full-text matches are weighted by BM25 with these parameters
+    bm25k1: 1.2,
+    bm25b: 0.75
   };
 }
 
@@ -64,18 +69,13 @@ var Search = {
 
   _counter : 0,
 
-  htmlToText : function(htmlString) {
-      var virtualDocument = document.implementation.createHTMLDocument('virtual');
-      var htmlElement = $(htmlString, virtualDocument);
-      htmlElement.find('.headerlink').remove();
-      docContent = htmlElement.find('[role=main]')[0];
-      if(docContent === undefined) {
-          console.warn("Content block not found. Sphinx search tries to obtain it " +
-                       "via '[role=main]'. Could you check your theme or template.");
-          return "";
-      }
-      return docContent.textContent || docContent.innerText;
-  },
+  _searchroot : null,
+  _indexdir : null,
+  _shards : {},
+  _shard_callbacks : {},
+  _worker : null,
+  _current_query : null,
+  _on_results : null,
 
   init : function() {
       var params = $.getQueryParameters();
@@ -87,17 +87,88 @@ var Search = {
   },
 
   loadIndex : function(url) {
-    $.ajax({type: "GET", url: url, data: null,
-            dataType: "script", cache: true,
-            complete: function(jqxhr, textstatus) {
-              if (textstatus != "success") {
-                document.getElementById("searchindexloader").src = url;
-              }
-            }});
+    // the page passes the location of searchindex.js, which holds the whole
+    // index; _ext/panda3d_docs/search.py splits it up into the files under
+    // _search/ instead, starting with a manifest that calls setIndex.  Each
+    // variation has an index of its own.
+    this._searchroot = url.replace(/searchindex\.js$/, '_search/');
+    this._indexdir = (VARIATION ? VARIATION + '/' : '') + 'index/';
+    if (!this.startWorker()) {
+      this.loadScripts([this._searchroot + this._indexdir + 'manifest.js']);
+    }
+  },
+
+  /**
+   * run the searches in searchworker.js, which loads the index itself, so
+   * that the page stays responsive.  Returns false if workers can't be used
+   * (eg. for local files in Chrome), in which case they run on this thread.
+   */
+  startWorker : function() {
+    var worker, searchroot;
+    try {
+      searchroot = new URL(this._searchroot, document.baseURI).href;
+      worker = new Worker(DOCUMENTATION_OPTIONS.URL_ROOT + '_static/searchworker.js');
+    } catch (e) {
+      return false;
+    }
+    worker.postMessage({type: 'init', searchroot: searchroot, indexdir: this._indexdir,
+                        variation: VARIATION,
+                        translations: {', in ': _(', in ')}});
+    worker.onmessage = function(event) {
+      var data = event.data;
+      if (data.type == 'ready') {
+        Search.setIndex(data.index);
+      } else if (data.counter == Search._counter) {
+        Search._on_results(data.results, data.searchterms, data.hlterms, data.done);
+      }
+    };
+    worker.onerror = function(event) {
+      // carry on without the worker, repeating the query it was running
+      event.preventDefault();
+      worker.terminate();
+      Search._worker = null;
+      Search._index = null;
+      if (Search._current_query !== null) {
+        Search.deferQuery(Search._current_query);
+      }
+      Search.loadScripts([Search._searchroot + Search._indexdir + 'manifest.js']);
+    };
+    this._worker = worker;
+    return true;
+  },
+
+  /**
+   * load scripts that call back into Search, falling back to script tags
+   * if that does not work (eg. for local files in Chrome)
+   */
+  loadScripts : function(urls) {
+    if (typeof importScripts !== 'undefined') {
+      // in searchworker.js, where this returns once they have run
+      importScripts.apply(self, urls);
+      return;
+    }
+    function load(url) {
+      $.ajax({type: "GET", url: url, data: null,
+              dataType: "script", cache: true,
+              complete: function(jqxhr, textstatus) {
+                if (textstatus != "success") {
+                  var script = document.createElement("script");
+                  script.src = url;
+                  document.head.appendChild(script);
+                }
+              }});
+    }
+    for (var i = 0; i < urls.length; i++) {
+      load(urls[i]);
+    }
   },
 
   setIndex : function(index) {
     var q;
+    // the terms and objects are added as their shards are loaded
+    index.terms = {};
+    index.titleterms = {};
+    index.objects = {};
     this._index = index;
     if ((q = this._queued_query) !== null) {
       this._queued_query = null;
@@ -105,6 +176,206 @@ var Search = {
     }
   },
 
+  /**
+   * load the given shards (eg. "python/index/terms-3") from _search/, if
+   * they are not already loaded, and then call back
+   */
+  loadShards : function(names, callback) {
+    var pending = 1;
+    var urls = [];
+    var binary = [];
+    function done() {
+      if (--pending === 0) {
+        callback();
+      }
+    }
+    for (var i = 0; i < names.length; i++) {
+      var name = names[i];
+      if (this._shards.hasOwnProperty(name)) {
+        continue;
+      }
+      pending++;
+      if (!this._shard_callbacks.hasOwnProperty(name)) {
+        this._shard_callbacks[name] = [];
+        if (this._index.format === 'binary' && name.indexOf(this._indexdir) === 0) {
+          binary.push(name);
+        } else {
+          urls.push(this._searchroot + name + '.js');
+        }
+      }
+      this._shard_callbacks[name].push(done);
+    }
+    if (urls.length) {
+      this.loadScripts(urls);
+    }
+    for (i = 0; i < binary.length; i++) {
+      this.loadBinaryShard(binary[i]);
+    }
+    done();
+  },
+
+  /**
+   * load a shard of the binary index, falling back to its script if that
+   * does not work (eg. for local files in Chrome)
+   */
+  loadBinaryShard : function(name) {
+    var url = this._searchroot + name;
+    var xhr = new XMLHttpRequest();
+    function fallback() {
+      Search.loadScripts([url + '.js']);
+    }
+    xhr.onload = function() {
+      if ((xhr.status === 200 || xhr.status === 0) && xhr.response) {
+        Search.addShard(name, Search.decodeShard(name, xhr.response));
+      } else {
+        fallback();
+      }
+    };
+    xhr.onerror = fallback;
+    try {
+      xhr.open('GET', url + '.bin');
+      xhr.responseType = 'arraybuffer';
+      xhr.send();
+    } catch (e) {
+      fallback();
+    }
+  },
+
+  /**
+   * decode a shard of the binary index, as written by encode_search_shard in
+   * _ext/panda3d_docs/search.py, into the same structure as the script of that
+   * shard passes to addShard (except that the termsuffixes are a Uint32Array)
+   */
+  decodeShard : function(name, buffer) {
+    var bytes = new Uint8Array(buffer);
+    var kind = name.slice(name.lastIndexOf('/') + 1).replace(/-\d+$/, '');
+    var shard = {};
+    var pos = 5;
+    var i, j, count, list;
+
+    function number() {
+      var value = 0, scale = 1, b;
+      do {
+        b = bytes[pos++];
+        value += (b & 0x7f) * scale;
+        scale *= 128;
+      } while (b & 0x80);
+      return value;
+    }
+
+    function sortedNumbers() {
+      var count = number();
+      var list = new Array(count);
+      var value = 0;
+      for (var i = 0; i < count; i++) {
+        list[i] = value += number();
+      }
+      return list;
+    }
+
+    if (String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]) !== 'P3SI' || bytes[4] !== 1) {
+      throw new Error('unknown search index format: ' + name);
+    }
+    var length = number();
+    var strings = new TextDecoder().decode(bytes.subarray(pos, pos + length)).split('\0');
+    pos += length;
+
+    if (kind === 'docs') {
+      count = number();
+      shard.docnames = new Array(count);
+      shard.titles = new Array(count);
+      shard.filenames = new Array(count);
+      for (i = 0; i < count; i++) {
+        shard.docnames[i] = strings[number()];
+        shard.titles[i] = strings[number()];
+        j = number();
+        shard.filenames[i] = j ? strings[j - 1] : shard.docnames[i] + strings[0];
+      }
+      count = number();
+      if (count) {
+        shard.doclengths = new Uint32Array(count);
+        for (i = 0; i < count; i++) {
+          shard.doclengths[i] = number();
+        }
+      }
+    } else if (kind === 'terms') {
+      shard.terms = {};
+      shard.titleterms = {};
+      $u.each([shard.terms, shard.titleterms], function(terms) {
+        for (var count = number(); count > 0; count--) {
+          var term = strings[number()];
+          var docs = sortedNumbers();
+          terms[term] = (docs.length === 1) ? docs[0] : docs;
+        }
+      });
+    } else if (kind === 'partial') {
+      shard.termlist = strings.slice(0, number());
+      count = number();
+      shard.termsuffixes = new Uint32Array(count);
+      for (i = 0; i < count; i++) {
+        shard.termsuffixes[i] = number();
+      }
+    } else if (kind === 'objects') {
+      for (count = number(); count > 0; count--) {
+        var prefix = strings[number()];
+        list = shard[prefix] = new Array(number());
+        for (i = 0; i < list.length; i++) {
+          list[i] = [number(), number(), number(), strings[number()], strings[number()]];
+        }
+      }
+    } else if (kind === 'trigrams') {
+      for (count = number(); count > 0; count--) {
+        var trigram = strings[number()];
+        shard[trigram] = sortedNumbers();
+      }
+    }
+    return shard;
+  },
+
+  addShard : function(name, shard) {
+    var index = this._index;
+    var callbacks = this._shard_callbacks[name] || [];
+    var key;
+    this._shards[name] = shard;
+    delete this._shard_callbacks[name];
+
+    // merge the terms and objects into the index, where the search functions
+    // look them up
+    if (name.indexOf(this._indexdir + 'terms-') === 0) {
+      for (key in shard.terms) {
+        index.terms[key] = shard.terms[key];
+      }
+      for (key in shard.titleterms) {
+        index.titleterms[key] = shard.titleterms[key];
+      }
+    } else if (name.indexOf(this._indexdir + 'objects-') === 0) {
+      for (key in shard) {
+        index.objects[key] = (index.objects[key] || []).concat(shard[key]);
+      }
+    } else if (name.indexOf(this._indexdir + 'docs-') === 0) {
+      // in the manifest, unless the index is binary
+      index.docnames = shard.docnames;
+      index.titles = shard.titles;
+      index.filenames = shard.filenames;
+      index.doclengths = shard.doclengths;
+    }
+
+    for (var i = 0; i < callbacks.length; i++) {
+      callbacks[i]();
+    }
+  },
+
+  /**
+   * must give the same result as get_search_shard in _ext/panda3d_docs/search.py
+   */
+  getShard : function(key, count) {
+    var hash = 0;
+    for (var i = 0; i < key.length; i++) {
+      hash = (hash * 31 + key.charCodeAt(i)) % 4294967296;
+    }
+    return hash % count;
+  },
+
   hasIndex : function() {
       return this._index !== null;
   },
@@ -157,9 +428,112 @@ var Search = {
   },
 
   /**
-   * execute search (requires search index to be loaded)
+   * execute search (requires search index to be loaded), in the worker if
+   * there is one, and display the results as they come in
    */
   query : function(query) {
+    var counter = ++this._counter;
+    var searchterms = [];
+    var hlterms = [];
+    var highlightstring = '';
+    var results = [];
+    var resultCount = 0;
+    var finished = false;
+    var displaying = false;
+
+    // print the results
+    function displayNextItem() {
+      if (Search._counter > counter) {
+        return;
+      }
+
+      // results left, load the summary and display it
+      if (results.length) {
+        var item = results.shift();
+        var listItem = $('<li></li>');
+        var requestUrl = "";
+        var linkUrl = "";
+        if (DOCUMENTATION_OPTIONS.BUILDER === 'dirhtml') {
+          // dirhtml builder
+          var dirname = item[0] + '/';
+          if (dirname.match(/\/index\/$/)) {
+            dirname = dirname.substring(0, dirname.length-6);
+          } else if (dirname == 'index/') {
+            dirname = '';
+          }
+          requestUrl = DOCUMENTATION_OPTIONS.URL_ROOT + dirname;
+          linkUrl = requestUrl;
+
+        } else {
+          // normal html builders
+          requestUrl = item[0] + DOCUMENTATION_OPTIONS.FILE_SUFFIX;
+          linkUrl = item[0] + DOCUMENTATION_OPTIONS.LINK_SUFFIX || '';
+        }
+        listItem.append($('<a/>').attr('href',
+            linkUrl +
+            highlightstring + item[2]).html(item[1]));
+        if (item[3]) {
+          listItem.append($('<span> (' + item[3] + ')</span>'));
+        } else {
+          Search.showSummary(listItem, item[0], searchterms, hlterms);
+        }
+        Search.output.append(listItem);
+        setTimeout(function() {
+          displayNextItem();
+        }, 5);
+      }
+      // search finished, update title and status message
+      else if (finished) {
+        Search._current_query = null;
+        Search.stopPulse();
+        Search.title.text(_('Search Results'));
+        if (!resultCount)
+          Search.status.text(_('Your search did not match any documents. Please make sure that all words are spelled correctly and that you\'ve selected enough categories.'));
+        else
+            Search.status.text(_('Search finished, found %s page(s) matching the search query.').replace('%s', resultCount));
+        Search.status.fadeIn(500);
+      }
+      // wait for the next batch
+      else {
+        displaying = false;
+      }
+    }
+
+    this._current_query = query;
+    this._on_results = function(batch, terms, words, done) {
+      searchterms = terms;
+      hlterms = words;
+      highlightstring = '?highlight=' + $.urlencode(hlterms.join(" "));
+      results = results.concat(batch);
+      resultCount += batch.length;
+      finished = done;
+      if (!displaying) {
+        displaying = true;
+        $('#search-progress').empty();
+        displayNextItem();
+      }
+    };
+
+    if (this._worker) {
+      this._worker.postMessage({type: 'query', counter: counter, query: query,
+                                partialMatches: this.partialMatches,
+                                apiMatches: this.apiMatches,
+                                bodyMatches: this.bodyMatches});
+    } else {
+      this.search(query, function(results, searchterms, hlterms) {
+        if (Search._counter == counter) {
+          Search._on_results(results, searchterms, hlterms, true);
+        }
+      });
+    }
+  },
+
+  /**
+   * stem the words of the query, load the parts of the index they need and
+   * call back with the ranked results (best first), the search terms and the
+   * words to highlight
+   */
+  search : function(query, callback) {
     var i;
 
     // stem the searchterms and add them to the correct list
@@ -199,19 +573,82 @@ var Search = {
       if (!$u.contains(toAppend, word))
         toAppend.push(word);
     }
-    var highlightstring = '?highlight=' + $.urlencode(hlterms.join(" "));
 
     // console.debug('SEARCH: searching for:');
     // console.info('required: ', searchterms);
     // console.info('excluded: ', excluded);
 
+    this.loadQueryShards(objectterms, searchterms, excluded, function() {
+      callback(Search.executeQuery(objectterms, searchterms, excluded), searchterms, hlterms);
+    });
+  },
+
+  /**
+   * load the shards of the index that the given words may be found in, which
+   * takes two steps: the partial matches and the objects shards to look in
+   * are found from the partial and trigrams shards
+   */
+  loadQueryShards : function(objectterms, searchterms, excluded, callback) {
+    var shards = this._index.shards;
+    var names = [];
+    var i, j;
+
+    if (shards.docs) {
+      names.push(this._indexdir + 'docs-0');
+    }
+    var words = searchterms.concat(excluded);
+    for (i = 0; i < words.length; i++) {
+      names.push(this._indexdir + 'terms-' + this.getShard(words[i].substr(0, 2), shards.terms));
+    }
+    if (this.partialMatches) {
+      for (i = 0; i < searchterms.length; i++) {
+        if (searchterms[i].length > 2) {
+          names.push(this._indexdir + 'partial-' + this.getShard(searchterms[i].substr(0, 2), shards.partial));
+        }
+      }
+    }
+    if (this.apiMatches) {
+      for (i = 0; i < objectterms.length; i++) {
+        for (j = 0; j + 3 <= objectterms[i].length; j++) {
+          names.push(this._indexdir + 'trigrams-' + this.getShard(objectterms[i].substr(j, 3), shards.trigrams));
+        }
+      }
+    }
+
+    this.loadShards(names, function() {
+      var more = [];
+      if (Search.partialMatches) {
+        for (i = 0; i < searchterms.length; i++) {
+          if (searchterms[i].length > 2) {
+            var partial = Search.findPartialTerms(searchterms[i]);
+            for (j = 0; j < partial.length; j++) {
+              more.push(Search._indexdir + 'terms-' + Search.getShard(partial[j].substr(0, 2), shards.terms));
+            }
+          }
+        }
+      }
+      if (Search.apiMatches) {
+        for (i = 0; i < objectterms.length; i++) {
+          more = more.concat(Search.findObjectShards(objectterms[i]));
+        }
+      }
+      Search.loadShards(more, callback);
+    });
+  },
+
+  /**
+   * execute search (requires the shards of the index it needs to be loaded),
+   * returning the results best first
+   */
+  executeQuery : function(objectterms, searchterms, excluded) {
+    var i;
+
     // prepare search
     var terms = this._index.terms;
     var titleterms = this._index.titleterms;
 
     // array of [filename, title, anchor, descr, score]
     var results = [];
-    $('#search-progress').empty();
 
     // lookup as object
     for (i = 0; i < objectterms.length; i++) {
@@ -229,9 +666,8 @@ var Search = {
         results[i][4] = Scorer.score(results[i]);
     }
 
-    // now sort the results by score (in opposite order of appearance, since the
-    // display function below uses pop() to retrieve items) and then
-    // alphabetically
+    // now sort the results by score (in opposite order of appearance, which is
+    // turned around below) and then alphabetically
     results.sort(function(a, b) {
       var left = a[4];
       var right = b[4];
@@ -251,82 +687,7 @@ var Search = {
     //Search.lastresults = results.slice();  // a copy
     //console.info('search results:', Search.lastresults);
 
-    var counter = ++this._counter;
-
-    // print the results
-    var resultCount = results.length;
-    function displayNextItem() {
-      if (Search._counter > counter) {
-        return;
-      }
-
-      // results left, load the summary and display it
-      if (results.length) {
-        var item = results.pop();
-        var listItem = $('<li></li>');
-        var requestUrl = "";
-        var linkUrl = "";
-        if (DOCUMENTATION_OPTIONS.BUILDER === 'dirhtml') {
-          // dirhtml builder
-          var dirname = item[0] + '/';
-          if (dirname.match(/\/index\/$/)) {
-            dirname = dirname.substring(0, dirname.length-6);
-          } else if (dirname == 'index/') {
-            dirname = '';
-          }
-          requestUrl = DOCUMENTATION_OPTIONS.URL_ROOT + dirname;
-          linkUrl = requestUrl;
-
-        } else {
-          // normal html builders
-          requestUrl = item[0] + DOCUMENTATION_OPTIONS.FILE_SUFFIX;
-          linkUrl = item[0] + DOCUMENTATION_OPTIONS.LINK_SUFFIX || '';
-        }
-        listItem.append($('<a/>').attr('href',
-            linkUrl +
-            highlightstring + item[2]).html(item[1]));
-        if (item[3]) {
-          listItem.append($('<span> (' + item[3] + ')</span>'));
-          Search.output.append(listItem);
-          setTimeout(function() {
-            displayNextItem();
-          }, 5);
-        } else if (DOCUMENTATION_OPTIONS.HAS_SOURCE) {
-          $.ajax({url: requestUrl,
-                  dataType: "text",
-                  complete: function(jqxhr, textstatus) {
-                    var data = jqxhr.responseText;
-                    if (data !== '' && data !== undefined) {
-                      var summary = Search.makeSearchSummary(data, searchterms, hlterms);
-                      if (summary) {
-                        listItem.append(summary);
-                      }
-                    }
-                    Search.output.append(listItem);
-                    setTimeout(function() {
-                      displayNextItem();
-                    }, 5);
-                  }});
-        } else {
-          // no source available, just display title
-          Search.output.append(listItem);
-          setTimeout(function() {
-            displayNextItem();
-          }, 5);
-        }
-      }
-      // search finished, update title and status message
-      else {
-        Search.stopPulse();
-        Search.title.text(_('Search Results'));
-        if (!resultCount)
-          Search.status.text(_('Your search did not match any documents. Please make sure that all words are spelled correctly and that you\'ve selected enough categories.'));
-        else
-            Search.status.text(_('Search finished, found %s page(s) matching the search query.').replace('%s', resultCount));
-        Search.status.fadeIn(500);
-      }
-    }
-    displayNextItem();
+    return results.reverse();
   },
 
   /**
@@ -414,10 +775,70 @@ var Search = {
   },
 
   /**
-   * See https://developer.mozilla.org/en-US/docs/Web/JavaScript/Guide/Regular_Expressions
+   * find all terms (in either terms or titleterms) that contain the given
+   * word, using the sorted suffix array in the partial shard for the word
+   */
+  findPartialTerms : function(word) {
+    var shard = this._shards[this._indexdir + 'partial-' + this.getShard(word.substr(0, 2), this._index.shards.partial)];
+    var termlist = shard.termlist;
+    var suffixes = shard.termsuffixes;
+    var count = termlist.length;
+
+    // binary search for the first suffix that is not less than the word
+    var lo = 0, hi = suffixes.length;
+    while (lo < hi) {
+      var mid = (lo + hi) >> 1;
+      var entry = suffixes[mid];
+      if (termlist[entry % count].substr(Math.floor(entry / count)) < word) {
+        lo = mid + 1;
+      } else {
+        hi = mid;
+      }
+    }
+
+    // all suffixes starting with the word follow after it
+    var found = [];
+    var seen = {};
+    for (var i = lo; i < suffixes.length; i++) {
+      var index = suffixes[i] % count;
+      var offset = Math.floor(suffixes[i] / count);
+      if (termlist[index].substr(offset, word.length) !== word) {
+        break;
+      }
+      if (!seen.hasOwnProperty(index)) {
+        seen[index] = true;
+        found.push(termlist[index]);
+      }
+    }
+    return found;
+  },
+
+  /**
+   * find the objects shards that may contain objects whose full name contains
+   * the given word, from the trigrams shards for it
    */
-  escapeRegExp : function(string) {
-    return string.replace(/[.*+\-?^${}()|[\]\\]/g, '\\$&'); // $& means the whole matched string
+  findObjectShards : function(object) {
+    var count = this._index.shards.objects;
+    var shards = null;
+    var i;
+
+    if (object.length < 3) {
+      shards = [];
+      for (i = 0; i < count; i++) {
+        shards.push(i);
+      }
+    }
+    for (i = 0; i + 3 <= object.length; i++) {
+      var trigram = object.substr(i, 3);
+      var trigrams = this._shards[this._indexdir + 'trigrams-' + this.getShard(trigram, this._index.shards.trigrams)];
+      var found = trigrams.hasOwnProperty(trigram) ? trigrams[trigram] : [];
+      shards = (shards === null) ? found : shards.filter(function(shard) {
+        return found.indexOf(shard) !== -1;
+      });
+    }
+    return shards.map(function(shard) {
+      return Search._indexdir + 'objects-' + shard;
+    });
   },
 
   /**
@@ -427,6 +848,7 @@ var Search = {
     var docnames = this._index.docnames;
     var filenames = this._index.filenames;
     var titles = this._index.titles;
+    var ranked = this._index.doclengths !== undefined;
 
     var i, j, file;
     var fileMap = {};
@@ -439,19 +861,19 @@ var Search = {
       var files = [];
       var _o = [
         {files: terms[word], score: Scorer.term},
-        {files: titleterms[word], score: Scorer.title}
+        {files: titleterms[word], score: Scorer.title, title: true}
       ];
       // add support for partial matches
       if (word.length > 2 && this.partialMatches) {
-        var word_regex = this.escapeRegExp(word);
-        for (var w in terms) {
-          if (w.match(word_regex) && !terms[word]) {
-            _o.push({files: terms[w], score: Scorer.partialTerm})
+        var partial = this.findPartialTerms(word);
+        for (j = 0; j < partial.length; j++) {
+          if (terms[partial[j]] !== undefined && !terms[word]) {
+            _o.push({files: terms[partial[j]], score: Scorer.partialTerm})
           }
         }
-        for (var w in titleterms) {
-          if (w.match(word_regex) && !titleterms[word]) {
-              _o.push({files: titleterms[w], score: Scorer.partialTitle})
+        for (j = 0; j < partial.length; j++) {
+          if (titleterms[partial[j]] !== undefined && !titleterms[word]) {
+              _o.push({files: titleterms[partial[j]], score: Scorer.partialTitle, title: true})
           }
         }
       }
@@ -475,7 +897,7 @@ var Search = {
           file = _files[j];
           if (!(file in scoreMap))
             scoreMap[file] = {};
-          scoreMap[file][word] = o.score;
+          scoreMap[file][word] = ranked ? Search.weighTerm(o.score, _files.length, file, o.title) : o.score;
         }
       });
 
@@ -518,9 +940,10 @@ var Search = {
 
       // if we have still a valid result we can add it to the result list
       if (valid) {
-        // select one (max) score for the file.
-        // for better ranking, we should calculate ranking by using words statistics like basic tf-idf...
-        var score = $u.max($u.map(fileMap[file], function(w){return scoreMap[file][w]}));
+        // add up the BM25 weights of the words for the file, or without
+        // those, select one (max) score
+        var scores = $u.map(fileMap[file], function(w){return scoreMap[file][w]});
+        var score = ranked ? $u.reduce(scores, function(sum, s){return sum + s;}, 0) : $u.max(scores);
 
         var docnamematch = true;
         for (var w in searchterms) {
@@ -548,29 +971,102 @@ var Search = {
     return results;
   },
 
+  /**
+   * weigh the score of a full-text match of a term in the given document by
+   * BM25, where count is the number of documents the term is found in.  The
+   * index only records whether a document has a term, so it is counted once.
+   * The weight is scaled to keep the score of a term found in only a single
+   * document of average length as it is, and titles are not normalized by
+   * the length of the document.
+   */
+  weighTerm : function(score, count, file, title) {
+    var index = this._index;
+    var total = index.docnames.length;
+    var idf = Math.log(1 + (total - count + 0.5) / (count + 0.5));
+    var maxIdf = Math.log(1 + (total - 0.5) / 1.5);
+    if (!title) {
+      var norm = 1 - Scorer.bm25b + Scorer.bm25b * index.doclengths[file] / index.avgdoclength;
+      score *= (Scorer.bm25k1 + 1) / (1 + Scorer.bm25k1 * norm);
+    }
+    return score * idf / maxIdf;
+  },
+
+  /**
+   * add the summary of the given page to a search result once it scrolls
+   * into view, so that only the excerpts of the results on screen are loaded
+   */
+  showSummary : function(listItem, docname, keywords, hlwords) {
+    function load() {
+      Search.loadExcerpts(docname, function(sections) {
+        var summary = Search.makeSearchSummary(sections, keywords, hlwords);
+        if (summary) {
+          listItem.append(summary);
+        }
+      });
+    }
+    if (window.IntersectionObserver) {
+      var observer = new IntersectionObserver(function(entries) {
+        if (entries[0].isIntersecting) {
+          observer.disconnect();
+          load();
+        }
+      });
+      observer.observe(listItem[0]);
+    } else {
+      load();
+    }
+  },
+
+  /**
+   * call back with the section excerpts of the given page, which are loaded
+   * on first use from the shard of the excerpts that contains them
+   */
+  loadExcerpts : function(docname, callback) {
+    var count = this._index.excerptshards;
+    if (!count) {
+      return;
+    }
+    var name = (VARIATION ? VARIATION + '/' : '') + 'excerpts-' + this.getShard(docname, count);
+    this.loadShards([name], function() {
+      callback(Search._shards[name][docname]);
+    });
+  },
+
   /**
    * helper function to return a node containing the
-   * search summary for a given text. keywords is a list
-   * of stemmed words, hlwords is the list of normal, unstemmed
-   * words. the first one is used to find the occurrence, the
-   * latter for highlighting it.
+   * search summary for a given list of [anchor, title, text]
+   * sections. keywords is a list of stemmed words, hlwords is
+   * the list of normal, unstemmed words. the first one is used
+   * to find the occurrence, the latter for highlighting it.
    */
-  makeSearchSummary : function(htmlText, keywords, hlwords) {
-    var text = Search.htmlToText(htmlText);
-    if (text == "") {
+  makeSearchSummary : function(sections, keywords, hlwords) {
+    if (!sections || !sections.length) {
       return null;
     }
-    var textLower = text.toLowerCase();
+    // use the first section that mentions any of the keywords
+    var text = sections[0][2];
     var start = 0;
-    $.each(keywords, function() {
-      var i = textLower.indexOf(this.toLowerCase());
-      if (i > -1)
-        start = i;
-    });
+    for (var i = 0; i < sections.length; i++) {
+      var textLower = sections[i][2].toLowerCase();
+      var found = -1;
+      $.each(keywords, function() {
+        var j = textLower.indexOf(this.toLowerCase());
+        if (j > -1 && (found < 0 || j < found))
+          found = j;
+      });
+      if (found > -1) {
+        text = sections[i][2];
+        start = found;
+        break;
+      }
+    }
+    if (text == "") {
+      return null;
+    }
     start = Math.max(start - 120, 0);
     var excerpt = ((start > 0) ? '...' : '') +
       $.trim(text.substr(start, 240)) +
-      ((start + 240 - text.length) ? '...' : '');
+      ((start + 240 < text.length && text.substr(start + 240) != '...') ? '...' : '');
     var rv = $('<p class="context"></p>').text(excerpt);
     $.each(hlwords, function() {
       rv = rv.highlightText(this, 'highlighted');
@@ -631,15 +1127,18 @@ function replaceSearchTerm(q) {
   Search.init();
 };
 
-$(document).ready(function() {
-  Search.init();
+// not in searchworker.js
+if (typeof document !== 'undefined') {
+  $(document).ready(function() {
+    Search.init();
 
-  $('input[name="q"]').on("input", debounce(function(e) {
-    replaceSearchTerm($(this).val());
-  }, 250));
+    $('input[name="q"]').on("input", debounce(function(e) {
+      replaceSearchTerm($(this).val());
+    }, 250));
 
-  $('#rtd-search-form').on("submit", function(e) {
-    e.preventDefault();
-    replaceSearchTerm($('input[name="q"]').val());
+    $('#rtd-search-form').on("submit", function(e) {
+      e.preventDefault();
+      replaceSearchTerm($('input[name="q"]').val());
+    });
   });
-});
+}
@@ -0,0 +1,56 @@
+/*
+ * searchworker.js
+ * ~~~~~~~~~~~~~~~
+ *
+ * Web Worker that runs the searches of searchtools.js, so that big queries
+ * don't freeze the search page.  It loads the shards of the index that the
+ * queries need itself, and keeps them for the next queries.  The ranked
+ * results are posted back in batches, which the page displays as they come.
+ *
+ */
+
+// searchtools.js checks window.VARIATION to filter the objects found
+var window = self;
+var VARIATION = '';
+var translations = {};
+
+var BATCH_SIZE = 100;
+
+importScripts('underscore.js', 'language_data.js', 'searchtools.js');
+
+// the same as doctools.js, which needs the DOM
+var $u = _.noConflict();
+var _ = function(string) {
+  return translations.hasOwnProperty(string) ? translations[string] : string;
+};
+
+self.onmessage = function(event) {
+  var data = event.data;
+
+  if (data.type == 'init') {
+    VARIATION = data.variation;
+    translations = data.translations;
+    Search._searchroot = data.searchroot;
+    Search._indexdir = data.indexdir;
+    Search.loadScripts([data.searchroot + data.indexdir + 'manifest.js']);
+
+    // the page only needs to know this much about the index itself
+    self.postMessage({type: 'ready', index: {excerptshards: Search._index.excerptshards}});
+  }
+  else if (data.type == 'query') {
+    Search.partialMatches = data.partialMatches;
+    Search.apiMatches = data.apiMatches;
+    Search.bodyMatches = data.bodyMatches;
+
+    Search.search(data.query, function(results, searchterms, hlterms) {
+      var i = 0;
+      do {
+        self.postMessage({type: 'results', counter: data.counter,
+                          results: results.slice(i, i + BATCH_SIZE),
+                          searchterms: searchterms, hlterms: hlterms,
+                          done: i + BATCH_SIZE >= results.length});
+        i += BATCH_SIZE;
+      } while (i < results.length);
+    });
+  }
+};
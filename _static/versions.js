@@ -1,8 +1,11 @@
+// How long the version index and the page maps are cached for.
+var VERSIONS_CACHE_TTL = 60 * 60 * 1000;
+
 window.addEventListener("DOMContentLoaded", function() {
     var opts = window.DOCUMENTATION_OPTIONS;
 
     // Load in version index
-    $.getJSON(opts.URL_ROOT + "../_versions.json", function(versions) {
+    loadCachedJSON(opts.URL_ROOT + "../_versions.json", function(versions) {
         window.versionDropdown = document.getElementById("ver-dropdown");
         if (!window.versionDropdown) {
             return;
@@ -54,11 +57,122 @@ window.addEventListener("DOMContentLoaded", function() {
         if (isOutdated) {
             const latestPath = window.versionRoot + '/' + latestVersion + '/' + window.currentPagePath;
             $('div.document').prepend('<div class="admonition warning"><p class="first admonition-title">Note</p><p class="last">You are browsing the documentation for an obsolete version. <a href="' + latestPath + '">Click here</a> to go to the latest version.</p></div>');
+            $('div.document > div.admonition:first-child a').on('click', function(event) {
+                event.preventDefault();
+                goToVersion(latestVersion);
+            });
         }
     });
 });
 
+// Calls success with the JSON at the given URL, which is kept in
+// localStorage for VERSIONS_CACHE_TTL, or error if it could not be loaded.
+function loadCachedJSON(url, success, error) {
+    var key = 'versions.js:' + new URL(url, window.location.href).href;
+    var cached = null;
+    try {
+        cached = JSON.parse(window.localStorage.getItem(key));
+    } catch (e) {
+        // localStorage may be disabled, in which case it is not cached.
+    }
+    if (cached && Date.now() - cached.time < VERSIONS_CACHE_TTL) {
+        success(cached.data);
+        return;
+    }
+
+    $.getJSON(url, function(data) {
+        try {
+            window.localStorage.setItem(key, JSON.stringify({time: Date.now(), data: data}));
+        } catch (e) {
+            // Disabled or full, see above.
+        }
+        success(data);
+    }).fail(function() {
+        if (error) {
+            error();
+        }
+    });
+}
+
+// Must give the same result as get_page_hash in _ext/panda3d_docs/pages.py.
+function getPageHash(path) {
+    var hash = 0x811c9dc5;
+    for (var i = 0; i < path.length; ++i) {
+        hash = Math.imul(hash ^ path.charCodeAt(i), 16777619) >>> 0;
+    }
+    return hash;
+}
+
+// Returns whether the page map written by on_build_finished_page_map in
+// _ext/panda3d_docs/pages.py has the given page, by binary search of its
+// sorted hashes.
+function hasPage(pageMap, path) {
+    var hashes = pageMap.hashes;
+    if (!pageMap.decoded) {
+        // They are stored as the differences from the previous one
+        for (var i = 1; i < hashes.length; ++i) {
+            hashes[i] += hashes[i - 1];
+        }
+        pageMap.decoded = true;
+    }
+
+    var hash = getPageHash(path);
+    var low = 0;
+    var high = hashes.length;
+    while (low < high) {
+        var mid = (low + high) >> 1;
+        if (hashes[mid] < hash) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low < hashes.length && hashes[low] === hash;
+}
+
+// Returns the given page if it exists in the page map, or else the index of
+// the nearest section that does, or an empty string for the root.  The page
+// is given with the link suffix of this version, and returned with that of
+// the version of the page map.
+function findExistingPage(pageMap, path) {
+    var linkSuffix = window.DOCUMENTATION_OPTIONS.LINK_SUFFIX;
+    var index = 'index' + pageMap.suffix;
+    var parts = path.split('/');
+    var last = parts[parts.length - 1];
+    if (!last) {
+        last = 'index';
+    } else if (linkSuffix && last.slice(-linkSuffix.length) === linkSuffix) {
+        last = last.slice(0, -linkSuffix.length);
+    }
+    parts[parts.length - 1] = last + pageMap.suffix;
+
+    while (true) {
+        var page = parts.join('/');
+        if (hasPage(pageMap, page)) {
+            return page;
+        }
+        if (parts[parts.length - 1] !== index) {
+            parts[parts.length - 1] = index;
+        } else if (parts.length > 1) {
+            parts.pop();
+            parts[parts.length - 1] = index;
+        } else {
+            return '';
+        }
+    }
+}
+
+function goToVersion(version) {
+    var versionPath = window.versionRoot + '/' + version + '/';
+    loadCachedJSON(versionPath + '_pages.json', function(pageMap) {
+        window.location.pathname = versionPath + findExistingPage(pageMap, window.currentPagePath);
+    }, function() {
+        // Versions built before there were page maps
+        window.location.pathname = versionPath + window.currentPagePath;
+    });
+}
+
 function switchVersion(version) {
     window.versionDropdown.selectedIndex = window.versionIndex;
-    window.location.pathname = window.versionRoot + '/' + version + '/' + window.currentPagePath;
+    goToVersion(version);
 };
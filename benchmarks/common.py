@@ -0,0 +1,126 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+
+import os
+import pkgutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import ChainMap
+from importlib import import_module
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_conf(spec=None):
+    """Evaluates conf.py the way Sphinx does, returning its namespace, in which
+    the globals of the local extensions in the _ext directory can be looked up
+    as well.  spec may be a path to a conf.py file or a git revision of this
+    repository."""
+
+    if not spec:
+        return eval_conf(os.path.join(root_dir, 'conf.py'))
+
+    if os.path.isfile(spec):
+        return eval_conf(os.path.abspath(spec))
+
+    names = subprocess.check_output(
+        ['git', 'ls-tree', '-r', '--name-only', spec, '--', 'conf.py', '_ext'],
+        cwd=root_dir, universal_newlines=True).splitlines()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in names:
+            path = os.path.join(tmpdir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(subprocess.check_output(['git', 'show', spec + ':' + name], cwd=root_dir))
+
+        return eval_conf(os.path.join(tmpdir, 'conf.py'))
+
+
+def eval_conf(path):
+    from sphinx.config import eval_config_file
+    from sphinx.util.tags import Tags
+
+    # Forget the local extensions of any other revision that was loaded.
+    ext_dir = os.path.join(os.path.dirname(path), '_ext')
+    local = set(info.name for info in pkgutil.iter_modules([ext_dir]))
+    for name in list(sys.modules):
+        if name.split('.')[0] in local:
+            del sys.modules[name]
+
+    conf = eval_config_file(path, Tags())
+
+    # Older revisions had all of the hooks in conf.py itself.
+    modules = []
+    for ext in conf.get('extensions', ()):
+        if ext.split('.')[0] in local:
+            module = import_module(ext)
+            modules.append(module)
+            for info in pkgutil.walk_packages(getattr(module, '__path__', ()), ext + '.'):
+                modules.append(import_module(info.name))
+
+    return ChainMap(conf, *[vars(module) for module in modules])
+
+
+def load_databases(conf):
+    """Makes sure that the interrogate databases of all panda3d modules are
+    loaded."""
+
+    from panda3d import interrogatedb
+
+    for dir in conf.get('interrogatedb_search_path', ()):
+        interrogatedb.interrogate_add_search_directory(dir)
+
+    import panda3d
+    for info in pkgutil.iter_modules(panda3d.__path__):
+        # Skip the plug-in libraries and the deprecated dtoolconfig alias.
+        if info.name.startswith(('_', 'lib')) or info.name in ('dtoolconfig', 'interrogatedb'):
+            continue
+        try:
+            import_module('panda3d.' + info.name)
+        except ImportError:
+            pass
+
+
+def collect_comments():
+    """Returns a list of (comment, name) tuples for every documented type and
+    function in the loaded interrogate databases."""
+
+    from panda3d import interrogatedb as db
+    from sphinx_interrogatedb import idb
+
+    comments = []
+    for i in range(db.interrogate_number_of_global_types()):
+        itype = db.interrogate_get_global_type(i)
+        if db.interrogate_type_has_comment(itype):
+            name = db.interrogate_type_module_name(itype) + '.' + idb.get_type_name(itype, scoped=True)
+            comments.append((db.interrogate_type_comment(itype), name))
+
+    for i in range(db.interrogate_number_of_functions()):
+        ifunc = db.interrogate_get_function(i)
+        if db.interrogate_function_has_comment(ifunc):
+            name = db.interrogate_function_module_name(ifunc) + '.' + idb.get_function_name(ifunc, scoped=True, mangle=True)
+            comments.append((db.interrogate_function_comment(ifunc), name))
+
+    return comments
+
+
+def best_time(func, args_list, repeat):
+    """Calls func with each of the argument tuples in turn, and returns the
+    fastest total time over the given number of repetitions, in seconds."""
+
+    # Warm up any lazily built lookup tables first.
+    for args in args_list[:100]:
+        func(*args)
+
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
@@ -0,0 +1,69 @@
+"""Benchmark for convert_doxygen_docstring in the panda3d_docs extension.
+
+This converts the largest comments in the recording of the panda3d.core
+interrogate database in interrogatedb.json.gz (see standin.py), which are the
+ones that suffer most if the conversion is not linear in the number of lines.
+To make the scaling visible, each comment is also converted with its body
+repeated --scale times.  Use --compare to run the conf.py from
+another git revision (or another file) against the same corpus, eg::
+
+    python benchmarks/doxygen_docstring.py --compare HEAD~1
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+
+import standin
+from common import load_conf, collect_comments, best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--compare', metavar='REV', help='git revision or path of a conf.py to compare against')
+    parser.add_argument('--count', type=int, default=50, help='number of comments to convert (default: 50)')
+    parser.add_argument('--scale', type=int, default=20, help='repeat factor for the scaled run (default: 20)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions (default: 3)')
+    parser.add_argument('--database', default=standin.default_path, help='recorded database (default: %(default)s)')
+    args = parser.parse_args()
+
+    standin.install(args.database)
+
+    confs = [('current', load_conf())]
+    if args.compare:
+        confs.insert(0, (args.compare, load_conf(args.compare)))
+
+    for label, conf in confs:
+        if not conf.get('build_api_reference'):
+            print("The sphinx-interrogatedb package is required to run this benchmark.")
+            return 1
+
+    comments = [(comment.splitlines(), name)
+                for comment, name in collect_comments()
+                if name.startswith('panda3d.core.')]
+    comments.sort(key=lambda item: len(item[0]), reverse=True)
+    comments = comments[:args.count]
+
+    # Repeat the body of each comment, keeping the opening and closing lines.
+    scaled = [(lines[:1] + lines[1:-1] * args.scale + lines[-1:], name)
+              for lines, name in comments]
+
+    for label, corpus in (('largest', comments), ('x{0}'.format(args.scale), scaled)):
+        num_lines = sum(len(lines) for lines, name in corpus)
+        print("{0}: {1} comments, {2} lines, up to {3} lines each".format(
+            label, len(corpus), num_lines, max(len(lines) for lines, name in corpus)))
+
+        for domain in ('py', 'cpp'):
+            for conf_label, conf in confs:
+                args_list = [(lines, name, domain) for lines, name in corpus]
+                # Don't let the warnings about unhandled tags skew the timing.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed = best_time(conf['convert_doxygen_docstring'], args_list, args.repeat)
+                print("{0:>6} {1:<16} {2:8.2f} us/line".format(domain, conf_label, elapsed * 1e6 / num_lines))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
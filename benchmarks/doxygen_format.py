@@ -0,0 +1,57 @@
+"""Microbenchmark for convert_doxygen_format in the panda3d_docs extension.
+
+This feeds every line of every comment in the recording of the interrogate
+databases in interrogatedb.json.gz (see standin.py) through
+convert_doxygen_format, and reports the average cost per line, so it gives the
+same results with or without Panda3D installed.  Use --compare to run the
+conf.py from another git revision (or another file) against the same corpus,
+eg::
+
+    python benchmarks/doxygen_format.py --compare HEAD~1
+"""
+
+import argparse
+import sys
+
+import standin
+from common import load_conf, collect_comments, best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--compare', metavar='REV', help='git revision or path of a conf.py to compare against')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions (default: 3)')
+    parser.add_argument('--database', default=standin.default_path, help='recorded database (default: %(default)s)')
+    args = parser.parse_args()
+
+    standin.install(args.database)
+
+    confs = [('current', load_conf())]
+    if args.compare:
+        confs.insert(0, (args.compare, load_conf(args.compare)))
+
+    for label, conf in confs:
+        if not conf.get('build_api_reference'):
+            print("The sphinx-interrogatedb package is required to run this benchmark.")
+            return 1
+
+    lines = []
+    for comment, name in collect_comments():
+        for line in comment.splitlines():
+            line = line.strip('/* \t')
+            if line:
+                lines.append((line, name))
+
+    print("Corpus: {0} lines".format(len(lines)))
+
+    for domain in ('py', 'cpp'):
+        for label, conf in confs:
+            args_list = [(line, name, domain) for line, name in lines]
+            elapsed = best_time(conf['convert_doxygen_format'], args_list, args.repeat)
+            print("{0:>4} {1:<16} {2:8.2f} us/line".format(domain, label, elapsed * 1e6 / len(lines)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
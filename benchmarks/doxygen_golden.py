@@ -0,0 +1,159 @@
+"""Golden-output check for the Doxygen conversion in the panda3d_docs extension.
+
+This runs convert_doxygen_format and convert_doxygen_docstring over a set of
+comments from the recording in interrogatedb.json.gz (see standin.py) and some
+hand-written lines with tricky inline markup, in both the py and cpp domains,
+and compares the results with those stored in doxygen_golden.json.  The exit
+status is 1 if any of them differ.  After an intended change in the output,
+store the new results::
+
+    python benchmarks/doxygen_golden.py --save
+
+Use --conf to check (or save the results of) the conf.py from another git
+revision or another file, eg. to make sure the stored results match those of
+an older revision::
+
+    python benchmarks/doxygen_golden.py --conf HEAD~1
+"""
+
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import re
+import sys
+
+import standin
+
+golden_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doxygen_golden.json')
+
+# Every comment with one of these is checked, and every sample_interval'th one
+# of the rest.
+tag_pattern = re.compile(r'@\w+|<b>|`')
+sample_interval = 200
+
+# Lines that exercise the corners of convert_doxygen_format, with the name of
+# the object they would be documenting.
+format_cases = [
+    ('Calls NodePath::reparent_to() and get_parent().', 'panda3d.core.NodePath.reparent_to'),
+    ('Returns a copy of this `NodePath`, see ``get_child()``.', 'panda3d.core.NodePath.copy_to'),
+    ('Sets the @c Texture to use for @p stage, and the @c TextureStage::get_default().', 'panda3d.core.NodePath.set_texture'),
+    ('This is <b>not</b> the same as PandaNode::get_child(), nor <b>get_parent()</b>.', 'panda3d.core.NodePath.node'),
+    ('Takes a std::string, or nullptr to clear the name.', 'panda3d.core.PandaNode.set_name'),
+    ('(See also get_num_children(), get_child().)', 'panda3d.core.PandaNode.get_children'),
+    ('The BT_default, ALL_CAPS_CONSTANT and CamelCase_name values.', 'panda3d.core.Texture.set_format'),
+    ('Compares with operator == and a::b::c, as well as ::global_function().', 'panda3d.core.NodePath.compare_to'),
+    ('See http://www.panda3d.org/ or foo.bar() for more.', 'panda3d.core.Texture.read'),
+    ('Between 1.5e3 and 0.5f, or the value of get_x()/get_y().', 'panda3d.core.LVecBase3f.normalize'),
+    ('Uses setup_x and SetupX, but not setupX().', 'panda3d.core.Texture.setup_2d_texture'),
+    ('Empty `` backticks, and `unclosed backtick.', 'panda3d.core.Texture.clear'),
+    ('GeomVertexData::get_array() and GeomVertexArrayData.get_handle()', 'panda3d.core.GeomVertexData'),
+    ('Refers to BulletWorld::do_physics() from panda3d.core.', 'panda3d.bullet.BulletWorld.attach'),
+    ('Nested Texture::CompressionMode and Texture.CM_off values.', 'panda3d.core.Texture.set_compression'),
+    ('A NodePath.reparent_to() call in the middle of a sentence, then AsyncTask.', 'panda3d.core'),
+    ('', 'panda3d.core.NodePath'),
+]
+
+# Whole comments that exercise the corners of convert_doxygen_docstring.
+docstring_cases = [
+    ('/**\n * Returns the thing.\n *\n * @param name the name\n * @return the thing, or nullptr\n */',
+     'panda3d.core.NodePath.find'),
+    ('// Filename: nodePath.h\n////////////////////////////////////\n// Some description\n// of NodePath::find().',
+     'panda3d.core.NodePath.find'),
+    ('///< Trailing comment, see get_child().', 'panda3d.core.PandaNode.get_child'),
+    ('/**\n * @brief Short.\n * @details Longer text,\n * over two lines.\n */', 'panda3d.core.Texture'),
+    ('/**\n * Example:\n * @code\n *   np.reparent_to(render)\n *   // a comment\n * @endcode\n * After.\n */',
+     'panda3d.core.NodePath.reparent_to'),
+    ('/**\n * @verbatim\n   raw *text*\n   NodePath::foo()\n   @endverbatim\n */', 'panda3d.core.NodePath'),
+    ('/**\n * @deprecated Use get_child() instead.\n * @since 1.10.0\n */', 'panda3d.core.PandaNode.get_child_node'),
+    ('/**\n * Options:\n * @li The first, see NodePath.\n * @li The second.\n */', 'panda3d.core.Texture.set_format'),
+    ('/**\n * @par Heading\n * Paragraph text.\n *\n * @note A note.\n * @warning A warning.\n */',
+     'panda3d.core.Texture.reload'),
+    ('/**\n * @see NodePath::reparent_to\n * @sa PandaNode::get_child()\n */', 'panda3d.core.NodePath.wrt_reparent_to'),
+    ('/**\n * @unknown_tag goes through as is.\n * @f$ x^2 @f$\n */', 'panda3d.core.LVecBase3f.length'),
+    ('/** One-liner. */', 'panda3d.core.PandaNode'),
+    ('', 'panda3d.core.PandaNode'),
+]
+
+
+def collect_cases():
+    """Returns the list of (kind, name, input) tuples to check."""
+
+    from common import collect_comments
+
+    cases = [('format', name, line) for line, name in format_cases]
+    cases += [('docstring', name, comment) for comment, name in docstring_cases]
+
+    untagged = 0
+    for comment, name in collect_comments():
+        if not tag_pattern.search(comment):
+            untagged += 1
+            if untagged % sample_interval != 1:
+                continue
+        cases.append(('docstring', name, comment))
+
+    return cases
+
+
+def convert(conf, kind, name, input, domain):
+    # Unhandled tags are reported on stdout, which is part of the output.
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        if kind == 'format':
+            lines = [conf['convert_doxygen_format'](input, name, domain)]
+        else:
+            lines = conf['convert_doxygen_docstring'](input.splitlines(), name, domain)
+    return lines + out.getvalue().splitlines()
+
+
+def main():
+    from common import load_conf
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--conf', metavar='REV', help='git revision or path of the conf.py to check')
+    parser.add_argument('--golden', default=golden_path, help='stored results (default: %(default)s)')
+    parser.add_argument('--database', default=standin.default_path, help='recorded database (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='store the results instead of checking them')
+    args = parser.parse_args()
+
+    recording = standin.install(args.database)
+    conf = load_conf(args.conf)
+    if not conf.get('build_api_reference'):
+        print("The sphinx-interrogatedb package is required to run the check.")
+        return 1
+
+    if args.save:
+        results = []
+        for kind, name, input in collect_cases():
+            for domain in ('py', 'cpp'):
+                results.append({'kind': kind, 'name': name, 'domain': domain, 'input': input,
+                                'output': convert(conf, kind, name, input, domain)})
+
+        with open(args.golden, 'w', encoding='utf-8') as fh:
+            json.dump({'panda3d_version': recording['panda3d_version'], 'results': results},
+                      fh, indent=1, ensure_ascii=False)
+            fh.write('\n')
+        print("Saved {0} results to {1}".format(len(results), args.golden))
+        return 0
+
+    with open(args.golden, encoding='utf-8') as fh:
+        results = json.load(fh)['results']
+
+    failures = 0
+    for result in results:
+        output = convert(conf, result['kind'], result['name'], result['input'], result['domain'])
+        if output != result['output']:
+            failures += 1
+            if failures <= 10:
+                print("{0} {1} ({2}):".format(result['kind'], result['name'], result['domain']))
+                for line in difflib.unified_diff(result['output'], output, 'expected', 'actual', lineterm=''):
+                    print('    ' + line)
+
+    print("{0} of {1} results differ from {2}".format(failures, len(results), args.golden))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
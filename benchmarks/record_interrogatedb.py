@@ -0,0 +1,119 @@
+"""Records the interrogate databases of the installed Panda3D build.
+
+This writes the part of the interrogatedb API that the build relies on to a
+compressed JSON file, which standin.py can then load in place of the real
+panda3d.interrogatedb module.  This allows running the benchmark suite on a
+machine that does not have Panda3D installed.  Run this again after upgrading
+Panda3D to refresh the recording, eg::
+
+    python benchmarks/record_interrogatedb.py
+"""
+
+import argparse
+import gzip
+import json
+import sys
+
+from common import load_conf, load_databases
+from standin import default_path, TYPE_FLAGS
+
+
+def record():
+    """Returns the recorded databases as a JSON-serializable dictionary."""
+
+    import panda3d
+    from panda3d import interrogatedb as db
+
+    types = {}
+    funcs = {}
+
+    def visit_function(ifunc):
+        if not ifunc or ifunc in funcs:
+            return
+        has_comment = db.interrogate_function_has_comment(ifunc)
+        funcs[ifunc] = [
+            db.interrogate_function_name(ifunc),
+            db.interrogate_function_scoped_name(ifunc),
+            db.interrogate_function_module_name(ifunc),
+            db.interrogate_function_class(ifunc),
+            db.interrogate_function_is_method(ifunc),
+            db.interrogate_function_comment(ifunc) if has_comment else None,
+        ]
+        visit_type(db.interrogate_function_class(ifunc))
+
+    def visit_type(itype):
+        if not itype or itype in types:
+            return
+        flags = 0
+        for bit, flag in enumerate(TYPE_FLAGS):
+            if getattr(db, 'interrogate_type_is_' + flag)(itype):
+                flags |= 1 << bit
+        nested = [db.interrogate_type_get_nested_type(itype, i)
+                  for i in range(db.interrogate_type_number_of_nested_types(itype))]
+        derivations = [db.interrogate_type_get_derivation(itype, i)
+                       for i in range(db.interrogate_type_number_of_derivations(itype))]
+        constructors = [db.interrogate_type_get_constructor(itype, i)
+                        for i in range(db.interrogate_type_number_of_constructors(itype))]
+        has_comment = db.interrogate_type_has_comment(itype)
+        types[itype] = [
+            db.interrogate_type_name(itype),
+            db.interrogate_type_scoped_name(itype),
+            db.interrogate_type_module_name(itype),
+            db.interrogate_type_outer_class(itype),
+            flags,
+            nested,
+            derivations,
+            constructors,
+            db.interrogate_type_comment(itype) if has_comment else None,
+        ]
+        visit_type(db.interrogate_type_outer_class(itype))
+        for itype2 in nested + derivations:
+            visit_type(itype2)
+        for ifunc in constructors:
+            visit_function(ifunc)
+
+    global_types = [db.interrogate_get_global_type(i)
+                    for i in range(db.interrogate_number_of_global_types())]
+    functions = [db.interrogate_get_function(i)
+                 for i in range(db.interrogate_number_of_functions())]
+
+    for itype in global_types:
+        visit_type(itype)
+    for ifunc in functions:
+        visit_function(ifunc)
+
+    return {
+        'panda3d_version': panda3d.__version__,
+        'global_types': global_types,
+        'functions': functions,
+        'type_data': {str(itype): data for itype, data in sorted(types.items())},
+        'function_data': {str(ifunc): data for ifunc, data in sorted(funcs.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default=default_path, help='file to write (default: %(default)s)')
+    args = parser.parse_args()
+
+    conf = load_conf()
+    if not conf.get('build_api_reference'):
+        print("Panda3D's interrogatedb module is required to make a recording.")
+        return 1
+
+    load_databases(conf)
+    data = record()
+
+    # Leave out the timestamp, so that the file only changes if the data does.
+    with open(args.output, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as fh:
+            fh.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    print("Recorded {0} types and {1} functions from Panda3D {2} to {3}".format(
+        len(data['type_data']), len(data['function_data']),
+        data['panda3d_version'], args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""A stand-in for the panda3d.interrogatedb module.
+
+This serves the interrogate functions that the panda3d_docs extension and
+sphinx_interrogatedb's idb module rely on from a recording made by
+record_interrogatedb.py, so that the extension can be benchmarked on a machine
+without Panda3D.  Like the real
+module, out-of-range indices yield 0 or an empty string instead of raising.
+Only the sphinx-interrogatedb package needs to be installed (if need be, with
+``pip install --no-deps``), since its idb module is imported on top of this.
+"""
+
+import gzip
+import json
+import os
+import sys
+import types
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interrogatedb.json.gz')
+
+# The interrogate_type_is_* flags, in the order of the bits in the recording.
+TYPE_FLAGS = ('typedef', 'enum', 'struct', 'class', 'union')
+
+
+def load(path=default_path):
+    """Loads a recording, returning it as dictionary."""
+
+    with gzip.open(path, 'rb') as fh:
+        data = json.loads(fh.read().decode('utf-8'))
+
+    data['type_data'] = {int(key): value for key, value in data['type_data'].items()}
+    data['function_data'] = {int(key): value for key, value in data['function_data'].items()}
+    return data
+
+
+def make_module(data):
+    """Creates a module object implementing the interrogatedb API on top of
+    the given recording."""
+
+    module = types.ModuleType('panda3d.interrogatedb')
+    module.__doc__ = "Stand-in for panda3d.interrogatedb, recorded from Panda3D {0}.".format(data['panda3d_version'])
+    module.__all__ = []
+
+    global_types = data['global_types']
+    functions = data['functions']
+    type_data = data['type_data']
+    function_data = data['function_data']
+
+    no_type = ['', '', '', 0, 0, (), (), (), None]
+    no_function = ['', '', '', 0, False, None]
+
+    def export(func):
+        module.__all__.append(func.__name__)
+        setattr(module, func.__name__, func)
+        return func
+
+    def field_getter(name, table, default, index):
+        def getter(i):
+            return table.get(i, default)[index]
+        getter.__name__ = name
+        return export(getter)
+
+    def list_getters(noun, index):
+        def count(itype):
+            return len(type_data.get(itype, no_type)[index])
+
+        def get(itype, n):
+            items = type_data.get(itype, no_type)[index]
+            return items[n] if 0 <= n < len(items) else 0
+
+        count.__name__ = 'interrogate_type_number_of_' + noun + 's'
+        get.__name__ = 'interrogate_type_get_' + noun
+        export(count)
+        export(get)
+
+    def comment_getters(prefix, table, default, index):
+        def has_comment(i):
+            return table.get(i, default)[index] is not None
+
+        def comment(i):
+            return table.get(i, default)[index] or ''
+
+        has_comment.__name__ = prefix + '_has_comment'
+        comment.__name__ = prefix + '_comment'
+        export(has_comment)
+        export(comment)
+
+    @export
+    def interrogate_add_search_directory(dirname):
+        pass
+
+    @export
+    def interrogate_number_of_global_types():
+        return len(global_types)
+
+    @export
+    def interrogate_get_global_type(n):
+        return global_types[n] if 0 <= n < len(global_types) else 0
+
+    @export
+    def interrogate_number_of_functions():
+        return len(functions)
+
+    @export
+    def interrogate_get_function(n):
+        return functions[n] if 0 <= n < len(functions) else 0
+
+    field_getter('interrogate_type_name', type_data, no_type, 0)
+    field_getter('interrogate_type_scoped_name', type_data, no_type, 1)
+    field_getter('interrogate_type_module_name', type_data, no_type, 2)
+    field_getter('interrogate_type_outer_class', type_data, no_type, 3)
+    list_getters('nested_type', 5)
+    list_getters('derivation', 6)
+    list_getters('constructor', 7)
+    comment_getters('interrogate_type', type_data, no_type, 8)
+
+    for bit, flag in enumerate(TYPE_FLAGS):
+        def is_flag(itype, mask=1 << bit):
+            return bool(type_data.get(itype, no_type)[4] & mask)
+        is_flag.__name__ = 'interrogate_type_is_' + flag
+        export(is_flag)
+
+    field_getter('interrogate_function_name', function_data, no_function, 0)
+    field_getter('interrogate_function_scoped_name', function_data, no_function, 1)
+    field_getter('interrogate_function_module_name', function_data, no_function, 2)
+    field_getter('interrogate_function_class', function_data, no_function, 3)
+    field_getter('interrogate_function_is_method', function_data, no_function, 4)
+    comment_getters('interrogate_function', function_data, no_function, 5)
+
+    return module
+
+
+def install(path=default_path):
+    """Makes the recording at the given path importable as
+    panda3d.interrogatedb, replacing Panda3D if it is installed.  This needs
+    to happen before conf.py, the panda3d_docs extension or sphinx_interrogatedb
+    are first imported.
+    Returns the recording."""
+
+    if 'sphinx_interrogatedb' in sys.modules:
+        raise RuntimeError("sphinx_interrogatedb was imported before the stand-in was installed")
+
+    data = load(path)
+    module = make_module(data)
+
+    package = types.ModuleType('panda3d')
+    package.__path__ = []
+    package.__version__ = data['panda3d_version']
+    package.interrogatedb = module
+
+    sys.modules['panda3d'] = package
+    sys.modules['panda3d.interrogatedb'] = module
+
+    # Newer versions of sphinx-interrogatedb import it under this name.
+    sys.modules['interrogatedb'] = module
+
+    # Keep conf.py from finding the .in files of an installed Panda3D.
+    sys.modules['pandac'] = None
+
+    return data
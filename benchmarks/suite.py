@@ -0,0 +1,224 @@
+"""Benchmark suite for the interrogate-dependent hooks of the manual.
+
+This times resolve_reference, convert_doxygen_docstring, on_missing_reference
+and the symbol index against the recording in interrogatedb.json.gz (see
+standin.py), so it gives the same results with or without Panda3D installed.
+The timings are divided by those of a fixed pure-Python workload, which makes
+them roughly comparable between machines, and then checked against the stored
+baseline.json.  The exit status is 1 if any of them got slower by more than
+--threshold.  After an intended change in performance, update the baseline::
+
+    python benchmarks/suite.py --save
+
+Use --compare to run the conf.py from another git revision (or another file)
+side by side with the current one, eg::
+
+    python benchmarks/suite.py --compare HEAD~1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+import types
+
+import standin
+
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Matches the cross-references to the API reference in the manual.
+rst_ref_pattern = re.compile(r':(?:py:)?(class|meth|func|attr|obj|enum):`(?:[^`<]*<)?~?\.?([^`<>]+?)(?:\(\))?>?`')
+
+
+def collect_references(root_dir):
+    """Returns a (reftype, target) tuple for every reference in the manual."""
+
+    refs = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = sorted(dir for dir in dirnames if not dir.startswith(('.', '_')))
+        for filename in sorted(filenames):
+            if filename.endswith('.rst'):
+                with open(os.path.join(dirpath, filename), encoding='utf-8') as fh:
+                    refs += rst_ref_pattern.findall(fh.read())
+    return refs
+
+
+def calibrate():
+    """A fixed workload of string and dictionary operations that the timings
+    are expressed relative to."""
+
+    table = {}
+    for i in range(100000):
+        key = 'Type{0}.method_{1}'.format(i % 997, i)
+        table[key] = key.split('.')[-1].replace('_', '')
+    return sorted(table, key=table.get)[:10]
+
+
+def time_best(func, repeat, setup=None):
+    """Runs func once as warm-up, then returns the fastest of the given number
+    of runs in seconds, as well as that of calibrate.  The two are alternated,
+    so that both see the same changes in machine load.  setup is called before
+    each run of func, untimed."""
+
+    func()
+    best = None
+    best_unit = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        calibrate()
+        elapsed = time.perf_counter() - start
+        if best_unit is None or elapsed < best_unit:
+            best_unit = elapsed
+
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, best_unit
+
+
+def make_benchmarks(conf, comments, refs):
+    """Returns a list of (name, calls, func, setup) tuples for the given conf.py
+    namespace.  Benchmarks for functions it does not have are left out."""
+
+    from docutils import nodes
+    from sphinx import addnodes
+
+    benchmarks = []
+
+    if 'build_symbol_index' in conf:
+        benchmarks.append(('build_symbol_index', 1, conf['build_symbol_index'], None))
+
+    # Every reference convert_doxygen_format would try to resolve.
+    resolve_args = []
+    for comment, name in comments:
+        for match in conf['method_class_ref_pattern'].finditer(comment):
+            ref = match.group(1) or match.group(2) or match.group(4)
+            resolve_args.append((ref, name))
+
+    def run_resolve_reference(resolve_reference=conf['resolve_reference']):
+        for domain in ('py', 'cpp'):
+            for ref, rel in resolve_args:
+                resolve_reference(ref, rel, domain)
+
+    benchmarks.append(('resolve_reference', len(resolve_args) * 2, run_resolve_reference, None))
+
+    docstring_args = [(comment.splitlines(), name) for comment, name in comments]
+
+    def run_convert_doxygen_docstring(convert=conf['convert_doxygen_docstring']):
+        # Don't let the warnings about unhandled tags skew the timing.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for domain in ('py', 'cpp'):
+                for lines, name in docstring_args:
+                    convert(lines, name, domain)
+
+    benchmarks.append(('convert_doxygen_docstring', len(docstring_args) * 2, run_convert_doxygen_docstring, None))
+
+    # A minimal environment for on_missing_reference to run in, with domains
+    # that accept whatever it resolves to.
+    class Domain:
+        def __init__(self, name):
+            self.name = name
+
+        def resolve_xref(self, env, fromdocname, builder, typ, target, node, contnode):
+            return contnode
+
+    builder = types.SimpleNamespace(current_variation=None)
+    env = types.SimpleNamespace(app=types.SimpleNamespace(builder=builder),
+                                domains={'py': Domain('py'), 'cpp': Domain('cpp')},
+                                docname='index')
+    xrefs = []
+    for typ, target in refs:
+        contnode = nodes.literal('', target + '()' if typ in ('meth', 'func') else target)
+        node = addnodes.pending_xref('', contnode, refdomain='py', reftype=typ, reftarget=target)
+        xrefs.append((node, contnode))
+
+    def run_on_missing_reference(on_missing_reference=conf['on_missing_reference']):
+        for variation in (('python', 'Python'), ('cpp', 'C++')):
+            builder.current_variation = variation
+            for node, contnode in xrefs:
+                on_missing_reference(env.app, env, node, contnode)
+
+    def reset_missing_reference():
+        conf.get('missing_reference_cache', {}).clear()
+
+    benchmarks.append(('on_missing_reference', len(xrefs) * 2, run_on_missing_reference, reset_missing_reference))
+
+    return benchmarks
+
+
+def main():
+    from common import root_dir, load_conf, collect_comments
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--compare', metavar='REV', help='git revision or path of a conf.py to compare against')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions (default: 5)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown that counts as a regression (default: 0.25)')
+    parser.add_argument('--baseline', default=baseline_path, help='baseline file (default: %(default)s)')
+    parser.add_argument('--database', default=standin.default_path, help='recorded database (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    recording = standin.install(args.database)
+
+    confs = [('current', load_conf())]
+    if args.compare:
+        confs.insert(0, (args.compare, load_conf(args.compare)))
+
+    for label, conf in confs:
+        if not conf.get('build_api_reference'):
+            print("The sphinx-interrogatedb package is required to run the benchmarks.")
+            return 1
+
+    comments = collect_comments()
+    refs = collect_references(root_dir)
+    print("Panda3D {0}: {1} comments, {2} references in the manual".format(
+        recording['panda3d_version'], len(comments), len(refs)))
+
+    baseline = {}
+    if not args.save and os.path.isfile(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)['results']
+
+    results = {}
+    regressions = []
+    for label, conf in confs:
+        for name, calls, func, setup in make_benchmarks(conf, comments, refs):
+            elapsed, unit = time_best(func, args.repeat, setup)
+            score = elapsed / unit
+            line = "{0:<26} {1:<12} {2:10.2f} us/call {3:9.3f}".format(
+                name, label, elapsed * 1e6 / calls, score)
+
+            if label == 'current':
+                results[name] = round(score, 4)
+                if name in baseline:
+                    change = score / baseline[name] - 1
+                    line += " {0:+7.1%}".format(change)
+                    if change > args.threshold:
+                        line += "  REGRESSION"
+                        regressions.append(name)
+            print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as fh:
+            json.dump({'panda3d_version': recording['panda3d_version'], 'results': results},
+                      fh, indent=4, sort_keys=True)
+            fh.write('\n')
+        print("Saved baseline to {0}".format(args.baseline))
+    elif regressions:
+        print("{0} benchmark(s) regressed by more than {1:.0%} against {2}".format(
+            len(regressions), args.threshold, args.baseline))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,26 +14,15 @@
 
 import sys
 import os
-import types
-import re
-from sphinx.ext import autodoc
-from docutils import nodes
-
-build_api_reference = True
-
-try:
-    from panda3d.interrogatedb import *
-    from sphinx_interrogatedb import idb
-except ImportError as ex:
-    print("Could not import Panda3D modules:")
-    print(ex)
-    print("Skipping building building the API reference.")
-    build_api_reference = False
 
 # If extensions (or modules to document with autodoc) are in another directory,
 # add these directories to sys.path here. If the directory is relative to the
 # documentation root, use os.path.abspath to make it absolute, like shown here.
-#sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.abspath('_ext'))
+
+# Whether the API reference is left out or can't be built, see the options
+# module of the panda3d_docs extension.
+from panda3d_docs.options import fast_build, build_api_reference
 
 # -- General configuration ------------------------------------------------
 
@@ -58,6 +47,10 @@ extensions = [
 if build_api_reference:
     extensions.append('sphinx_interrogatedb')
 
+# The hooks of this manual, which are in _ext/panda3d_docs.  It comes last, so
+# that they run after those of the other extensions.
+extensions.append('panda3d_docs')
+
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ['_templates']
 
@@ -104,6 +97,14 @@ variations = [('python', 'Python'),
 # directories to ignore when looking for source files.
 exclude_patterns = ['_build', 'Thumbs.db', '.DS_Store']
 
+# Types of warnings to leave out of the output.
+suppress_warnings = []
+
+# The pages of the API reference, which fast builds leave out.
+if fast_build:
+    exclude_patterns += ['reference/panda3d*', 'reference/direct*']
+    suppress_warnings += ['toc.excluded']
+
 # The reST default role (used for this markup: `text`) to use for all
 # documents.
 #default_role = None
@@ -385,7 +386,7 @@ autodoc_default_options = {
 }
 autodoc_inherit_docstrings = False
 napoleon_custom_sections = ["Usage", "Features"]
-autosummary_generate = True
+autosummary_generate = not fast_build
 # Prevent prepending module name to all classes/functions
 add_module_names = False
 
@@ -415,676 +416,3 @@ inheritance_edge_attrs = {
     "arrowsize": 0.75,
     "style": '""',
 }
-
-# Regex patterns.
-at_c_at_p_pattern = re.compile(r'@[cp]\s+([^\s]+)')
-method_class_ref_pattern = re.compile(r'([a-zA-Z_][a-zA-Z0-9_.:]*)\(\)|([a-zA-Z_][a-zA-Z0-9_]*::[a-zA-Z_][a-zA-Z0-9_.:]*)(\(\))?|([a-zA-Z_]+[A-Z0-9_][a-zA-Z0-9_.:]*)(\(\))?')
-
-# Built-in variables automatically resolved in references.
-builtins_types = {
-    'base': 'direct.showbase.ShowBase.ShowBase',
-    'render': 'panda3d.core.NodePath',
-    'render2d': 'panda3d.core.NodePath',
-    'aspect2d': 'panda3d.core.NodePath',
-    'pixel2d': 'panda3d.core.NodePath',
-    'hidden': 'panda3d.core.NodePath',
-    'loader': 'direct.showbase.Loader.Loader',
-    'taskMgr': 'direct.task.Task.TaskManager',
-    'jobMgr': 'direct.showbase.JobManager.JobManager',
-    'eventMgr': 'direct.showbase.EventManager.EventManager',
-    'messenger': 'direct.showbase.Messenger.Messenger',
-    'bboard': 'direct.showbase.BulletinBoard.BulletinBoard',
-    'ostream': 'panda3d.core.Ostream',
-    'globalClock': 'panda3d.core.ClockObject',
-    'vfs': 'panda3d.core.VirtualFileSystem',
-    'cpMgr': 'panda3d.core.ConfigPageManager',
-    'cvMgr': 'panda3d.core.ConfigVariableManager',
-    'pandaSystem': 'panda3d.core.PandaSystem',
-}
-
-
-class ExcludeDocumenter(autodoc.Documenter):
-    """Special documenter that excludes certain types from autosummary.
-
-    It works by matching our desired excluded types, but because it has a
-    special objtype not recognized by autosummary, it won't be included."""
-
-    objtype = "exclude"
-
-    priority = 99
-
-    @classmethod
-    def can_document_member(cls, member, membername, isattr, parent):
-        # We only want to trigger autosummary, which always passes the empty
-        # string as membername.
-        if membername:
-            return False
-
-        if isinstance(member, type):
-            if member.__name__.startswith("PointerToBase_ReferenceCountedVector_"):
-                return True
-
-        return False
-
-    def generate(self, *args, **kwargs):
-        # This should never even be invoked by autodoc.
-        return
-
-
-def resolve_reference(ref, rel, domain='py'):
-    """Looks up an interrogate symbol to its canonical name.  The second
-    argument is the fully qualified name it should be seen relative to, which
-    may be a module name, or a module name followed by an object name.
-
-    If found, returns a 2-tuple (type, fqname), else None."""
-
-    if not build_api_reference:
-        return None
-
-    # Find out which module we should be looking in.
-    modname = None
-    relpath = None
-    rel_parts = rel.replace('::', '.').split('.')
-    for i in range(len(rel_parts), 0, -1):
-        try_modname = '.'.join(rel_parts[:i])
-        if idb.has_module(try_modname):
-            modname = try_modname
-            relpath = rel_parts[i:]
-            break
-
-    if not modname:
-        return None
-
-    refpath = ref.replace('::', '.').split('.')
-
-    # Say `rel` is "panda3d.core.NodePath.node",
-    # and `ref` is "PandaNode.final", then we will try these in this order:
-    # - panda3d.core::NodePath.node.PandaNode.final
-    # - panda3d.core::NodePath.PandaNode.final
-    # - panda3d.core::PandaNode.final
-
-    for i in range(len(relpath), -1, -1):
-        search = relpath[:i] + refpath
-
-        if len(refpath) == 1 and i > 0 and refpath[0] == relpath[i - 1]:
-            # If we are looking for a name equal to the parent scope, we are
-            # probably referencing a class name from within that very class.
-            # We don't want to find the constructor, so skip this.
-            continue
-
-        ifunc = idb.lookup_function(modname, search)
-        if ifunc:
-            if domain == 'cpp':
-                func_name = interrogate_function_scoped_name(ifunc)
-                return ('func', func_name)
-            elif domain == 'py':
-                # Grab the mangled function name.
-                func_name = idb.get_function_name(ifunc, scoped=False, mangle=True)
-                if interrogate_function_is_method(ifunc):
-                    outer = interrogate_function_class(ifunc)
-                    prefix = interrogate_type_module_name(outer)
-                    if prefix:
-                        prefix += '.'
-                    type_name = idb.get_type_name(outer, mangle=False, scoped=True)
-                    if len(refpath) == 1 and interrogate_function_name(ifunc).lstrip('~') == interrogate_type_name(outer):
-                        # This matches a constructor, but we want the class.
-                        return ('class', prefix + type_name)
-                    else:
-                        return ('meth', prefix + type_name + '.' + func_name)
-                else:
-                    prefix = interrogate_function_module_name(ifunc)
-                    if prefix:
-                        prefix += '.'
-                    return ('func', prefix + func_name)
-
-        itype = idb.lookup_type(modname, search)
-        if itype:
-            # Grab the original type name.
-            if domain == 'cpp':
-                type_name = interrogate_type_scoped_name(itype)
-                if interrogate_type_is_typedef(itype):
-                    return ('type', type_name)
-                elif interrogate_type_is_enum(itype):
-                    return ('enum', type_name)
-                elif interrogate_type_is_struct(itype):
-                    return ('struct', type_name)
-                elif interrogate_type_is_class(itype):
-                    return ('class', type_name)
-                elif interrogate_type_is_union(itype):
-                    return ('union', type_name)
-            elif domain == 'py':
-                type_name = idb.get_type_name(itype, mangle=False, scoped=True)
-                prefix = interrogate_type_module_name(itype)
-                if prefix:
-                    prefix += '.'
-                return ('class', prefix + type_name)
-
-    if len(rel_parts) >= 2 and rel_parts[0] == 'panda3d' and rel_parts[1] != 'core':
-        # Look in panda3d.core instead, prefix the result with the module name.
-        rel_parts[1] = 'core'
-        return resolve_reference(ref, '.'.join(rel_parts), domain=domain)
-
-
-def convert_doxygen_format(line, name, domain='py'):
-    """Converts a single line of Doxygen formatting to Sphinx.
-    The name argument is the fully qualified name of the current module, class
-    or function, and is used to resolve references."""
-
-    line = line.replace('<b>', '**').replace('</b>', '**')
-
-    # Single backticks in doxygen map to doubles in Sphinx
-    line = line.replace('`', '``')
-
-    # But double backticks are literal backticks
-    line = line.replace('````', '\\`')
-
-    # @c and @p result in double backticks for the subsequent word
-    line = re.sub(at_c_at_p_pattern, r'``\1``', line)
-
-    parent = name.rsplit('.', 1)[-1]
-
-    # Search for method and class references.  We pick them up either when they
-    # have a scoping operator, or when they end with (), or when they clearly
-    # look like a class/method, or we would match all the words in the text!
-    words = line.split(' ')
-    in_backticks = False
-    for i, word in enumerate(words):
-        if '``' in word:
-            if word.count('``') % 2 == 1:
-                # This opens/closes a backtick block spanning multiple words.
-                in_backticks = not in_backticks
-                continue
-
-        if in_backticks:
-            continue
-
-        if word.endswith('.') or word.endswith(',') or word.endswith(';'):
-            # Punctuation.
-            suffix = word[-1]
-            word = word[:-1]
-        else:
-            suffix = ''
-
-        if word.endswith(')') and word.count(')') > word.count('('):
-            # It could be the last word in a parenthesized statement.
-            word = word[:-1]
-            suffix = ')' + suffix
-
-        # Don't replace the class name on the page of the class itself, unless
-        # it's already in backticks.
-        if word.rstrip('()') == parent:
-            continue
-
-        word = word.strip('`')
-
-        m = re.fullmatch(method_class_ref_pattern, word)
-        if not m:
-            continue
-
-        plural = False
-
-        result = resolve_reference(word.rstrip('()'), name, domain=domain)
-        if not result and word.endswith('s') and '::' not in word and word[:-1] != parent:
-            # Detect use of plural in references to classes.
-            result = resolve_reference(word[:-1], name, domain=domain)
-            plural = True
-
-        if not result:
-            continue
-
-        typ, target = result
-
-        if word == target:
-            words[i] = ':{0}:{1}:`{2}`{3}'.format(domain, typ, target, suffix)
-        else:
-            if domain == 'py' and typ in ('meth', 'func'):
-                # Replace last part with mangled name if appropriate.
-                word = word.replace('::', '.')
-                oldpart = word.rsplit('.', 1)[-1]
-                newpart = target.rsplit('.', 1)[-1]
-                if oldpart.endswith('()'):
-                    newpart += '()'
-
-                if oldpart != newpart:
-                    if word == oldpart:
-                        word = newpart
-                    else:
-                        word = word.rsplit('.', 1)[0] + '.' + newpart
-
-            if '.' not in word and '::' not in word and target.endswith('.' + word):
-                words[i] = ':{0}:{1}:`~{2}`{3}'.format(domain, typ, target, suffix)
-            else:
-                words[i] = ':{0}:{1}:`{2} <{3}>`{4}'.format(domain, typ, word, target, suffix)
-
-        #print("replaced", word, "with", words[i])
-
-    return ' '.join(words)
-
-
-def convert_doxygen_docstring(lines, name, domain='py'):
-    """Converts a doxygen-style C++ block comment to a Sphinx-style one.
-    The name argument is the fully qualified name of the current module, class
-    or function, and is used to resolve references."""
-
-    lines = lines[:]
-    newlines = []
-    indent = 0
-    reading_desc = False
-
-    while lines:
-        line = lines.pop(0)
-        if line.startswith("////"):
-            continue
-
-        line = line.rstrip()
-        if line.startswith('///<'):
-            strline = line[4:]
-        else:
-            strline = line
-
-        strline = strline.lstrip('/ \t')
-
-        if strline == "**" or strline == "*/":
-            continue
-
-        if strline.startswith("** "):
-            strline = strline[3:]
-        elif strline.startswith("* "):
-            strline = strline[2:]
-        elif strline == "*":
-            strline = ""
-
-        strline = strline.lstrip(' \t')
-
-        if strline.startswith('@'):
-            special = strline.split(' ', 1)[0][1:]
-            if special == 'par' and strline.endswith(':') and lines and '@code' in lines[0]:
-                newlines.append('   '*indent + strline[5:] + ':')
-                newlines.append('')
-                line = lines.pop(0)
-                offset = line.index('@code')
-                while lines:
-                    line = lines.pop(0)
-                    if '@endverbatim' in line or '@endcode' in line:
-                        break
-                    newlines.append('   ' + line[offset:])
-
-                newlines.append('')
-                continue
-            elif special == "verbatim" or special == "code":
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                newlines.append('.. code-block:: guess')
-                newlines.append('')
-                offset = line.index('@' + special)
-                while lines:
-                    line = lines.pop(0)
-                    if '@endverbatim' in line or '@endcode' in line:
-                        break
-                    newlines.append('   ' + line[offset:])
-
-                newlines.append('')
-                continue
-            elif special == "f[":
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                newlines.append('.. math::')
-                newlines.append('')
-                offset = line.index('@' + special)
-                while lines:
-                    line = lines.pop(0)
-                    if '@f]' in line:
-                        break
-                    newlines.append('   ' + line[offset:])
-
-                newlines.append('')
-                continue
-            elif special == 'param':
-                #TODO
-                #if extra is not None:
-                #    _, name, desc = strline.split(' ', 2)
-                #    extra['param:' + name] = desc
-                continue
-            elif special == 'deprecated':
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                if ' ' in strline:
-                    _, value = strline.split(' ', 1)
-
-                    # I'd love to use the proper Sphinx deprecated tag, but it
-                    # requires a version number, whereas Doxygen doesn't.
-                    newlines.append('**Deprecated**: ' + convert_doxygen_format(value, name, domain))
-                else:
-                    newlines.append('**Deprecated**')
-
-                newlines.append('')
-                continue
-            elif special in ('brief', 'return', 'returns'):
-                #TODO
-                #if extra is not None:
-                #    _, value = strline.split(' ', 1)
-                #    extra[special] = value
-                continue
-            elif special == 'details':
-                strline = strline[9:]
-            elif special == 'sa' or special == 'see':
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                _, value = strline.split(' ', 1)
-                values = value.split(',')
-
-                for i, value in enumerate(values):
-                    result = resolve_reference(value.partition('(')[0], name, domain=domain)
-                    if result:
-                        values[i] = ':{0}:{1}:`{2}`'.format(domain, *result)
-                    else:
-                        values[i] = ':{0}:obj:`{1}`'.format(domain, value)
-
-                if special == 'see':
-                    newlines.append('See {}.'.format(', '.join(values)))
-                else:
-                    newlines.append('See also {}.'.format(', '.join(values)))
-                newlines.append('')
-                continue
-            elif special in ('note', 'warning'):
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                newlines.append('.. %s:: ' % (special))
-                newlines.append('')
-                newlines.append('   ' + convert_doxygen_format(strline[2 + len(special):], name, domain))
-                while lines and lines[0].strip(' *\t/'):
-                    line = lines.pop(0).lstrip(' *\t')
-                    newlines.append('   ' + convert_doxygen_format(line, name, domain))
-
-                newlines.append('')
-                continue
-            elif special == 'since':
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                newlines.append('.. versionadded:: ' + strline[7:])
-                newlines.append('')
-                continue
-            elif special == 'li':
-                if newlines and newlines[-1]:
-                    newlines.append('')
-
-                newlines.append('* ' + convert_doxygen_format(strline[4:], name, domain))
-                newlines.append('')
-                continue
-            else:
-                print("Unhandled documentation tag: @" + special)
-
-        if strline or len(newlines) > 0:
-            newlines.append('   '*indent + convert_doxygen_format(strline, name, domain))
-
-    return newlines
-
-
-def on_autodoc_skip_member(app, what, name, obj, skip, options):
-    # Always document constructors.
-    if name == '__init__':
-        return False
-
-    # Don't document method aliases.  This also has the side-effect of
-    # excluding private members, which is OK.
-    if isinstance(obj, types.FunctionType) and obj.__name__ != name:
-        return True
-
-
-def on_autodoc_process_docstring(app, what, name, obj, options, lines):
-    # This is a temporary hack for a particularly nasty docstring in
-    # direct.fsm.FourState and direct.fsm.FourStateAI that was badly
-    # formatted.  It can be removed once a new version of Panda3D is
-    # released with the offending docstring fixed.
-
-    if (name == 'direct.fsm.FourState.FourState.__init__' or
-        name == 'direct.fsm.FourStateAI.FourStateAI.__init__') \
-       and 'are used:' in lines:
-        lines[lines.index('are used:')] = 'are used::'
-
-    if lines:
-        line0 = lines[0].lstrip()
-        if line0.startswith('/**') or line0.startswith('// '):
-            domain = app.env.temp_data.get('default_domain')
-            domain = domain.name if domain else 'py'
-            lines[:] = convert_doxygen_docstring(lines, name, domain)
-
-
-def on_missing_reference(app, env, node, contnode):
-    # Resolver for interrogate classes that supports either snake case or camel
-    # case naming.  Depending on the variation that is active, it will link to
-    # either the Python or C++ reference as appropriate.
-
-    target = node['reftarget']
-
-    variation = getattr(env.app.builder, 'current_variation', None)
-    if variation and variation[0] == 'cpp':
-        domain = env.domains['cpp']
-    else:
-        domain = env.domains['py']
-
-    typ = node['reftype']
-    if domain.name == 'cpp' and typ == 'meth':
-        # C++ domain doesn't have "meth", everything is "func" there.
-        typ = 'func'
-
-    # Figure out which part is the module and which part is the class.
-    prefix = ''
-    module = 'panda3d.core'
-    if target.startswith('panda3d.'):
-        parts = target.split('.', 2)
-        if len(parts) == 2:
-            # It's trying to resolve a reference to a module; we can't help
-            # with that.
-            return
-
-        module = '.'.join(parts[:2])
-        prefix = module + '.'
-        target = '.'.join(parts[2:])
-    else:
-        # Something like .core.NodePath, perhaps?
-        modpart = target.split('.', 1)[0]
-        if '.' in target and modpart in builtins_types and domain.name == 'py':
-            # It's actually the name of a built-in.
-            target = builtins_types[modpart] + '.' + target.split('.', 1)[1]
-            if target.startswith('panda3d.'):
-                parts = target.split('.', 2)
-                module = '.'.join(parts[:2])
-                prefix = module + '.'
-                target = '.'.join(parts[2:])
-            else:
-                refdoc = node.get('refdoc', env.docname)
-                return domain.resolve_xref(env, refdoc, app.builder, typ, target, node, contnode)
-        elif build_api_reference and idb.has_module('panda3d.' + modpart):
-            module = 'panda3d.' + modpart
-            prefix = modpart + '.'
-            target = target.split('.', 1)[1]
-
-    resolved = target and resolve_reference(target, module, domain=domain.name)
-
-    if resolved and (resolved[0] == typ or typ == 'obj'):
-        refdoc = node.get('refdoc', env.docname)
-
-        # Try to match the original, but with the canonical mangling
-        # (depending on Python versus C++)
-        if len(contnode.children) and not node.get('refexplicit'):
-            oldtext = contnode.children[0].astext()
-
-            text = resolved[1]
-            if domain.name == 'cpp':
-                text = '::'.join(text.split('::')[-oldtext.replace('.', '::').count('.')-1:])
-            else:
-                text = '.'.join(text.split('.')[-oldtext.count('.')-1:])
-
-            if oldtext.endswith("()"):
-                text += "()"
-
-            contnode.children[0] = nodes.Text(text)
-
-        elif domain.name == 'cpp':
-            # Work around a bug in the C++ resolver, which expects this
-            # text node to be the child of an Element.  I picked a
-            # decoration element since it happens not to translate to
-            # anything (not sure what its purpose is).
-            if isinstance(contnode, nodes.Text):
-                contnode = nodes.decoration('', contnode)
-
-        elif domain.name == 'py' and len(contnode.children) and node.get('refexplicit'):
-            # Custom text was used.  Replace snake_case with camelCase in it.
-            # This allows doing something like:
-            # :meth:`model.set_color() <.NodePath.set_color>`
-            # ..and still have it translate to the correct casing.
-            oldpart = target.rsplit('.', 1)[-1]
-            newpart = resolved[1].rsplit('.', 1)[-1]
-            if oldpart != newpart:
-                text = contnode.children[0].astext()
-                text = text.replace('::', '.')
-                text = text.replace('.' + oldpart + '(', '.' + newpart + '(')
-                if text.startswith(oldpart + '('):
-                    text = newpart + text[len(oldpart):]
-                contnode.children[0] = nodes.Text(text)
-
-        # C++ references don't have a module prefix and use :: for scoping
-        if domain.name == 'cpp':
-            target = resolved[1]
-            if typ == 'obj':
-                # Another bug workaround
-                typ = resolved[0]
-            if typ in ('enum', 'class', 'struct', 'union') and resolved[0] == 'type':
-                # Squelch warning
-                typ = resolved[0]
-        else:
-            target = resolved[1]
-
-        return domain.resolve_xref(env, refdoc, app.builder, typ, target, node, contnode)
-
-
-def on_builder_inited(app):
-    app.builder.get_relative_uri = \
-        lambda from_, to, typ=None: \
-            app.config.html_absolute_url_root + app.config.version + '/' + app.builder.get_target_uri(to, typ)
-
-
-def on_html_page_context(app, pagename, templatename, context, doctree):
-    def pathto(otheruri, resource=False, baseuri=None):
-        if resource and '://' in otheruri:
-            # allow non-local resources given by scheme
-            return otheruri
-
-        if not resource:
-            otheruri = app.builder.get_target_uri(otheruri)
-
-        if baseuri is None:
-            baseuri = app.config.html_absolute_url_root + version + '/'
-
-        if not baseuri.startswith('/'):
-            raise BaseURIError('"baseuri" must be absolute')
-
-        if not otheruri.startswith('/'):
-            otheruri = '/' + otheruri
-
-        if otheruri:
-            if baseuri.endswith('/'):
-                baseuri = baseuri[:-1]
-            otheruri = baseuri + otheruri
-
-        uri = otheruri or '#'
-        return uri
-
-    context['pathto'] = pathto
-
-
-def on_config_inited(app, config):
-    if config.html_absolute_url_root:
-        app.connect('builder-inited', on_builder_inited)
-        app.connect('html-page-context', on_html_page_context)
-
-        # This normally runs before our hook, so it still picks up the old
-        # pathto, hence we need to register it again
-        from sphinx.builders.html import setup_js_tag_helper
-        app.connect('html-page-context', setup_js_tag_helper)
-
-    # Used in searchbox.html.
-    if config.html_link_suffix is not None:
-        config.html_context['link_suffix'] = config.html_link_suffix
-    elif config.html_file_suffix is not None:
-        config.html_context['link_suffix'] = config.html_file_suffix
-    else:
-        config.html_context['link_suffix'] = '.html'
-
-
-# This is an awful hack to get the inheritance graphs to incorporate the
-# current variation into the links properly, and, at the same time, not
-# generate the arrow connections inverted. :-/
-def generate_dot(self, name, urls={}, env=None,
-                 graph_attrs={}, node_attrs={}, edge_attrs={}):
-    g_attrs = self.default_graph_attrs.copy()
-    n_attrs = self.default_node_attrs.copy()
-    e_attrs = self.default_edge_attrs.copy()
-    g_attrs.update(graph_attrs)
-    n_attrs.update(node_attrs)
-    e_attrs.update(edge_attrs)
-    if env:
-        g_attrs.update(env.config.inheritance_graph_attrs)
-        n_attrs.update(env.config.inheritance_node_attrs)
-        e_attrs.update(env.config.inheritance_edge_attrs)
-
-    res = []  # type: List[str]
-    res.append('strict digraph %s {\n' % name)
-    res.append(self._format_graph_attrs(g_attrs))
-
-    for name, fullname, bases, tooltip in sorted(self.class_info):
-        if name == 'DTOOL_SUPER_BASE':
-            continue
-
-        # Write the node
-        this_node_attrs = n_attrs.copy()
-        if fullname in urls:
-            url = urls[fullname]
-            # Fix the URL reference to contain the current variation.
-            # Also strip off the # reference at the end, since our classes
-            # are defined near the top of each file anyway.
-            if env and env.config.graphviz_output_format.lower() == 'svg' and \
-               getattr(env.app.builder, 'current_variation', None):
-                url = '../' \
-                    + env.app.builder.current_variation[0] \
-                    + '/reference/' \
-                    + os.path.basename(url).split('#', 1)[0]
-
-            this_node_attrs['URL'] = '"%s"' % url
-            this_node_attrs['target'] = '"_top"'
-        if tooltip:
-            this_node_attrs['tooltip'] = tooltip
-        res.append('  "%s" [%s];\n' %
-                   (name, self._format_node_attrs(this_node_attrs)))
-
-        # Write the edges
-        for base_name in bases:
-            if base_name == 'DTOOL_SUPER_BASE':
-                continue
-            res.append('  "%s" -> "%s" [%s];\n' %
-                       (name, base_name,
-                        self._format_node_attrs(e_attrs)))
-    res.append('}\n')
-    return ''.join(res)
-
-
-def setup(app):
-    from sphinx.ext.inheritance_diagram import InheritanceGraph
-    InheritanceGraph.generate_dot = generate_dot
-
-    app.add_config_value('html_absolute_url_root', None, 'html')
-    app.connect('config-inited', on_config_inited)
-
-    app.connect('autodoc-skip-member', on_autodoc_skip_member)
-    app.connect('autodoc-process-docstring', on_autodoc_process_docstring)
-
-    app.connect('missing-reference', on_missing_reference, priority=901)
-
-    app.add_autodocumenter(ExcludeDocumenter)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""Converts the docstrings in the interrogate databases of the installed
+Panda3D release ahead of time, and writes them to an SQLite database that the
+build looks them up in, rather than converting them again on every build:
+
+    python extract_docstrings.py docstrings.sqlite
+    make html SPHINXOPTS="-D docstring_store=docstrings.sqlite"
+
+It uses the same converter as the build, from _ext/panda3d_docs, with the
+configuration from conf.py.  Every docstring is converted as the documenters of
+sphinx_interrogatedb pass it to on_autodoc_process_docstring, by the Python and
+C++ names of the types, methods, properties and global functions.  Any that are
+missed are converted during the build, as usual.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import pkgutil
+import sqlite3
+import sys
+import time
+
+from sphinx.config import eval_config_file
+from sphinx.util.tags import Tags
+
+from panda3d.interrogatedb import *
+from sphinx_interrogatedb import idb
+
+
+def load_conf():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conf.py')
+    return eval_config_file(path, Tags())
+
+
+def load_modules(conf):
+    # The same as sphinx_interrogatedb does when the config is read.  The
+    # databases are loaded along with the modules.
+    for dir in conf.get('interrogatedb_search_path', ()):
+        interrogate_add_search_directory(dir)
+
+    import panda3d
+    for module in pkgutil.iter_modules(panda3d.__path__, 'panda3d.'):
+        if module.name.startswith('panda3d.lib'):
+            # The graphics plug-ins and the like.
+            continue
+
+        try:
+            importlib.import_module(module.name)
+        except ImportError as ex:
+            print("Skipping {0}: {1}".format(module.name, ex))
+
+
+def iter_function_docstrings(ifunc, py_name, cpp_name):
+    if py_name:
+        for i in range(interrogate_function_number_of_python_wrappers(ifunc)):
+            iwrap = interrogate_function_python_wrapper(ifunc, i)
+            if interrogate_wrapper_has_comment(iwrap):
+                yield interrogate_wrapper_comment(iwrap).splitlines(), py_name, 'py'
+
+    if cpp_name and interrogate_function_has_comment(ifunc):
+        # If it repeats itself, the documenter takes the first repetition.
+        comment = interrogate_function_comment(ifunc) + '\n\n'
+        comment = comment[:(comment + comment).find(comment, 1, -1)]
+        yield comment.strip().splitlines(), cpp_name, 'cpp'
+
+
+def iter_type_docstrings(conf, itype, name):
+    mangle_types = conf.get('autodoc_interrogatedb_mangle_type_names', False)
+    mangle_funcs = conf.get('autodoc_interrogatedb_mangle_function_names', False)
+
+    lines = interrogate_type_comment(itype).splitlines() + ['']
+    yield lines, name, 'py'
+    yield lines, name, 'cpp'
+
+    if interrogate_type_number_of_constructors(itype) > 0:
+        ifunc = interrogate_type_get_constructor(itype, 0)
+        yield from iter_function_docstrings(ifunc, name + '.__init__', name + '.__init__')
+
+    for i in range(interrogate_type_number_of_methods(itype)):
+        ifunc = interrogate_type_get_method(itype, i)
+        yield from iter_function_docstrings(
+            ifunc,
+            name + '.' + idb.get_function_name(ifunc, mangle=mangle_funcs),
+            name + '.' + idb.get_function_name(ifunc, mangle=False))
+
+    for i in range(interrogate_type_number_of_make_seqs(itype)):
+        iseq = interrogate_type_get_make_seq(itype, i)
+        yield (interrogate_make_seq_comment(iseq).splitlines() + [''],
+               name + '.' + idb.get_make_seq_name(iseq, mangle=mangle_funcs), 'py')
+
+    # The properties show the docstrings of their getters and setters.
+    for i in range(interrogate_type_number_of_elements(itype)):
+        ielem = interrogate_type_get_element(itype, i)
+        elem_name = name + '.' + idb.get_element_name(ielem)
+        if interrogate_element_has_comment(ielem):
+            yield interrogate_element_comment(ielem).splitlines(), elem_name, 'py'
+        if interrogate_element_has_getter(ielem):
+            getter = interrogate_element_getter(ielem)
+            yield interrogate_function_comment(getter).splitlines(), elem_name, 'py'
+        if interrogate_element_has_setter(ielem):
+            setter = interrogate_element_setter(ielem)
+            yield interrogate_function_comment(setter).splitlines(), elem_name, 'py'
+
+    for i in range(interrogate_type_number_of_nested_types(itype)):
+        nested = interrogate_type_get_nested_type(itype, i)
+        if interrogate_type_name(nested):
+            yield from iter_type_docstrings(
+                conf, nested, name + '.' + idb.get_type_name(nested, mangle=mangle_types))
+
+
+def iter_docstrings(conf):
+    """Yields the (lines, name, domain) of every docstring to convert."""
+
+    mangle_funcs = conf.get('autodoc_interrogatedb_mangle_function_names', False)
+
+    for i in range(interrogate_number_of_global_types()):
+        itype = interrogate_get_global_type(i)
+        if interrogate_type_outer_class(itype) or not interrogate_type_name(itype):
+            continue
+        module = interrogate_type_module_name(itype)
+        yield from iter_type_docstrings(conf, itype, module + '.' + idb.get_type_name(itype))
+
+    for i in range(interrogate_number_of_global_functions()):
+        ifunc = interrogate_get_global_function(i)
+        module = interrogate_function_module_name(ifunc)
+        py_name = idb.get_function_name(ifunc, mangle=mangle_funcs)
+        cpp_name = interrogate_function_name(ifunc)
+
+        # The C++ variation only has the ones named the same as in Python.
+        yield from iter_function_docstrings(
+            ifunc, module + '.' + py_name,
+            module + '.' + py_name if cpp_name == py_name else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('output', help='the SQLite database to write')
+    args = parser.parse_args()
+
+    conf = load_conf()
+    if not conf.get('build_api_reference'):
+        sys.exit("The Panda3D modules couldn't be imported, see above.")
+
+    load_modules(conf)
+
+    # conf.py has put the _ext directory on the path.
+    from panda3d_docs.docstrings import get_docstring_store_hash, get_docstring_store_stamp
+    from panda3d_docs.doxygen import convert_doxygen_docstring_warnings
+
+    convert = convert_doxygen_docstring_warnings
+    get_hash = get_docstring_store_hash
+    stamp = get_docstring_store_stamp(conf.get('interrogatedb_search_path'),
+                                      conf.get('autodoc_interrogatedb_mangle_type_names', False),
+                                      conf.get('autodoc_interrogatedb_mangle_function_names', False))
+
+    tmp_path = args.output + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    start = time.perf_counter()
+    count = 0
+    db = sqlite3.connect(tmp_path)
+    with db:
+        db.execute('CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)')
+        db.execute('CREATE TABLE docstrings (name TEXT, domain TEXT, hash BLOB, lines TEXT, '
+                   'warnings TEXT, PRIMARY KEY (name, domain, hash)) WITHOUT ROWID')
+        db.execute("INSERT INTO info VALUES ('stamp', ?)", (stamp, ))
+
+        for lines, name, domain in iter_docstrings(conf):
+            # Only these are converted by on_autodoc_process_docstring.
+            line0 = lines[0].lstrip() if lines else ''
+            if not line0.startswith('/**') and not line0.startswith('// '):
+                continue
+
+            newlines, warnings = convert(lines, name, domain)
+            cursor = db.execute('INSERT OR IGNORE INTO docstrings VALUES (?, ?, ?, ?, ?)',
+                                (name, domain, get_hash(lines), json.dumps(newlines), json.dumps(warnings)))
+            count += cursor.rowcount
+    db.close()
+
+    os.replace(tmp_path, args.output)
+    print("Wrote {0} docstrings to {1} in {2:.1f} s".format(count, args.output, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()